@@ -0,0 +1,50 @@
+"""
+Handshake token decryption benchmark.
+
+    python -m benchmarks.bench_auth --tokens 200
+
+Compares the legacy path (Scrypt key derivation on every token) with the
+cached AESGCM path, including a rotation case where the token was issued
+with the previous secret.
+"""
+import argparse
+import json
+import time
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from utils.auth_utils import derive_key, decrypt, decrypt_any, encrypt, get_cipher, _split_token
+
+
+def legacy_decrypt(encrypted_data: str, secret: str) -> str:
+    """The pre-cache implementation: derive the key per token"""
+    iv, ciphertext = _split_token(encrypted_data)
+    return AESGCM(derive_key(secret)).decrypt(iv, ciphertext, None).decode('utf8')
+
+
+def bench(label, fn, tokens):
+    start = time.perf_counter()
+    for token in tokens:
+        fn(token)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {len(tokens) / elapsed:>12.1f} handshakes/s   "
+          f"{elapsed / len(tokens) * 1000:>8.3f} ms/token")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=200)
+    args = parser.parse_args()
+
+    current, previous = "current-secret", "previous-secret"
+    payload = json.dumps({"fid": 1234, "token": "abc", "session_end": 0})
+    tokens = [encrypt(payload, current) for _ in range(args.tokens)]
+    old_tokens = [encrypt(payload, previous) for _ in range(args.tokens)]
+
+    get_cipher.cache_clear()
+    bench("legacy (scrypt per token)", lambda t: legacy_decrypt(t, current), tokens[:max(1, args.tokens // 10)])
+    bench("cached key", lambda t: decrypt(t, current), tokens)
+    bench("rotation, current secret", lambda t: decrypt_any(t, [current, previous]), tokens)
+    bench("rotation, previous secret", lambda t: decrypt_any(t, [current, previous]), old_tokens)
+
+
+if __name__ == '__main__':
+    main()
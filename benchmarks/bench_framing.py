@@ -0,0 +1,90 @@
+"""
+CPU and bytes of one session's frames over a full replay, per framing, on the
+per-session send path: the tick table builds each price frame, OutboundQueue
+queues it and its sender writes it to a (null) socket, plus one wallet frame
+per tick through send_json.
+
+    python -m benchmarks.bench_framing --window 60
+
+"pre-encoded" uses the tick table of the framing, as sessions do; "transcoded"
+builds the JSON frame and re-encodes it (json.loads + dumps) for comparison.
+Framings whose package (msgpack, cbor2) is not installed are skipped.
+"""
+import json
+import time
+import asyncio
+import argparse
+from benchmarks.sample_data import sample_klines
+from game.tick_table import TickTable
+from game.tick_window import TickWindow
+from game.outbound import OutboundQueue
+from game.framing import available_framings, negotiate_framing, JSON_CODEC
+
+
+class NullSocket:
+    def __init__(self):
+        self.bytes = 0
+
+    async def send_text(self, text):
+        self.bytes += len(text.encode())
+
+    async def send_bytes(self, data):
+        self.bytes += len(data)
+
+
+def wallet_state(i: int) -> dict:
+    balance = 1000.0 + i * 0.25
+    return {"balance_total": balance, "total_profit": (balance - 1000.0) / 1000.0, "balance_free": 900.0,
+            "in_position": 100.0, "long_average": 0.05123, "short_average": 0.0, "direction": "long"}
+
+
+async def replay(table: TickTable, codec, window: int, delta: bool, transcode=None):
+    """Streams a full replay through an OutboundQueue; returns (seconds, bytes sent)"""
+    socket = NullSocket()
+    outbound = OutboundQueue(socket, max_frames=1 << 20, max_bytes=1 << 40, codec=codec)
+    outbound.start()
+    ticks = TickWindow(window)
+    ticks.fill(0, window)
+
+    def wire(frame):
+        return transcode(frame) if transcode else frame
+
+    start = time.perf_counter()
+    first = table.snapshot_message(ticks.indices(window), 0) if delta else table.initial_message(ticks.indices(window))
+    await outbound.send_text(wire(first), "prices")
+    for seq, i in enumerate(range(window, len(table)), start=1):
+        ticks.push(i)
+        frame = table.delta_message(i, seq) if delta else table.prices_message(i, ticks.indices(window))
+        await outbound.send_text(wire(frame), "prices")
+        await outbound.send_json({"type": "wallet", "wallet": wallet_state(i)}, kind="wallet")
+        await asyncio.sleep(0)  # lets the sender write both frames
+    while outbound.frames:
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    outbound.stop()
+    return elapsed, socket.bytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--window", type=int, default=60)
+    args = parser.parse_args()
+
+    name, df, frame = sample_klines()
+    json_table = TickTable(frame)
+    print(f"{name}: {len(df)} rows, window {args.window}, framings {available_framings()}")
+
+    print(f"{'stream':<8}{'framing':<9}{'path':<13}{'bytes/session':>15}{'ms/session':>12}")
+    for stream, delta in (("legacy", False), ("delta", True)):
+        for framing in available_framings():
+            codec = negotiate_framing(framing)
+            runs = [("pre-encoded", TickTable(frame, codec), None)]
+            if codec is not JSON_CODEC:
+                runs.append(("transcoded", json_table, lambda text, codec=codec: codec.encode(json.loads(text))))
+            for path, table, transcode in runs:
+                elapsed, sent = asyncio.run(replay(table, codec, args.window, delta, transcode))
+                print(f"{stream:<8}{framing:<9}{path:<13}{sent:>15}{elapsed * 1000:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
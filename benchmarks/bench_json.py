@@ -0,0 +1,78 @@
+"""
+Serialization cost of our HTTP and WebSocket payloads.
+
+    python -m benchmarks.bench_json --repeat 20000
+
+fastapi:   jsonable_encoder + json.dumps (what a route returning a dict costs)
+json:      utils.json_utils with JSON_SERIALIZER=json
+orjson:    utils.json_utils with orjson (skipped when not installed)
+
+Payloads mirror the real ones: a /profile response with latest_trades carrying
+Firestore timestamps, a leaderboard, a wallet frame and a price tick frame.
+"""
+import time
+import json
+import argparse
+from datetime import datetime, timezone, timedelta
+from fastapi.encoders import jsonable_encoder
+from benchmarks.sample_data import sample_klines
+from game.tick_table import TickTable
+from utils import json_utils
+
+try:
+    from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+except ImportError:
+    DatetimeWithNanoseconds = datetime
+
+
+def payloads():
+    now = DatetimeWithNanoseconds(2025, 6, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    profile = {
+        "username": "trader", "wallet": "0x" + "ab" * 20, "total_games": 412, "last_online": now,
+        "total_profit": 1834.25, "total_PnL": 183.425, "energy": 7, "streak_days": 12,
+        "invitation_key": "K7QX2M", "invited_key": "", "is_banned": False,
+        "latest_trades": [{"final_pnl": 4.2 * i, "final_profit": 42.0 * i, "created_at": now - timedelta(minutes=i)}
+                          for i in range(4)],
+    }
+    leaderboard = {"leaderboard": [{"username": f"user{i}", "total_profit": 10000.0 / (i + 1),
+                                    "the_user": i == 3, "rank": i + 1} for i in range(10)]}
+    wallet = {"type": "wallet", "wallet": {"balance_total": 1012.5, "total_profit": 0.0125, "balance_free": 912.5,
+                                           "in_position": 100.0, "long_average": 0.051234, "short_average": 0,
+                                           "direction": "long"}}
+    _, _, frame = sample_klines()
+    tick = {"type": "prices", "count": 61, "window": json.loads(TickTable(frame).encode_window(range(60)))}
+    return {"profile": profile, "leaderboard": leaderboard, "wallet": wallet, "tick window": tick}
+
+
+def stdlib_dumps(data):
+    return json.dumps(data, default=json_utils._default, separators=(",", ":"), ensure_ascii=False)
+
+
+def timed(fn, data, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(data)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    encoders = {
+        "fastapi": lambda data: json.dumps(jsonable_encoder(data), separators=(",", ":"), ensure_ascii=False),
+        "json": stdlib_dumps,
+    }
+    if json_utils.orjson is not None:
+        encoders["orjson"] = lambda data: json_utils.orjson.dumps(
+            data, default=json_utils._default, option=json_utils.orjson.OPT_SERIALIZE_NUMPY)
+
+    print(f"{'payload':<13}" + "".join(f"{name + ' us':>12}" for name in encoders) + f"{'bytes':>8}")
+    for label, data in payloads().items():
+        times = [timed(fn, data, args.repeat) for fn in encoders.values()]
+        print(f"{label:<13}" + "".join(f"{t:>12.2f}" for t in times) + f"{len(stdlib_dumps(data)):>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Resident memory per worker: private pandas klines vs the shared segment.
+
+    python -m benchmarks.bench_kline_memory --workers 4
+
+The mapped mode converts the klines first (python -m game.kline_binary convert).
+Each mode starts N fresh processes (like the gunicorn workers), loads the
+klines the way that mode does and reports VmRSS / RssAnon / RssShmem.
+"""
+import argparse
+import multiprocessing
+from configs.config import KLINE_START_INDEX
+
+
+def _private_worker(queue):
+    import pandas as pd
+    from game.kline_store import iter_kline_files, memory_report
+
+    frames = {}
+    for token, fp in iter_kline_files():
+        df = pd.read_parquet(fp)
+        frames[token] = df.iloc[KLINE_START_INDEX:].reset_index(drop=True)
+    queue.put(("private pandas", memory_report()))
+
+
+def _shared_worker(queue):
+    from game.kline_store import SharedKlineStore, memory_report
+
+    store = SharedKlineStore()
+    # touch every page the game would read
+    total = sum(float(frame['close'].sum()) for frame in store.values())
+    queue.put(("shared segment", memory_report()))
+
+
+def _mmap_worker(queue):
+    from game.kline_binary import open_binary_klines
+    from game.kline_store import memory_report
+
+    frames = open_binary_klines()
+    total = sum(float(frame['close'].sum()) for frame in frames.values())
+    queue.put(("mapped binary", memory_report()))
+
+
+def run(target, workers):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=target, args=(queue,)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    reports = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    for label, report in reports:
+        print(f"{label:<16} {report}")
+    return reports
+
+
+def main():
+    from game.kline_store import load_kline_frames, publish_shared_klines, unlink_shared_klines
+    from game.kline_binary import convert_klines
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    print("== before: every worker loads its own pandas copy")
+    run(_private_worker, args.workers)
+
+    shm = publish_shared_klines(load_kline_frames(start_index=KLINE_START_INDEX))
+    print(f"== after: shared segment of {shm.size / 1024 / 1024:.1f} MB attached by every worker")
+    try:
+        run(_shared_worker, args.workers)
+    finally:
+        shm.close()
+        unlink_shared_klines()
+
+    print(f"== after: converted binary files mapped by every worker {convert_klines()}")
+    run(_mmap_worker, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+CPU cost of producing one price tick for 1,000 concurrent sessions.
+
+    python -m benchmarks.bench_tick_stream --sessions 1000 --ticks 30
+
+legacy: serialize_row(df.iloc[i]) + window pop/append + json.dumps per session
+tick table: TickWindow push + slice of pre-encoded rows from the shared TickTable
+"""
+import time
+import json
+import argparse
+from benchmarks.sample_data import sample_klines
+from game.tick_table import TickTable
+from game.tick_window import TickWindow
+import pandas as pd
+
+
+def serialize_row(row):
+    row_dict = row.to_dict()
+    return {k: (v.isoformat() if isinstance(v, pd.Timestamp) else v) for k, v in row_dict.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--ticks", type=int, default=30)
+    parser.add_argument("--window", type=int, default=60)
+    args = parser.parse_args()
+
+    name, df, frame = sample_klines()
+    ticks = range(args.window, min(len(df), args.window + args.ticks))
+    print(f"{name}: {len(df)} rows, {args.sessions} sessions, {len(ticks)} ticks")
+
+    windows = [[serialize_row(df.iloc[i]) for i in range(args.window)] for _ in range(args.sessions)]
+    start = time.process_time()
+    legacy_bytes = 0
+    for i in ticks:
+        for window in windows:
+            window.pop(0)
+            window.append(serialize_row(df.iloc[i]))
+            legacy_bytes += len(json.dumps({"type": "prices", "count": i + 1, "window": window},
+                                           separators=(",", ":"), ensure_ascii=False))
+    legacy = (time.process_time() - start) / len(ticks)
+
+    build_start = time.process_time()
+    table = TickTable(frame)
+    build = time.process_time() - build_start
+
+    rings = [TickWindow(args.window) for _ in range(args.sessions)]
+    for ring in rings:
+        ring.fill(0, args.window)
+    start = time.process_time()
+    table_bytes = 0
+    for i in ticks:
+        for ring in rings:
+            ring.push(i)
+            table_bytes += len(table.prices_message(i, ring.indices(args.window)))
+    fast = (time.process_time() - start) / len(ticks)
+
+    print(f"legacy      {legacy * 1000:>9.1f} ms CPU per tick for {args.sessions} sessions")
+    print(f"tick table  {fast * 1000:>9.1f} ms CPU per tick for {args.sessions} sessions "
+          f"({legacy / fast:.1f}x), one-off build {build * 1000:.1f} ms")
+    print(f"bytes per tick: legacy {legacy_bytes // len(ticks)}, tick table {table_bytes // len(ticks)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+calculate_final_balance calls per second with an open position.
+
+    python -m benchmarks.bench_wallet --passes 20
+
+pandas:  the previous price lookups (Series.iloc for close/low/high) alone
+wallet:  FuturesWallet.calculate_final_balance on the shared float arrays
+"""
+import time
+import asyncio
+import argparse
+from benchmarks.sample_data import sample_klines
+from game.wallet import FuturesWallet
+
+
+def pandas_lookups(df, passes):
+    close, low, high = df["close"], df["low"], df["high"]
+    rows = len(df)
+    start = time.perf_counter()
+    for _ in range(passes):
+        for i in range(rows):
+            float(close.iloc[i]), float(low.iloc[i]), float(high.iloc[i])
+    return passes * rows / (time.perf_counter() - start)
+
+
+async def wallet_calls(name, frame, passes, direction):
+    rows = len(frame)
+    calls = 0
+    elapsed = 0.0
+    for _ in range(passes):
+        # a tiny leverage keeps the position open for the whole replay
+        wallet = FuturesWallet(token_selection=name, leverage=1, klines=frame)
+        await (wallet.add_long(0) if direction == "long" else wallet.add_short(0))
+        start = time.perf_counter()
+        for i in range(rows):
+            await wallet.calculate_final_balance(i)
+        elapsed += time.perf_counter() - start
+        calls += rows
+    return calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--passes", type=int, default=20)
+    args = parser.parse_args()
+
+    name, df, frame = sample_klines()
+    print(f"{name}: {len(df)} rows, {args.passes} passes")
+    print(f"pandas lookups only  {pandas_lookups(df, args.passes):>12,.0f} /s")
+    for direction in ("long", "short"):
+        rate = asyncio.run(wallet_calls(name, frame, args.passes, direction))
+        print(f"wallet {direction:<5}         {rate:>12,.0f} calls/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Mark-to-market of N concurrent sessions per tick: one calculate_final_balance
+per session vs one WalletEngine pass over all of them.
+
+    python -m benchmarks.bench_wallet_engine --sessions 100 1000 10000 --ticks 50
+
+Every session holds an open long or short from a random row and advances one
+row per tick (outside the timed part: each flow advances in its own task and
+publishes its position to the engine). "engine" is the vectorized pass alone;
+"engine+dispatch" also awaits a no-op per-session callback, as the sockets
+would be notified.
+"""
+import time
+import random
+import asyncio
+import argparse
+from benchmarks.sample_data import sample_klines
+from game.wallet import FuturesWallet
+from game.wallet_engine import WalletEngine
+
+
+class SimulatedFlow:
+    """The PriceFlow position fields the wallet paths read, published to the engine like advance() does"""
+
+    def __init__(self, current_index: int):
+        self.current_index = current_index
+        self.step = 0
+        self.engine_slot = None
+
+    def advance(self, index: int):
+        self.current_index = index
+        self.step += 1
+        if self.engine_slot is not None:
+            engine, slot = self.engine_slot
+            engine.flow_index[slot] = index
+            engine.flow_step[slot] = self.step
+
+
+async def make_sessions(name, frame, count, rng):
+    rows = len(frame)
+    sessions = []
+    for _ in range(count):
+        flow = SimulatedFlow(rng.randrange(rows // 2))
+        wallet = FuturesWallet(token_selection=name, leverage=20, klines=frame)
+        await (wallet.add_long(flow.current_index) if rng.random() < 0.5 else wallet.add_short(flow.current_index))
+        wallet.schedule_liquidation([(0, flow.current_index, rows)])
+        sessions.append((wallet, flow))
+    return sessions
+
+
+def advance(sessions, rows):
+    for _, flow in sessions:
+        flow.advance((flow.current_index + 1) % rows)
+
+
+async def bench(name, frame, count, ticks):
+    rows = len(frame)
+    rng = random.Random(count)
+
+    sessions = await make_sessions(name, frame, count, rng)
+    elapsed = 0.0
+    for _ in range(ticks):
+        advance(sessions, rows)
+        start = time.perf_counter()
+        for wallet, flow in sessions:
+            await wallet.calculate_final_balance(flow.current_index, flow.step)
+        elapsed += time.perf_counter() - start
+    per_session = elapsed / ticks
+
+    async def noop(balance, liquidated):
+        pass
+
+    results = {}
+    for label, dispatch in (("engine", False), ("engine+dispatch", True)):
+        sessions = await make_sessions(name, frame, count, rng)
+        engine = WalletEngine(interval=3600)
+        for wallet, flow in sessions:
+            engine.register(wallet, flow, noop)
+        elapsed = 0.0
+        for _ in range(ticks):
+            advance(sessions, rows)
+            start = time.perf_counter()
+            if dispatch:
+                await engine.dispatch()
+            else:
+                engine.mark()
+            elapsed += time.perf_counter() - start
+        results[label] = elapsed / ticks
+        engine._task.cancel()
+
+    print(f"{count:>7} sessions  per-session {per_session * 1000:>8.2f} ms/tick  "
+          + "  ".join(f"{label} {t * 1000:>7.2f} ms/tick ({per_session / t:.1f}x)" for label, t in results.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--ticks", type=int, default=50)
+    args = parser.parse_args()
+
+    name, df, frame = sample_klines()
+    print(f"{name}: {len(df)} rows, {args.ticks} ticks")
+    for count in args.sessions:
+        asyncio.run(bench(name, frame, count, args.ticks))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Size and encode time of the snapshot window and the per-tick delta, row vs columnar.
+
+    python -m benchmarks.bench_window_encoding --window 60 --scale 8
+
+serialize_row: the legacy list of row objects, json.dumps per frame
+rows:          pre-encoded row objects from the TickTable
+columnar:      one array per column, float prices
+columnar+N:    one array per column, prices as integers (price * 10**N)
+"""
+import time
+import json
+import argparse
+from benchmarks.sample_data import sample_klines
+from game.tick_table import TickTable, ColumnarTickTable
+import pandas as pd
+
+
+def serialize_row(row):
+    row_dict = row.to_dict()
+    return {k: (v.isoformat() if isinstance(v, pd.Timestamp) else v) for k, v in row_dict.items()}
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return (time.perf_counter() - start) / repeat, len(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--window", type=int, default=60)
+    parser.add_argument("--scale", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    name, df, frame = sample_klines()
+    indices = list(range(args.window))
+    last = args.window - 1
+    print(f"{name}: {len(df)} rows, window {args.window}")
+
+    legacy_window = [serialize_row(df.iloc[i]) for i in indices]
+    encoders = {
+        "serialize_row": (
+            lambda: json.dumps({"type": "prices", "count": args.window, "window": legacy_window}),
+            lambda: json.dumps({"type": "tick", "row": serialize_row(df.iloc[last])}),
+        ),
+    }
+    for label, table in (("rows", TickTable(frame)),
+                         ("columnar", ColumnarTickTable(frame)),
+                         (f"columnar+{args.scale}", ColumnarTickTable(frame, args.scale))):
+        encoders[label] = (lambda t=table: t.snapshot_message(indices, 0),
+                           lambda t=table: t.delta_message(last, 1))
+
+    print(f"{'encoding':<14}{'snapshot B':>12}{'snapshot us':>13}{'delta B':>9}{'delta us':>10}")
+    for label, (snapshot, delta) in encoders.items():
+        snap_time, snap_bytes = timed(snapshot, args.repeat)
+        delta_time, delta_bytes = timed(delta, args.repeat)
+        print(f"{label:<14}{snap_bytes:>12}{snap_time * 1e6:>13.1f}{delta_bytes:>9}{delta_time * 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""Kline data for the benchmarks: the first real session if available, else a synthetic one."""
+import numpy as np
+import pandas as pd
+from configs.config import KLINE_START_INDEX
+from game.kline_store import KlineFrame, iter_kline_files, project_columns
+
+
+def synthetic_klines(rows: int = 1200, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 0.05 * np.exp(np.cumsum(rng.normal(0, 0.004, rows)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.002, rows)) * close
+    return pd.DataFrame({
+        "open_time": pd.date_range("2025-01-01", periods=rows, freq="1s"),
+        "open": open_,
+        "high": np.maximum(open_, close) + spread,
+        "low": np.minimum(open_, close) - spread,
+        "close": close,
+        "volume": rng.uniform(1e3, 1e5, rows),
+    })
+
+
+def sample_klines():
+    """Returns (name, DataFrame with the projected columns, KlineFrame)"""
+    for token, fp in iter_kline_files():
+        try:
+            projection = project_columns(fp)
+            df = pd.read_parquet(fp, columns=list(projection.values()))
+            df = df.iloc[KLINE_START_INDEX:].reset_index(drop=True)
+            return token, df, KlineFrame.from_dataframe(token, df, projection)
+        except Exception as e:
+            print(f"Skipping {fp}: {e}")
+
+    df = synthetic_klines()
+    schema = {"time": "open_time", "open": "open", "high": "high", "low": "low", "close": "close", "volume": "volume"}
+    return "synthetic-session-0", df, KlineFrame.from_dataframe("synthetic-session-0", df, schema)
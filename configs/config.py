@@ -20,6 +20,18 @@ load_dotenv(dotenv_path)
 # Read secret
 SECRET = os.getenv("SECRET")
 
+# Secrets being rotated out stay valid for decryption (comma separated)
+PREVIOUS_SECRETS = [s.strip() for s in os.getenv("PREVIOUS_SECRETS", "").split(",") if s.strip()]
+
+# All active secrets, current one first
+SECRETS = [s for s in [SECRET, *PREVIOUS_SECRETS] if s]
+
+# Token decryption pool (per gunicorn worker): "thread" or "process"
+AUTH_POOL_KIND = os.getenv("AUTH_POOL_KIND", "thread")
+AUTH_POOL_WORKERS = int(os.getenv("AUTH_POOL_WORKERS", "2"))
+# Handshakes allowed to queue/run at once before new ones are rejected
+AUTH_MAX_PENDING = int(os.getenv("AUTH_MAX_PENDING", "32"))
+
 
 def get_base_dir() -> str:
     """
@@ -44,6 +56,79 @@ def get_klines_dir() -> str:
     return os.path.join(get_base_dir(), "klines")
 
 
+def get_klines_bin_dir() -> str:
+    """Returns the full path to the converted (memory-mappable) klines directory."""
+    return os.path.join(get_base_dir(), "klines_bin")
+
+
+# rows cut from the start of every kline session
+KLINE_START_INDEX = 35
+
+# columns read from the kline parquet files: canonical name -> accepted parquet names
+# (the game needs close/low/high, the chart also uses time and the rest of OHLCV)
+KLINE_SCHEMA = {
+    "time": ("open_time", "timestamp", "time", "date", "datetime"),
+    "open": ("open",),
+    "high": ("high",),
+    "low": ("low",),
+    "close": ("close",),
+    "volume": ("volume",),
+}
+KLINE_REQUIRED_COLUMNS = ("close", "low", "high")
+
+# price precision policy: "float64" (exact), "float32" (half the memory) or
+# "auto" (float32 only when every price round-trips within KLINE_PRICE_RTOL)
+KLINE_PRICE_DTYPE = os.getenv("KLINE_PRICE_DTYPE", "float64")
+KLINE_PRICE_RTOL = float(os.getenv("KLINE_PRICE_RTOL", "1e-7"))
+
+# parquet files read/converted concurrently
+KLINE_LOAD_THREADS = int(os.getenv("KLINE_LOAD_THREADS", "4"))
+
+# how workers get the klines:
+# "mmap"    - converted binary files, mapped read-only (page cache shared by all workers)
+# "shm"     - one shared memory segment published by the gunicorn master
+# "parquet" - private pandas load per worker
+KLINE_BACKEND = os.getenv("KLINE_BACKEND", "mmap")
+
+# sessions are loaded on first use; least recently used ones are dropped above this budget
+# (columns plus the tick tables and other tables built from them)
+KLINE_CACHE_BUDGET_MB = float(os.getenv("KLINE_CACHE_BUDGET_MB", "512"))
+
+# cohort mode: players starting within the same slot share one price stream
+COHORT_SLOT_SECONDS = float(os.getenv("COHORT_SLOT_SECONDS", "5"))
+
+# per-socket outbound queue bounds; clients behind for longer than
+# SLOW_CLIENT_SECONDS are disconnected
+OUTBOUND_MAX_FRAMES = int(os.getenv("OUTBOUND_MAX_FRAMES", "64"))
+OUTBOUND_MAX_BYTES = int(os.getenv("OUTBOUND_MAX_BYTES", str(512 * 1024)))
+SLOW_CLIENT_SECONDS = float(os.getenv("SLOW_CLIENT_SECONDS", "10"))
+
+# shared memory segment holding the klines for all gunicorn workers
+KLINE_SHM_NAME = os.getenv("KLINE_SHM_NAME", "tradcast_klines")
+
+# wallet mark-to-market: "actor" (each session on its own ticks) or "batched"
+# (one vectorized pass over all of a worker's sessions every WALLET_ENGINE_INTERVAL)
+WALLET_ENGINE = os.getenv("WALLET_ENGINE", "actor")
+WALLET_ENGINE_INTERVAL = float(os.getenv("WALLET_ENGINE_INTERVAL", "0.1"))
+
+# write-behind journal of finished sessions (SQLite, WAL), flushed to Firestore
+# in batches; results failing JOURNAL_MAX_ATTEMPTS times are kept as "failed"
+SESSION_JOURNAL_PATH = os.getenv("SESSION_JOURNAL_PATH", "")  # default: <base dir>/session_journal.sqlite3
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "1.0"))
+JOURNAL_BATCH_SIZE = int(os.getenv("JOURNAL_BATCH_SIZE", "100"))
+JOURNAL_MAX_ATTEMPTS = int(os.getenv("JOURNAL_MAX_ATTEMPTS", "20"))
+JOURNAL_LEASE_SECONDS = float(os.getenv("JOURNAL_LEASE_SECONDS", "60"))
+
+
+def get_session_journal_path() -> str:
+    """Returns the path of the session results journal."""
+    return SESSION_JOURNAL_PATH or os.path.join(get_base_dir(), "session_journal.sqlite3")
+
+# JSON serializer for HTTP responses and WebSocket frames: "orjson" (falls back
+# to "json" when orjson is not installed) or "json"
+JSON_SERIALIZER = os.getenv("JSON_SERIALIZER", "orjson")
+
+
 WS_ALLOWED_ORIGINS = {
     "https://dev.simmerliq.com",
     "http://localhost:8000",
@@ -0,0 +1,232 @@
+"""
+Bulk backtesting with the FuturesWallet rules.
+
+Strategies are evaluated in batch: every wallet field (free balance, margin,
+summed entry prices, entry count, direction) is a numpy array with one slot
+per strategy, and each bar updates all of them at once. The rules are the
+wallet's, with the same float operations:
+- an entry adds position_size of margin at the bar's close and the entry
+  price is the average of all entries; the opposite side is rejected while a
+  position is open, and so is an entry when free balance < position_size
+- close releases margin + margin * change * leverage (negated for shorts)
+- liquidation on the bar's low (long) / high (short) at -100% / +100% of the
+  margin, checked before and after the bar's order like the session does
+
+Strategies are a momentum grid: with r = close[t] / close[t - lookback] - 1,
+go long when r > threshold, short when r < -threshold and close when
+|r| < threshold * exit_ratio; each combined with a leverage and position_size.
+
+Tokens run in parallel on a process pool; the per-strategy summary over all
+tokens is written to parquet (and per token with --details).
+
+    python -m game.backtest --leverages 5 10 20 40 --position-sizes 50 100 200 --out backtest.parquet
+"""
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+STRATEGY_FIELDS = ("lookback", "threshold", "exit_ratio", "leverage", "position_size")
+RESULT_FIELDS = ("final_balance", "trades", "liquidations", "max_drawdown")
+
+
+def strategy_grid(lookbacks, thresholds, exit_ratios, leverages, position_sizes) -> Dict[str, np.ndarray]:
+    """Cartesian product of the parameters, one array per STRATEGY_FIELDS entry"""
+    mesh = np.meshgrid(np.asarray(lookbacks, dtype=np.int64), np.asarray(thresholds, dtype=np.float64),
+                       np.asarray(exit_ratios, dtype=np.float64), np.asarray(leverages, dtype=np.float64),
+                       np.asarray(position_sizes, dtype=np.float64), indexing="ij")
+    return {name: values.ravel() for name, values in zip(STRATEGY_FIELDS, mesh)}
+
+
+def momentum_returns(close: np.ndarray, lookbacks: np.ndarray) -> np.ndarray:
+    """returns[k, t] = close[t] / close[t - lookbacks[k]] - 1 (NaN while t < lookback)"""
+    table = np.full((len(lookbacks), len(close)), np.nan)
+    for k, lookback in enumerate(lookbacks):
+        if 0 < lookback < len(close):
+            table[k, lookback:] = close[lookback:] / close[:-lookback] - 1.0
+    return table
+
+
+def run_batch(close: np.ndarray, low: np.ndarray, high: np.ndarray, strategies: Dict[str, np.ndarray],
+              start: int, stop: Optional[int] = None, capital: float = 1000.0) -> Dict[str, np.ndarray]:
+    """Runs every strategy over bars [start, stop) of one session; returns RESULT_FIELDS arrays"""
+    stop = len(close) if stop is None else min(stop, len(close))
+    leverage = strategies["leverage"]
+    position_size = strategies["position_size"]
+    threshold = strategies["threshold"]
+    exit_threshold = threshold * strategies["exit_ratio"]
+    lookbacks, lookback_row = np.unique(strategies["lookback"], return_inverse=True)
+    returns = momentum_returns(close, lookbacks)
+
+    n = len(leverage)
+    free = np.full(n, float(capital))
+    margin = np.zeros(n)
+    total_price = np.zeros(n)
+    num_pos = np.zeros(n, dtype=np.int64)
+    direction = np.zeros(n, dtype=np.int8)
+    trades = np.zeros(n, dtype=np.int64)
+    liquidations = np.zeros(n, dtype=np.int64)
+    peak = np.full(n, float(capital))
+    max_drawdown = np.zeros(n)
+    equity = free.copy()
+
+    def average():
+        return np.where(num_pos > 0, total_price / np.maximum(num_pos, 1), 1.0)
+
+    def clear(mask):
+        margin[mask] = 0.0
+        total_price[mask] = 0.0
+        num_pos[mask] = 0
+        direction[mask] = 0
+
+    def liquidate(lo, hi):
+        entry = average()
+        hit = (((direction == 1) & ((lo - entry) / entry * leverage <= -1.0))
+               | ((direction == -1) & ((hi - entry) / entry * leverage >= 1.0)))
+        if hit.any():
+            clear(hit)
+            liquidations[hit] += 1
+
+    for t in range(start, stop):
+        price, lo, hi = close[t], low[t], high[t]
+        liquidate(lo, hi)
+
+        r = returns[lookback_row, t]
+        # NaN compares False, so no orders before the lookback is filled
+        want_long = r > threshold
+        want_short = r < -threshold
+        want_close = np.abs(r) < exit_threshold
+
+        closing = want_close & (num_pos > 0)
+        if closing.any():
+            entry = average()
+            profit = margin * ((price - entry) / entry) * leverage
+            profit = np.where(direction == -1, -profit, profit)
+            free[closing] += (margin + profit)[closing]
+            clear(closing)
+            trades[closing] += 1
+
+        can_open = free >= position_size
+        opening = (want_long & (direction != -1) & can_open) | (want_short & (direction != 1) & can_open)
+        if opening.any():
+            total_price[opening] += price
+            num_pos[opening] += 1
+            direction[opening] = np.where(want_long, 1, -1)[opening]
+            margin[opening] += position_size[opening]
+            free[opening] -= position_size[opening]
+            trades[opening] += 1
+            liquidate(lo, hi)
+
+        entry = average()
+        unrealized = margin * ((price - entry) / entry * leverage) * direction
+        equity = np.where(direction != 0, free + margin + unrealized, free)
+        np.maximum(peak, equity, out=peak)
+        np.maximum(max_drawdown, (peak - equity) / peak, out=max_drawdown)
+
+    return {"final_balance": equity, "trades": trades, "liquidations": liquidations,
+            "max_drawdown": max_drawdown}
+
+
+def backtest_token(token: str, strategies: Dict[str, np.ndarray], start: int, capital: float,
+                   chunk: int) -> Dict[str, np.ndarray]:
+    """Process pool entry point: all strategies on one token-session, in chunks"""
+    from game.data_preparation import spike_df_map
+    from game.wallet import get_wallet_prices
+
+    prices = get_wallet_prices(spike_df_map[token])
+    close, low, high = (np.frombuffer(arr, dtype=np.float64) for arr in (prices.close, prices.low, prices.high))
+    n = len(strategies["leverage"])
+    results = {name: [] for name in RESULT_FIELDS}
+    for offset in range(0, n, chunk):
+        part = {name: values[offset:offset + chunk] for name, values in strategies.items()}
+        for name, values in run_batch(close, low, high, part, start, capital=capital).items():
+            results[name].append(values)
+    return {name: np.concatenate(parts) for name, parts in results.items()}
+
+
+def run_backtest(tokens: List[str], strategies: Dict[str, np.ndarray], start: int, capital: float = 1000.0,
+                 workers: int = os.cpu_count() or 1, chunk: int = 1 << 16, details: bool = False):
+    """
+    Returns (summary, per_token): summary has one row per strategy with the
+    mean/min profit, liquidation and drawdown stats over all tokens;
+    per_token is None unless details is set.
+    """
+    profits, liquidations, trades, drawdowns = [], [], [], []
+    per_token = []
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(tokens)))) as pool:
+        futures = {token: pool.submit(backtest_token, token, strategies, start, capital, chunk) for token in tokens}
+        for token, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Backtest failed for {token}: {e}")
+                continue
+            profit = result["final_balance"] - capital
+            profits.append(profit)
+            liquidations.append(result["liquidations"])
+            trades.append(result["trades"])
+            drawdowns.append(result["max_drawdown"])
+            if details:
+                frame = pd.DataFrame({**strategies, **result, "profit": profit})
+                frame.insert(0, "token", token)
+                per_token.append(frame)
+
+    if not profits:
+        raise RuntimeError("No session could be backtested")
+    profits = np.vstack(profits)
+    summary = pd.DataFrame(strategies)
+    summary["tokens"] = len(profits)
+    summary["mean_profit"] = profits.mean(axis=0)
+    summary["median_profit"] = np.median(profits, axis=0)
+    summary["min_profit"] = profits.min(axis=0)
+    summary["win_rate"] = (profits > 0).mean(axis=0)
+    summary["mean_trades"] = np.vstack(trades).mean(axis=0)
+    summary["liquidations"] = np.vstack(liquidations).sum(axis=0)
+    summary["max_drawdown"] = np.vstack(drawdowns).max(axis=0)
+    return summary, (pd.concat(per_token, ignore_index=True) if details else None)
+
+
+def main():
+    from configs.config import KLINE_START_INDEX
+    from game.data_preparation import spike_df_map
+    from game.price_flow import DEFAULT_WINDOW_SIZE
+
+    parser = argparse.ArgumentParser(description="Backtest momentum strategies with the wallet rules")
+    parser.add_argument("--lookbacks", type=int, nargs="+", default=[3, 5, 10, 20, 40])
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.001, 0.002, 0.005, 0.01, 0.02])
+    parser.add_argument("--exit-ratios", type=float, nargs="+", default=[0.0, 0.25, 0.5])
+    parser.add_argument("--leverages", type=float, nargs="+", default=[5, 10, 20, 40])
+    parser.add_argument("--position-sizes", type=float, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--capital", type=float, default=1000.0)
+    parser.add_argument("--start", type=int, default=DEFAULT_WINDOW_SIZE,
+                        help="first traded row (the game starts after the initial window)")
+    parser.add_argument("--tokens", nargs="*", default=None, help="token-sessions (default: all)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=1 << 16, help="strategies per batch")
+    parser.add_argument("--out", default="backtest_summary.parquet")
+    parser.add_argument("--details", default=None, help="also write per-token results to this parquet file")
+    args = parser.parse_args()
+
+    strategies = strategy_grid(args.lookbacks, args.thresholds, args.exit_ratios, args.leverages,
+                               args.position_sizes)
+    tokens = args.tokens or list(spike_df_map.keys())
+    print(f"{len(strategies['leverage'])} strategies x {len(tokens)} sessions "
+          f"(klines from row {KLINE_START_INDEX}, trading from row {args.start})")
+
+    started = time.perf_counter()
+    summary, per_token = run_backtest(tokens, strategies, args.start, args.capital, args.workers, args.chunk,
+                                      details=args.details is not None)
+    elapsed = time.perf_counter() - started
+
+    summary.to_parquet(args.out, index=False)
+    if per_token is not None:
+        per_token.to_parquet(args.details, index=False)
+    print(f"Done in {elapsed:.1f}s -> {args.out}")
+    print(summary.sort_values("mean_profit", ascending=False).head(10).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import time
+import random
+import asyncio
+from typing import Dict, Set, Tuple
+from game.outbound import OutboundQueue
+from configs.config import COHORT_SLOT_SECONDS
+from game.data_preparation import spike_df_map, prefetch_klines
+from game.price_flow import PriceFlow, ENCODING_ROWS
+from game.framing import FrameCodec, JSON_CODEC
+
+
+def cohort_slot(now: float = None) -> int:
+    return int((time.time() if now is None else now) // COHORT_SLOT_SECONDS)
+
+
+def cohort_token(slot: int) -> str:
+    """Token-session of a slot; seeded by the slot so every worker picks the same one"""
+    return random.Random(slot).choice(sorted(spike_df_map.keys()))
+
+
+class CohortTicker:
+    """
+    One price stream per token-session per slot per worker. Every player who
+    joins during the slot gets the same snapshot and, from the slot boundary on,
+    the same frames: each frame is encoded once and fanned out to all sockets.
+    """
+
+    def __init__(self, slot: int, window_size: int, protocol: int, speed: float = 1.0,
+                 encoding: str = ENCODING_ROWS, price_scale=None, codec: FrameCodec = JSON_CODEC,
+                 on_finished=None, klines=None):
+        self.slot = slot
+        self.on_finished = on_finished
+        self.token = cohort_token(slot)
+        self.price_flow = PriceFlow(window_size=window_size, token_selection=self.token, protocol=protocol,
+                                    session_label=f"cohort-{self.token}-{slot}-{speed:g}x", speed=speed,
+                                    encoding=encoding, price_scale=price_scale, codec=codec, klines=klines)
+        self.subscribers: Set[OutboundQueue] = set()
+        self.initial = None
+        self.started = False
+        self.finished = asyncio.Event()
+        self.task = None
+
+    @property
+    def start_time(self) -> float:
+        """Ticks start at the end of the join slot"""
+        return (self.slot + 1) * COHORT_SLOT_SECONDS
+
+    async def subscribe(self, outbound: OutboundQueue):
+        if self.initial is None:
+            await self.price_flow.initialize_dict()
+            self.initial = self.price_flow.initial_message()
+        self.subscribers.add(outbound)
+        await outbound.send_text(self.initial, "prices", self.price_flow.resync_message)
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def unsubscribe(self, outbound: OutboundQueue):
+        self.subscribers.discard(outbound)
+        if self.started and not self.subscribers and self.task:
+            self.task.cancel()
+
+    async def broadcast(self, text):
+        # encoded once; each subscriber's queue coalesces it if that client lags
+        resync = self.price_flow.resync_message
+        for outbound in list(self.subscribers):
+            try:
+                await outbound.send_text(text, "prices", resync)
+            except Exception:
+                self.subscribers.discard(outbound)
+
+    async def run(self):
+        try:
+            delay = max(0.0, self.start_time - time.time())
+            self.started = True
+            await self.price_flow.run(self.broadcast, start_delay=delay)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Error in cohort ticker {self.token} slot {self.slot}: {e}")
+        finally:
+            self.finished.set()
+            if self.on_finished:
+                self.on_finished(self)
+
+
+class CohortHub:
+    """Per-worker registry of the running cohort tickers"""
+
+    def __init__(self):
+        self.tickers: Dict[Tuple, CohortTicker] = {}
+
+    async def join(self, outbound: OutboundQueue, window_size: int, protocol: int,
+                   speed: float = 1.0, encoding: str = ENCODING_ROWS, price_scale=None,
+                   codec: FrameCodec = JSON_CODEC) -> CohortTicker:
+        slot = cohort_slot()
+        # frames are pre-encoded per framing, so each framing has its own ticker
+        key = (slot, window_size, protocol, speed, encoding, price_scale, codec.name)
+        ticker = self.tickers.get(key)
+        if ticker is None:
+            klines = await prefetch_klines(cohort_token(slot), codec, encoding, price_scale)
+            # another player may have created it while the klines loaded
+            ticker = self.tickers.get(key)
+            if ticker is None:
+                ticker = CohortTicker(slot, window_size, protocol, speed, encoding, price_scale, codec,
+                                      on_finished=lambda t, key=key: self._forget(key, t), klines=klines)
+                self.tickers[key] = ticker
+        await ticker.subscribe(outbound)
+        return ticker
+
+    def _forget(self, key, ticker: CohortTicker):
+        if self.tickers.get(key) is ticker:
+            del self.tickers[key]
+
+    def metrics(self) -> dict:
+        return {
+            "tickers": len(self.tickers),
+            "subscribers": sum(len(t.subscribers) for t in self.tickers.values()),
+        }
+
+
+cohort_hub = CohortHub()
@@ -1,54 +1,105 @@
-import os
-import glob
+import time
 import random
-import pandas as pd
-from configs.config import get_klines_dir
-
-
-def load_parquet_klines(start_index: int = 0, debug: bool = False):
+import asyncio
+from typing import Optional
+from configs.config import get_klines_dir, KLINE_START_INDEX, KLINE_BACKEND, KLINE_CACHE_BUDGET_MB
+from game.kline_store import (KlineFrame, iter_kline_files, load_parquet_frame, SharedKlineStore,
+                              LazyKlineCatalog, memory_report)
+from game.kline_binary import binary_session_loaders
+from game.tick_table import get_stream_table, cached_stream_table, ENCODING_ROWS
+from game.liquidation import get_liquidation_index
+from game.framing import FrameCodec, JSON_CODEC
+
+
+def load_spike_df_map(backend: str = KLINE_BACKEND, debug: bool = False):
     """
-    Dynamically loads all .parquet files in the klines directory.
-    Returns a dict: { token_symbol: dataframe }
+    Opens the klines with the configured backend (see KLINE_BACKEND):
+    the shared segment published by the gunicorn master, or a lazy catalog
+    of the converted binary files. Falls back to a lazy catalog of the parquet
+    files when neither exists (e.g. plain uvicorn without conversion).
+    Returns a mapping: { token_symbol: KlineFrame }
     """
-    klines_dir = get_klines_dir()
-    pattern = os.path.join(klines_dir, "*.parquet")
-    files = glob.glob(pattern)
-
-    if debug:
-        print("Using klines directory:", klines_dir)
-        print("Found parquet files:", files)
-
-    spike_df_map = {}
-
-    for fp in files:
-        filename = os.path.basename(fp)
-
-        # Extract token name (before first "_")
-        token = filename.split("_")[0].lower()
-        token += '-session-' + filename.split("_")[2].lower()
+    budget_bytes = int(KLINE_CACHE_BUDGET_MB * 1024 * 1024)
 
+    if backend == "shm":
         try:
-            df = pd.read_parquet(fp)
-
-            # Optional cut start index
-            if start_index > 0:
-                df = df.iloc[start_index:].reset_index(drop=True)
-
-            spike_df_map[token] = df
+            store = SharedKlineStore()
+            print(f"Attached shared klines: {len(store)} sessions")
+            return store
+        except FileNotFoundError:
+            print("No shared klines segment")
 
-            if debug:
-                print(f"Loaded {token}: shape={df.shape}")
-
-        except Exception as e:
-            print(f"Error loading {fp}: {e}")
-
-    return spike_df_map
+    if backend in ("shm", "mmap"):
+        try:
+            loaders, sizes = binary_session_loaders()
+            catalog = LazyKlineCatalog(loaders, budget_bytes, sizes)
+            print(f"Binary kline catalog: {len(catalog)} sessions")
+            return catalog
+        except FileNotFoundError:
+            print("No converted klines (run: python -m game.kline_binary convert)")
+
+    loaders = {token: (lambda token=token, fp=fp: load_parquet_frame(token, fp, KLINE_START_INDEX))
+               for token, fp in iter_kline_files()}
+    if debug:
+        print("Found parquet sessions:", list(loaders))
+    return LazyKlineCatalog(loaders, budget_bytes)
+
+
+def kline_boot_report(klines, elapsed: float):
+    """Boot time and per-session memory (known sizes only for lazy parquet sessions)"""
+    if isinstance(klines, LazyKlineCatalog):
+        sizes = {token: klines.sizes.get(token) for token in klines}
+    else:
+        sizes = {token: frame.nbytes for token, frame in klines.items()}
+
+    known = [size for size in sizes.values() if size]
+    print(f"Klines ready in {elapsed * 1000:.1f} ms: {len(sizes)} sessions ({type(klines).__name__})")
+    for token, size in sizes.items():
+        print(f"   - {token}: {size / 1024:.1f} KB" if size else f"   - {token}: loaded on first use")
+    if known:
+        print(f"   total {sum(known) / 1024 / 1024:.2f} MB, "
+              f"avg {sum(known) / len(known) / 1024:.1f} KB per session")
+    print("Worker memory (MB):", memory_report())
+
+
+def session_tables_ready(frame: KlineFrame, codec: FrameCodec = JSON_CODEC, encoding: str = ENCODING_ROWS,
+                         price_scale: Optional[int] = None) -> bool:
+    """Whether build_session_tables has nothing left to build"""
+    return (cached_stream_table(frame, codec, encoding, price_scale) is not None
+            and frame.cached_derived("wallet_prices") is not None
+            and frame.cached_derived("liquidation_index") is not None)
+
+
+def build_session_tables(frame: KlineFrame, codec: FrameCodec = JSON_CODEC, encoding: str = ENCODING_ROWS,
+                         price_scale: Optional[int] = None):
+    """Everything a game on the session uses: its stream table, wallet prices and liquidation index"""
+    from game.wallet import get_wallet_prices  # game.wallet imports this module
+    get_stream_table(frame, codec, encoding, price_scale)
+    get_wallet_prices(frame)
+    get_liquidation_index(frame)
+
+
+async def prefetch_klines(token: str, codec: FrameCodec = JSON_CODEC, encoding: str = ENCODING_ROWS,
+                         price_scale: Optional[int] = None) -> KlineFrame:
+    """
+    Makes sure the session and every table a game on it uses (see
+    build_session_tables) are ready without blocking the event loop; returns
+    the session's KlineFrame, to be passed on to PriceFlow and FuturesWallet
+    """
+    if isinstance(spike_df_map, LazyKlineCatalog):
+        frame = await spike_df_map.prefetch(token)
+    else:
+        frame = spike_df_map[token]
+    if not session_tables_ready(frame, codec, encoding, price_scale):
+        await asyncio.to_thread(build_session_tables, frame, codec, encoding, price_scale)
+    return frame
 
 
 print(get_klines_dir())
-spike_df_map = load_parquet_klines(start_index=35, debug=True)
+_boot_start = time.perf_counter()
+spike_df_map = load_spike_df_map(debug=True)
 random_token = random.choice(list(spike_df_map.keys()))
-print(spike_df_map)
+kline_boot_report(spike_df_map, time.perf_counter() - _boot_start)
 
 if __name__ == '__main__':
     print(random_token, spike_df_map)
@@ -56,5 +107,3 @@ if __name__ == '__main__':
 
 # Example usage:
 # price_flow = PriceFlow(token_selection=random_token)
-
-
@@ -0,0 +1,148 @@
+"""
+Wire framing of the game WebSocket, negotiated with "framing" in the auth message.
+
+json (default): text frames, as before
+msgpack / cbor: every frame after the auth reply is a binary frame holding the
+same message; plain status strings ("Streaming started.") become
+{"type": "status", "message": ...}. Client messages stay text.
+
+Price frames are never transcoded: the tick tables are built per framing, and
+arrays and maps of pre-encoded values are concatenated in the wire format
+itself (JSON text, msgpack or CBOR bytes), so a tick costs a slice and a join
+whatever the framing.
+
+msgpack and cbor2 are optional; a framing whose package is missing falls back to json.
+"""
+import struct
+from typing import List, Optional, Tuple, Union
+from utils.json_utils import dumps, _default
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+FRAMING_JSON = "json"
+FRAMING_MSGPACK = "msgpack"
+FRAMING_CBOR = "cbor"
+
+Encoded = Union[str, bytes]
+
+
+class FrameCodec:
+    """
+    Encodes outgoing messages for one framing (JSON text here). array() and
+    message() assemble containers from values already encoded with encode().
+    """
+
+    binary = False
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def encode(self, data) -> Encoded:
+        return dumps(data)
+
+    def array(self, items: List[Encoded]) -> Encoded:
+        return "[" + ",".join(items) + "]"
+
+    def message(self, fields: List[Tuple[str, Encoded]]) -> Encoded:
+        """Map with the given keys and encoded values, in order"""
+        return "{" + ",".join([f'"{key}":{value}' for key, value in fields]) + "}"
+
+    def with_field(self, message: Encoded, key: str, value: Encoded) -> Encoded:
+        """Appends an encoded field to an encoded message"""
+        return f'{message[:-1]},"{key}":{value}}}'
+
+    def status(self, text: str) -> Encoded:
+        """Plain status strings stay text frames"""
+        return text
+
+
+class BinaryFrameCodec(FrameCodec):
+    """
+    msgpack/CBOR: a container is a header carrying the item count followed by
+    the items, so pre-encoded values concatenate like JSON fragments.
+    Messages are small maps whose count fits in the header's first byte
+    (below small_map), which is what with_field bumps.
+    """
+
+    binary = True
+
+    def __init__(self, name: str, dumps, array_header, map_base: int, small_map: int):
+        super().__init__(name)
+        self.dumps = dumps
+        self.array_header = array_header
+        self.map_base = map_base
+        self.small_map = small_map
+        self._keys = {}
+
+    def encode(self, data) -> bytes:
+        return self.dumps(data)
+
+    def _key(self, key: str) -> bytes:
+        encoded = self._keys.get(key)
+        if encoded is None:
+            encoded = self._keys[key] = self.dumps(key)
+        return encoded
+
+    def array(self, items: List[bytes]) -> bytes:
+        return self.array_header(len(items)) + b"".join(items)
+
+    def message(self, fields: List[Tuple[str, bytes]]) -> bytes:
+        if len(fields) >= self.small_map:
+            raise ValueError(f"{self.name} messages are limited to {self.small_map - 1} fields")
+        return bytes((self.map_base | len(fields),)) + b"".join([self._key(k) + v for k, v in fields])
+
+    def with_field(self, message: bytes, key: str, value: bytes) -> bytes:
+        count = message[0] - self.map_base
+        if not 0 <= count < self.small_map - 1:
+            raise ValueError(f"not a small {self.name} map")
+        return bytes((self.map_base | (count + 1),)) + message[1:] + self._key(key) + value
+
+    def status(self, text: str) -> bytes:
+        return self.dumps({"type": "status", "message": text})
+
+
+def _msgpack_array_header(n: int) -> bytes:
+    if n < 16:
+        return bytes((0x90 | n,))
+    if n < 1 << 16:
+        return b"\xdc" + struct.pack(">H", n)
+    return b"\xdd" + struct.pack(">I", n)
+
+
+def _cbor_array_header(n: int) -> bytes:
+    if n < 24:
+        return bytes((0x80 | n,))
+    if n < 1 << 8:
+        return b"\x98" + bytes((n,))
+    if n < 1 << 16:
+        return b"\x99" + struct.pack(">H", n)
+    return b"\x9a" + struct.pack(">I", n)
+
+
+JSON_CODEC = FrameCodec(FRAMING_JSON)
+_codecs = {FRAMING_JSON: JSON_CODEC}
+if msgpack is not None:
+    _codecs[FRAMING_MSGPACK] = BinaryFrameCodec(
+        FRAMING_MSGPACK, lambda data: msgpack.packb(data, use_bin_type=True, default=_default),
+        _msgpack_array_header, map_base=0x80, small_map=16)
+if cbor2 is not None:
+    _codecs[FRAMING_CBOR] = BinaryFrameCodec(
+        FRAMING_CBOR, lambda data: cbor2.dumps(data, default=lambda encoder, obj: encoder.encode(_default(obj))),
+        _cbor_array_header, map_base=0xa0, small_map=24)
+
+
+def available_framings():
+    return list(_codecs)
+
+
+def negotiate_framing(requested: Optional[str]) -> FrameCodec:
+    """Codec for the client's request; unknown or unavailable framings fall back to json"""
+    return _codecs.get(str(requested).lower() if requested else FRAMING_JSON, JSON_CODEC)
@@ -0,0 +1,226 @@
+"""
+Precompiled kline format.
+
+Every parquet session is converted once into a flat binary file holding its
+fixed-dtype column arrays at aligned offsets, plus a manifest.json keyed by
+the token-session-N names:
+
+    {
+        "version": 1,
+        "sessions": {
+            "somi-session-3": {
+                "source": "SOMI_1m_3_xxx.parquet",
+                "sha256": "...",
+                "start_index": 35,
+                "file": "somi-session-3.klines",
+                "schema_key": "...",
+                "rows": 1200,
+                "nbytes": 57600,
+                "timezones": {},
+                "schema": {"time": "open_time", "close": "close", ...},
+                "columns": [["open_time", "<M8[ns]", 0], ...]
+            }
+        }
+    }
+
+Opening is a np.memmap per session, so workers share the page cache and
+nothing is parsed or copied at boot.
+
+    python -m game.kline_binary convert [--force]
+    python -m game.kline_binary info
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+import numpy as np
+from configs.config import (get_klines_dir, get_klines_bin_dir, KLINE_START_INDEX, KLINE_SCHEMA,
+                            KLINE_PRICE_DTYPE, KLINE_PRICE_RTOL, KLINE_LOAD_THREADS)
+from game.kline_store import KlineFrame, iter_kline_files, layout_columns, load_parquet_frame
+
+BINARY_FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def schema_key() -> str:
+    """Fingerprint of the declared schema and price policy (dtype and "auto" tolerance); changing any reconverts"""
+    spec = json.dumps({"schema": KLINE_SCHEMA, "price_dtype": KLINE_PRICE_DTYPE, "price_rtol": KLINE_PRICE_RTOL},
+                      sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+
+def read_manifest(out_dir: Optional[str] = None) -> dict:
+    path = os.path.join(out_dir or get_klines_bin_dir(), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"version": BINARY_FORMAT_VERSION, "sessions": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(out_dir: str, manifest: dict):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def write_session(out_dir: str, frame: KlineFrame) -> dict:
+    """Writes one session file and returns its manifest entry (without source/hash)"""
+    columns, size = layout_columns(frame)
+    filename = f"{frame.name}.klines"
+    path = os.path.join(out_dir, filename)
+    tmp = path + ".tmp"
+
+    with open(tmp, "wb") as f:
+        f.truncate(max(1, size))
+    mm = np.memmap(tmp, dtype=np.uint8, mode="r+")
+    for col, dtype, offset in columns:
+        src = frame[col]
+        mm[offset:offset + src.nbytes] = np.ascontiguousarray(src).view(np.uint8)
+    mm.flush()
+    del mm
+    os.replace(tmp, path)
+
+    return {
+        "rows": len(frame),
+        "nbytes": frame.nbytes,
+        "file": filename,
+        "timezones": frame.timezones,
+        "schema": frame.schema,
+        "columns": columns,
+    }
+
+
+def convert_klines(klines_dir: Optional[str] = None, out_dir: Optional[str] = None,
+                   start_index: int = KLINE_START_INDEX, force: bool = False,
+                   threads: int = KLINE_LOAD_THREADS) -> Dict[str, int]:
+    """
+    Converts the parquet klines into the binary format, several files at once.
+    Sessions whose source hash, start_index, schema and format version are
+    unchanged are skipped; sessions whose parquet file disappeared are removed.
+    """
+    klines_dir = klines_dir or get_klines_dir()
+    out_dir = out_dir or get_klines_bin_dir()
+    os.makedirs(out_dir, exist_ok=True)
+
+    manifest = read_manifest(out_dir)
+    if manifest.get("version") != BINARY_FORMAT_VERSION:
+        manifest = {"version": BINARY_FORMAT_VERSION, "sessions": {}}
+    old_sessions = manifest["sessions"]
+    key = schema_key()
+    sessions = {}
+    stats = {"converted": 0, "unchanged": 0, "removed": 0, "failed": 0}
+
+    def convert(item):
+        token, fp = item
+        sha = file_sha256(fp)
+        entry = old_sessions.get(token)
+        if (not force and entry and entry["sha256"] == sha and entry["start_index"] == start_index
+                and entry.get("schema_key") == key
+                and os.path.exists(os.path.join(out_dir, entry["file"]))):
+            return token, entry, "unchanged"
+        try:
+            entry = write_session(out_dir, load_parquet_frame(token, fp, start_index))
+            entry.update({"source": os.path.basename(fp), "sha256": sha, "start_index": start_index,
+                          "schema_key": key})
+            return token, entry, "converted"
+        except Exception as e:
+            print(f"Error converting {fp}: {e}")
+            return token, None, "failed"
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        for token, entry, outcome in pool.map(convert, list(iter_kline_files(klines_dir))):
+            stats[outcome] += 1
+            if entry is not None:
+                sessions[token] = entry
+
+    for token, entry in old_sessions.items():
+        if token not in sessions:
+            try:
+                os.remove(os.path.join(out_dir, entry["file"]))
+            except OSError:
+                pass
+            stats["removed"] += 1
+
+    manifest["sessions"] = sessions
+    _write_manifest(out_dir, manifest)
+    return stats
+
+
+def open_session(out_dir: str, token: str, entry: dict) -> KlineFrame:
+    """Maps one session file read-only; column arrays are views, not copies"""
+    mm = np.memmap(os.path.join(out_dir, entry["file"]), dtype=np.uint8, mode="r")
+    rows = entry["rows"]
+    columns = {}
+    for col, dtype, offset in entry["columns"]:
+        dtype = np.dtype(dtype)
+        columns[col] = np.frombuffer(mm, dtype=dtype, count=rows, offset=offset)
+    return KlineFrame(token, columns, entry["timezones"], entry.get("schema"))
+
+
+def open_binary_klines(out_dir: Optional[str] = None) -> Dict[str, KlineFrame]:
+    """
+    Opens every converted session. Raises FileNotFoundError when the klines
+    were never converted.
+    """
+    out_dir = out_dir or get_klines_bin_dir()
+    if not os.path.exists(os.path.join(out_dir, MANIFEST_NAME)):
+        raise FileNotFoundError(f"No kline manifest in {out_dir}")
+    manifest = read_manifest(out_dir)
+    return {token: open_session(out_dir, token, entry) for token, entry in manifest["sessions"].items()}
+
+
+def binary_session_loaders(out_dir: Optional[str] = None):
+    """
+    Loaders and expected sizes for LazyKlineCatalog (sessions are mapped on first use).
+    Returns ({token: loader}, {token: nbytes})
+    """
+    out_dir = out_dir or get_klines_bin_dir()
+    if not os.path.exists(os.path.join(out_dir, MANIFEST_NAME)):
+        raise FileNotFoundError(f"No kline manifest in {out_dir}")
+    manifest = read_manifest(out_dir)
+    loaders = {token: (lambda token=token, entry=entry: open_session(out_dir, token, entry))
+               for token, entry in manifest["sessions"].items()}
+    sizes = {token: entry.get("nbytes", 0) for token, entry in manifest["sessions"].items()}
+    return loaders, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert parquet klines to the mmap format")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert")
+    convert.add_argument("--klines-dir", default=None)
+    convert.add_argument("--out-dir", default=None)
+    convert.add_argument("--start-index", type=int, default=KLINE_START_INDEX)
+    convert.add_argument("--force", action="store_true", help="reconvert unchanged sessions too")
+    info = sub.add_parser("info")
+    info.add_argument("--out-dir", default=None)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        start = time.perf_counter()
+        stats = convert_klines(args.klines_dir, args.out_dir, args.start_index, args.force)
+        print(f"{stats} in {time.perf_counter() - start:.2f}s")
+    else:
+        start = time.perf_counter()
+        frames = open_binary_klines(args.out_dir)
+        elapsed = time.perf_counter() - start
+        for token, frame in frames.items():
+            print(f"{token}: rows={len(frame)} bytes={frame.nbytes} columns={frame.columns}")
+        print(f"Opened {len(frames)} sessions in {elapsed * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
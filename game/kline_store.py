@@ -0,0 +1,436 @@
+import os
+import glob
+import json
+import asyncio
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from configs.config import (get_klines_dir, KLINE_SHM_NAME, KLINE_SCHEMA, KLINE_REQUIRED_COLUMNS,
+                            KLINE_PRICE_DTYPE, KLINE_PRICE_RTOL, KLINE_LOAD_THREADS)
+
+
+# offsets of every column inside a shared segment are aligned to this
+ALIGNMENT = 64
+
+# canonical schema columns stored with the price dtype policy
+PRICE_COLUMNS = ("open", "high", "low", "close")
+
+# tables derived from a session are built one at a time per worker
+_derived_lock = threading.Lock()
+
+
+def session_name(filename: str) -> str:
+    """
+    Session key for a kline file, e.g. SOMI_1m_3_xxx.parquet -> somi-session-3
+    (token before the first "_", session number after the second)
+    """
+    parts = filename.split("_")
+    return parts[0].lower() + '-session-' + parts[2].lower()
+
+
+def iter_kline_files(klines_dir: Optional[str] = None):
+    """Yields (session_name, path) for every .parquet file in the klines directory"""
+    klines_dir = klines_dir or get_klines_dir()
+    for fp in sorted(glob.glob(os.path.join(klines_dir, "*.parquet"))):
+        yield session_name(os.path.basename(fp)), fp
+
+
+class KlineFrame:
+    """
+    Read-only columnar kline session: one numpy array per column.
+    Supports the lookups the game uses on spike_df_map values:
+    frame['close'][i], len(frame) and frame.row(i).
+    Columns keep their parquet names (so rows sent to clients keep their keys);
+    `schema` maps canonical names (time, open, ..., volume) to them, so
+    frame['time'] also works.
+    Datetime columns are stored as naive UTC datetime64[ns]; their original
+    timezone (if any) is kept in `timezones` and restored by row().
+    Tables built from the session (tick tables, wallet prices, ...) are cached
+    on it through derived(), so they go away with the frame.
+    """
+
+    def __init__(self, name: str, columns: Dict[str, np.ndarray], timezones: Optional[Dict[str, str]] = None,
+                 schema: Optional[Dict[str, str]] = None):
+        self.name = name
+        self._columns = dict(columns)
+        self.columns = list(self._columns)
+        self.timezones = dict(timezones or {})
+        self.schema = dict(schema or {})
+        self._rows = len(next(iter(self._columns.values()))) if self._columns else 0
+        self._derived = {}
+        self.derived_nbytes = 0
+        # called with (frame, nbytes) for every table derived later, see charge_to()
+        self._on_derived = None
+
+    @classmethod
+    def from_dataframe(cls, name: str, df: pd.DataFrame, schema: Optional[Dict[str, str]] = None,
+                       price_policy: str = "float64", price_rtol: float = KLINE_PRICE_RTOL) -> "KlineFrame":
+        """
+        schema: canonical -> parquet column; only these columns are kept when given.
+        price_policy: dtype for the price columns ("float64", "float32" or "auto").
+        """
+        price_sources = {schema[c] for c in PRICE_COLUMNS if c in schema} if schema else set()
+        wanted = list(schema.values()) if schema else list(df.columns)
+        columns = {}
+        timezones = {}
+        for col in wanted:
+            series = df[col]
+            if isinstance(series.dtype, pd.DatetimeTZDtype):
+                timezones[str(col)] = str(series.dt.tz)
+                series = series.dt.tz_convert("UTC").dt.tz_localize(None)
+            values = series.to_numpy()
+            if values.dtype == object:
+                # non-numeric columns are not used by the game
+                continue
+            if col in price_sources:
+                values = values.astype(price_dtype(values, price_policy, price_rtol), copy=False)
+            columns[str(col)] = np.ascontiguousarray(values)
+        return cls(name, columns, timezones, schema)
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        if column in self._columns:
+            return self._columns[column]
+        return self._columns[self.schema[column]]
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._columns or self.schema.get(column) in self._columns
+
+    @property
+    def nbytes(self) -> int:
+        return sum(arr.nbytes for arr in self._columns.values())
+
+    def derived(self, key, build: Callable[["KlineFrame"], object]):
+        """
+        Table built from the session by build(frame) on first use and cached
+        under `key`. Its nbytes is added to derived_nbytes and reported to the
+        cache holding the frame, so it counts against that cache's budget.
+        """
+        table = self._derived.get(key)
+        if table is not None:
+            return table
+        with _derived_lock:
+            table = self._derived.get(key)
+            if table is not None:
+                return table
+            table = build(self)
+            self._derived[key] = table
+            self.derived_nbytes += table.nbytes
+            on_derived = self._on_derived
+        if on_derived is not None:
+            on_derived(self, table.nbytes)
+        return table
+
+    def cached_derived(self, key):
+        """The table cached under `key` if it is built already"""
+        return self._derived.get(key)
+
+    def charge_to(self, on_derived: Callable[["KlineFrame", int], None]) -> int:
+        """Reports tables derived from now on to on_derived; returns the bytes held so far"""
+        with _derived_lock:
+            self._on_derived = on_derived
+            return self.nbytes + self.derived_nbytes
+
+    def row(self, index: int) -> dict:
+        """Row as a JSON-serializable dict (timestamps in isoformat)"""
+        out = {}
+        for col, arr in self._columns.items():
+            value = arr[index]
+            if arr.dtype.kind == "M":
+                ts = pd.Timestamp(value)
+                if col in self.timezones:
+                    ts = ts.tz_localize("UTC").tz_convert(self.timezones[col])
+                out[col] = ts.isoformat()
+            elif arr.dtype == np.float32:
+                # shortest repr of the stored value, not its float64 expansion
+                out[col] = float(str(value))
+            else:
+                out[col] = value.item()
+        return out
+
+    def __repr__(self):
+        return f"KlineFrame({self.name!r}, rows={self._rows}, columns={self.columns})"
+
+
+def price_dtype(values: np.ndarray, policy: str, rtol: float = KLINE_PRICE_RTOL) -> np.dtype:
+    """
+    Precision policy for price columns:
+    "float64" keeps full precision, "float32" always halves the size,
+    "auto" uses float32 only if no value moves by more than rtol (relative).
+    """
+    if policy == "float64" or values.dtype.kind != "f":
+        return values.dtype
+    if policy == "float32":
+        return np.dtype(np.float32)
+    if policy == "auto":
+        compact = values.astype(np.float32).astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            error = np.abs(compact - values) / np.abs(values)
+        if np.nanmax(error, initial=0.0) <= rtol:
+            return np.dtype(np.float32)
+        return values.dtype
+    raise ValueError(f"Unknown price dtype policy: {policy}")
+
+
+def project_columns(fp: str, schema: Dict[str, tuple] = KLINE_SCHEMA) -> Dict[str, str]:
+    """
+    Resolves the declared schema against a parquet file's columns (metadata only).
+    Returns canonical -> parquet column for the columns present.
+    """
+    names = pq.read_schema(fp).names
+    lowered = {name.lower(): name for name in names}
+    projection = {}
+    for canonical, candidates in schema.items():
+        for candidate in candidates:
+            if candidate.lower() in lowered:
+                projection[canonical] = lowered[candidate.lower()]
+                break
+    missing = [c for c in KLINE_REQUIRED_COLUMNS if c not in projection]
+    if missing:
+        raise ValueError(f"{os.path.basename(fp)} is missing required columns {missing}")
+    return projection
+
+
+def load_parquet_frame(token: str, fp: str, start_index: int = 0,
+                       price_policy: str = KLINE_PRICE_DTYPE) -> KlineFrame:
+    """Reads the projected columns of one parquet session into a KlineFrame"""
+    projection = project_columns(fp)
+    df = pd.read_parquet(fp, columns=list(projection.values()))
+    if start_index > 0:
+        df = df.iloc[start_index:].reset_index(drop=True)
+    return KlineFrame.from_dataframe(token, df, projection, price_policy)
+
+
+def load_kline_frames(start_index: int = 0, debug: bool = False,
+                      threads: int = KLINE_LOAD_THREADS) -> Dict[str, KlineFrame]:
+    """Reads every parquet file into a KlineFrame, in parallel on a thread pool"""
+    files = list(iter_kline_files())
+
+    def load(item):
+        token, fp = item
+        try:
+            return token, load_parquet_frame(token, fp, start_index)
+        except Exception as e:
+            print(f"Error loading {fp}: {e}")
+            return token, None
+
+    frames = {}
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        for token, frame in pool.map(load, files):
+            if frame is None:
+                continue
+            frames[token] = frame
+            if debug:
+                print(f"Loaded {token}: rows={len(frame)} bytes={frame.nbytes}")
+    return frames
+
+
+class LazyKlineCatalog(Mapping):
+    """
+    token -> KlineFrame mapping that only knows the available sessions up front.
+    A session is loaded on first lookup and kept in an LRU cache; the least
+    recently used sessions are dropped once the cached bytes exceed the budget.
+    Cached bytes cover the columns and every table derived from a cached
+    session (KlineFrame.derived), charged when the table is built.
+    Sessions still referenced by a running PriceFlow/FuturesWallet stay alive
+    until that game ends, eviction only drops the cache entry.
+    """
+
+    def __init__(self, loaders: Dict[str, Callable[[], KlineFrame]], budget_bytes: int,
+                 sizes: Optional[Dict[str, int]] = None):
+        self.loaders = dict(loaders)
+        self.budget_bytes = budget_bytes
+        # expected bytes per session when known up front (binary manifest)
+        self.sizes = dict(sizes or {})
+        self.cached_bytes = 0
+        # bytes charged per cached session
+        self._charged: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.loaders)
+
+    def __iter__(self):
+        return iter(self.loaders)
+
+    def __contains__(self, token):
+        return token in self.loaders
+
+    def __getitem__(self, token: str) -> KlineFrame:
+        with self._lock:
+            frame = self._cache.get(token)
+            if frame is not None:
+                self._cache.move_to_end(token)
+                self.hits += 1
+                return frame
+
+        loader = self.loaders[token]
+        frame = loader()
+        nbytes = frame.charge_to(self._charge)
+
+        with self._lock:
+            cached = self._cache.get(token)
+            if cached is not None:
+                # loaded concurrently by another thread, keep the first one
+                self._cache.move_to_end(token)
+                return cached
+            self.misses += 1
+            self._cache[token] = frame
+            self._charged[token] = nbytes
+            self.cached_bytes += nbytes
+            self._evict()
+        return frame
+
+    def _charge(self, frame: KlineFrame, nbytes: int):
+        """A table was derived from `frame`; only counted while the frame is the cached one"""
+        with self._lock:
+            if self._cache.get(frame.name) is not frame:
+                return
+            self._charged[frame.name] += nbytes
+            self.cached_bytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        while self.cached_bytes > self.budget_bytes and len(self._cache) > 1:
+            token, _ = self._cache.popitem(last=False)
+            self.cached_bytes -= self._charged.pop(token)
+            self.evictions += 1
+
+    def is_cached(self, token: str) -> bool:
+        return token in self._cache
+
+    async def prefetch(self, token: str) -> KlineFrame:
+        """Loads the session on a worker thread so a miss never blocks the event loop"""
+        if token in self._cache:
+            return self[token]
+        return await asyncio.to_thread(self.__getitem__, token)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.loaders),
+            "cached": len(self._cache),
+            "cached_mb": round(self.cached_bytes / 1024 / 1024, 1),
+            "budget_mb": round(self.budget_bytes / 1024 / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __repr__(self):
+        return f"LazyKlineCatalog({self.stats()})"
+
+
+def align_offset(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def layout_columns(frame: KlineFrame, offset: int = 0):
+    """Assigns aligned offsets to the frame columns: ([[col, dtype, offset], ...], end_offset)"""
+    columns = []
+    for col in frame.columns:
+        arr = frame[col]
+        columns.append([col, arr.dtype.str, offset])
+        offset = align_offset(offset + arr.nbytes)
+    return columns, offset
+
+
+def publish_shared_klines(frames: Dict[str, KlineFrame], name: str = KLINE_SHM_NAME) -> shared_memory.SharedMemory:
+    """
+    Copies all sessions into one shared memory segment.
+    Layout: 8 byte header length, JSON header, then every column array at an
+    aligned offset. Called once (gunicorn master) before the workers fork.
+    """
+    sessions = {}
+    offset = 0
+    for token, frame in frames.items():
+        columns, offset = layout_columns(frame, offset)
+        sessions[token] = {"rows": len(frame), "timezones": frame.timezones, "schema": frame.schema,
+                           "columns": columns}
+
+    header = json.dumps({"sessions": sessions}).encode()
+    data_start = align_offset(8 + len(header))
+
+    unlink_shared_klines(name)
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(1, data_start + offset))
+    # the segment must outlive this process's handle: unlink_shared_klines (gunicorn
+    # on_exit) owns its lifetime, so the resource tracker must not unlink it or warn
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    shm.buf[:8] = len(header).to_bytes(8, "little")
+    shm.buf[8:8 + len(header)] = header
+
+    for token, frame in frames.items():
+        for col, dtype, col_offset in sessions[token]["columns"]:
+            src = frame[col]
+            dst = np.ndarray(src.shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=data_start + col_offset)
+            dst[:] = src
+
+    return shm
+
+
+class SharedKlineStore(dict):
+    """
+    token -> KlineFrame mapping whose arrays are read-only views into the
+    shared segment published by the master process.
+    """
+
+    def __init__(self, name: str = KLINE_SHM_NAME):
+        super().__init__()
+        self.shm = shared_memory.SharedMemory(name=name)
+        # attaching must not make this worker unlink the segment on exit
+        # (the resource tracker would otherwise treat it as ours)
+        try:
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        except Exception:
+            pass
+
+        buf = self.shm.buf
+        header_len = int.from_bytes(bytes(buf[:8]), "little")
+        header = json.loads(bytes(buf[8:8 + header_len]))
+        data_start = align_offset(8 + header_len)
+
+        for token, meta in header["sessions"].items():
+            columns = {}
+            for col, dtype, col_offset in meta["columns"]:
+                arr = np.ndarray((meta["rows"],), dtype=np.dtype(dtype), buffer=buf, offset=data_start + col_offset)
+                arr.flags.writeable = False
+                columns[col] = arr
+            self[token] = KlineFrame(token, columns, meta["timezones"], meta.get("schema"))
+
+
+def unlink_shared_klines(name: str = KLINE_SHM_NAME):
+    """Removes the shared segment (master shutdown or stale segment from a crash)"""
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def memory_report() -> Dict[str, float]:
+    """Resident memory of this process in MB (Linux /proc), split by kind"""
+    report = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile", "RssShmem"):
+                    report[key] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return report
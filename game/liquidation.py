@@ -0,0 +1,97 @@
+"""
+Liquidation lookahead over a session's intrabar lows/highs.
+
+A sparse table per column answers "first row in [start, stop) whose low is
+<= v" (or high >= v) in O(log n), so a wallet can compute the exact row where
+its open position gets liquidated once per order instead of re-checking the
+current bar on every poll.
+"""
+from array import array
+from typing import Optional
+import numpy as np
+
+# search thresholds are loosened by this much and candidates re-checked with
+# the wallet's own predicate, so float rounding never changes the outcome
+_THRESHOLD_SLACK = 1e-9
+
+
+class SparseExtremaTable:
+    """levels[k][i] = min (or max) of values[i:i + 2**k]"""
+
+    def __init__(self, values: np.ndarray, use_max: bool):
+        self.use_max = use_max
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        reduce = np.maximum if use_max else np.minimum
+        levels = [values]
+        width = 1
+        while width * 2 <= len(values):
+            prev = levels[-1]
+            levels.append(reduce(prev[:-width], prev[width:]))
+            width *= 2
+        self.levels = [array("d", level.tobytes()) for level in levels]
+        self.size = len(values)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(level) * level.itemsize for level in self.levels)
+
+    def first_crossing(self, value: float, start: int, stop: Optional[int] = None) -> Optional[int]:
+        """First i in [start, stop) with values[i] >= value (max table) or <= value (min table)"""
+        stop = self.size if stop is None else min(stop, self.size)
+        pos = max(start, 0)
+        if pos >= stop:
+            return None
+        use_max = self.use_max
+        # skip the largest blocks without a crossing, from 2**k down to 1
+        for k in range(len(self.levels) - 1, -1, -1):
+            width = 1 << k
+            if pos + width > stop:
+                continue
+            extreme = self.levels[k][pos]
+            if (extreme < value) if use_max else (extreme > value):
+                pos += width
+        if pos >= stop:
+            return None
+        hit = self.levels[0][pos]
+        return pos if ((hit >= value) if use_max else (hit <= value)) else None
+
+
+class LiquidationIndex:
+    """Range-min over low and range-max over high of one session"""
+
+    def __init__(self, low: np.ndarray, high: np.ndarray):
+        self.low = SparseExtremaTable(low, use_max=False)
+        self.high = SparseExtremaTable(high, use_max=True)
+
+    @property
+    def nbytes(self) -> int:
+        return self.low.nbytes + self.high.nbytes
+
+    def find(self, entry: float, direction: str, leverage: float,
+             start: int, stop: Optional[int] = None) -> Optional[int]:
+        """
+        First row in [start, stop) where a position opened at `entry` is
+        liquidated, using the same test as FuturesWallet.calculate_final_balance:
+        long when (low - entry) / entry * leverage <= -1, short when
+        (high - entry) / entry * leverage >= 1. None when it survives the range.
+        """
+        if leverage <= 0:
+            return None
+        if direction == "long":
+            table, value = self.low, entry * (1.0 - 1.0 / leverage) * (1.0 + _THRESHOLD_SLACK)
+            exact = lambda price: (price - entry) / entry * leverage <= -1.0
+        elif direction == "short":
+            table, value = self.high, entry * (1.0 + 1.0 / leverage) * (1.0 - _THRESHOLD_SLACK)
+            exact = lambda price: (price - entry) / entry * leverage >= 1.0
+        else:
+            return None
+
+        row = table.first_crossing(value, start, stop)
+        while row is not None and not exact(table.levels[0][row]):
+            row = table.first_crossing(value, row + 1, stop)
+        return row
+
+
+def get_liquidation_index(frame) -> LiquidationIndex:
+    """Shared LiquidationIndex of a session, cached on the KlineFrame like the tick table"""
+    return frame.derived("liquidation_index", lambda frame: LiquidationIndex(frame["low"], frame["high"]))
@@ -0,0 +1,190 @@
+import time
+import asyncio
+from collections import deque
+from typing import Callable, Optional
+from fastapi import WebSocket
+from configs.config import OUTBOUND_MAX_FRAMES, OUTBOUND_MAX_BYTES, SLOW_CLIENT_SECONDS
+from game.framing import FrameCodec, JSON_CODEC, Encoded
+
+# frame kinds where only the latest state matters; a newer one replaces the pending one
+COALESCE_KINDS = ("prices", "wallet")
+
+# close code for clients that stay behind for longer than SLOW_CLIENT_SECONDS
+SLOW_CLIENT_CLOSE_CODE = 4008
+
+# close code for clients whose queue overflows with frames that cannot be dropped
+OVERFLOW_CLOSE_CODE = 4009
+
+# per-worker totals over all sessions
+outbound_totals = {"sent": 0, "coalesced": 0, "dropped": 0, "resyncs": 0, "slow_disconnects": 0,
+                   "overflow_disconnects": 0}
+
+
+class OutboundClosed(Exception):
+    """Raised when sending on a queue whose socket was closed"""
+
+
+class _Frame:
+    __slots__ = ("kind", "payload", "queued_at", "nbytes")
+
+    def __init__(self, kind, payload, queued_at):
+        self.kind = kind
+        self.payload = payload
+        self.queued_at = queued_at
+        self.nbytes = len(payload)
+
+
+class OutboundQueue:
+    """
+    Per-session outbound frames with a single sender task, so a slow client
+    only ever buffers a bounded amount on the worker.
+    - price/wallet frames are coalesced: a pending one is replaced by the newer
+      state (delta price streams are replaced by a resync snapshot instead)
+    - past max_frames/max_bytes, new coalescible frames are dropped; when the
+      dropped frame had a resync, the next accepted frame of its kind is
+      replaced by a resync snapshot so delta streams never keep a gap
+    - other frames (acks, status) cannot be dropped: past the bounds the client
+      is disconnected
+    - a client whose oldest pending frame is older than slow_after seconds is
+      disconnected
+    send_text/send_json are drop-in replacements for the websocket methods.
+    send_text takes frames pre-encoded in the session's framing (the tick
+    tables are built per framing); with a binary codec, a plain str is a
+    status message. send_json encodes through the codec.
+    """
+
+    def __init__(self, websocket: WebSocket, max_frames: int = OUTBOUND_MAX_FRAMES,
+                 max_bytes: int = OUTBOUND_MAX_BYTES, slow_after: float = SLOW_CLIENT_SECONDS,
+                 codec: FrameCodec = JSON_CODEC):
+        self.websocket = websocket
+        self.codec = codec
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.slow_after = slow_after
+        self.frames = deque()
+        self.pending = {}  # kind -> queued _Frame for coalescible kinds
+        self.nbytes = 0
+        self.closed = False
+        self.resync_owed = set()  # kinds whose next accepted frame must be a resync snapshot
+        self.counters = {"sent": 0, "coalesced": 0, "dropped": 0, "resyncs": 0}
+        self._ready = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def _count(self, key: str):
+        self.counters[key] += 1
+        outbound_totals[key] += 1
+
+    def _over_bounds(self, nbytes: int) -> bool:
+        return len(self.frames) >= self.max_frames or self.nbytes + nbytes > self.max_bytes
+
+    def put(self, payload: Encoded, kind: Optional[str] = None, resync: Optional[Callable[[], Encoded]] = None) -> bool:
+        """Queues a frame; returns False when it was dropped"""
+        if self.closed:
+            raise OutboundClosed("outbound queue closed")
+        now = time.monotonic()
+
+        if self.frames and now - self.frames[0].queued_at > self.slow_after:
+            self._disconnect(SLOW_CLIENT_CLOSE_CODE, "Client too slow", "slow_disconnects")
+            raise OutboundClosed("client too slow")
+
+        if kind in COALESCE_KINDS:
+            queued = self.pending.get(kind)
+            if queued is not None:
+                # keep the slot (and its age), swap in the latest state
+                replacement = resync() if resync is not None else payload
+                self.nbytes += len(replacement) - queued.nbytes
+                queued.payload = replacement
+                queued.nbytes = len(replacement)
+                self.resync_owed.discard(kind)
+                self._count("coalesced")
+                return True
+            if self._over_bounds(len(payload)):
+                if resync is not None:
+                    self.resync_owed.add(kind)
+                self._count("dropped")
+                return False
+            if kind in self.resync_owed:
+                self.resync_owed.discard(kind)
+                payload = resync() if resync is not None else payload
+                self._count("resyncs")
+        elif self._over_bounds(len(payload)):
+            self._disconnect(OVERFLOW_CLOSE_CODE, "Outbound queue overflow", "overflow_disconnects")
+            raise OutboundClosed("outbound queue overflow")
+
+        frame = _Frame(kind, payload, now)
+        self.frames.append(frame)
+        self.nbytes += frame.nbytes
+        if kind in COALESCE_KINDS:
+            self.pending[kind] = frame
+        self._ready.set()
+        return True
+
+    async def send_text(self, text: Encoded, kind: Optional[str] = None,
+                        resync: Optional[Callable[[], Encoded]] = None):
+        if self.codec.binary and isinstance(text, str):
+            text = self.codec.status(text)
+        return self.put(text, kind, resync)
+
+    async def send_json(self, data, kind: Optional[str] = None):
+        return self.put(self.codec.encode(data), kind)
+
+    async def _run(self):
+        try:
+            while True:
+                if not self.frames:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                frame = self.frames.popleft()
+                self.nbytes -= frame.nbytes
+                if self.pending.get(frame.kind) is frame:
+                    del self.pending[frame.kind]
+                if isinstance(frame.payload, bytes):
+                    await self.websocket.send_bytes(frame.payload)
+                else:
+                    await self.websocket.send_text(frame.payload)
+                self._count("sent")
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Outbound sender stopped: {e}")
+            self.closed = True
+
+    def _disconnect(self, code: int, reason: str, counter: str):
+        print(f"🐢 Disconnecting client: {reason} ({len(self.frames)} frames, {self.nbytes} bytes pending)")
+        outbound_totals[counter] += 1
+        self.closed = True
+        self.frames.clear()
+        self.pending.clear()
+        self.nbytes = 0
+        if self._task:
+            self._task.cancel()
+        asyncio.ensure_future(self._close_socket(code, reason))
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def close(self, code: int = 1000, reason: str = "", flush_timeout: float = 1.0):
+        """Flushes what is queued (bounded by flush_timeout), then closes the socket"""
+        deadline = time.monotonic() + flush_timeout
+        while self.frames and not self.closed and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        self.closed = True
+        if self._task:
+            self._task.cancel()
+        await self._close_socket(code, reason)
+
+    def stop(self):
+        self.closed = True
+        if self._task:
+            self._task.cancel()
+
+    def metrics(self) -> dict:
+        return {**self.counters, "queued": len(self.frames), "queued_bytes": self.nbytes}
@@ -1,57 +1,228 @@
-from game.data_preparation import spike_df_map, random_token, pd
-from fastapi import WebSocket
+from game.data_preparation import spike_df_map, random_token
+from game.tick_table import get_stream_table, ENCODING_ROWS, ENCODING_COLUMNAR
+from game.framing import FrameCodec, JSON_CODEC, Encoded
+from game.tick_window import TickWindow
+from game.tick_scheduler import TickScheduler
 import asyncio
+import pandas as pd
+
+
+# price stream protocols, negotiated with "protocol" in the auth message
+PROTOCOL_LEGACY = 1  # full window every tick
+PROTOCOL_DELTA = 2  # snapshot once, then one row per tick with a sequence number
+PROTOCOL_COMBINED = 3  # delta frames that also carry the post-tick wallet, orders acked at once
+SUPPORTED_PROTOCOLS = (PROTOCOL_LEGACY, PROTOCOL_DELTA, PROTOCOL_COMBINED)
+DELTA_PROTOCOLS = (PROTOCOL_DELTA, PROTOCOL_COMBINED)
+
+# window encodings (ENCODING_ROWS, ENCODING_COLUMNAR) are defined in game.tick_table;
+# fixed-point columnar prices accept this many decimals at most
+MAX_PRICE_SCALE = 12
+
+# the session rows are replayed this many times back to back
+REPLAY_PASSES = 2
+
+# seconds between price ticks at 1x
+TICK_INTERVAL = 1.0
+
+# replay speeds ("speed" in the auth message); pacing, wallet refresh and the
+# session timeout all scale by the factor. "turbo" is the tournament mode.
+REPLAY_SPEEDS = {"1x": 1.0, "2x": 2.0, "5x": 5.0, "turbo": 10.0}
+
+# largest window a client may ask for ("window_size" in the auth message)
+DEFAULT_WINDOW_SIZE = 60
+MAX_WINDOW_SIZE = 240
+
+
+def negotiate_window_size(requested) -> int:
+    """Client-requested window size clamped to [1, MAX_WINDOW_SIZE]"""
+    try:
+        requested = int(requested)
+    except (TypeError, ValueError):
+        return DEFAULT_WINDOW_SIZE
+    return max(1, min(requested, MAX_WINDOW_SIZE))
+
+
+def negotiate_speed(requested) -> float:
+    """Replay speed factor for "1x"/"2x"/"5x"/"turbo" (or 1/2/5); unknown values play at 1x"""
+    if isinstance(requested, (int, float)) and not isinstance(requested, bool):
+        requested = f"{requested:g}x"
+    return REPLAY_SPEEDS.get(str(requested).lower(), 1.0)
+
+
+def negotiate_encoding(requested, price_scale=None):
+    """(encoding, price_scale) for the client's request; price_scale is None or 0..MAX_PRICE_SCALE"""
+    if requested != ENCODING_COLUMNAR:
+        return ENCODING_ROWS, None
+    try:
+        price_scale = None if price_scale is None else max(0, min(int(price_scale), MAX_PRICE_SCALE))
+    except (TypeError, ValueError):
+        price_scale = None
+    return ENCODING_COLUMNAR, price_scale
+
+
+def negotiate_protocol(requested) -> int:
+    """Protocol to use for the client's request; unknown values fall back to legacy"""
+    try:
+        requested = int(requested)
+    except (TypeError, ValueError):
+        return PROTOCOL_LEGACY
+    return requested if requested in SUPPORTED_PROTOCOLS else PROTOCOL_LEGACY
+
+
+def timeline_ranges(step: int, current_index: int, window_size: int, total_rows: int):
+    """
+    Rows of the replay timeline from tick `step` on, that tick included, as
+    [(step, start, stop)]: rows start..stop-1 are shown at ticks step, step+1, ...
+    Before the first tick (step -1) only `current_index` is evaluated, then
+    every pass follows.
+    """
+    span = total_rows - window_size
+    if span <= 0:
+        return []
+    if step < 0:
+        ranges = [(-1, current_index, current_index + 1)]
+        first_pass = 0
+    else:
+        ranges = [(step, window_size + step % span, total_rows)]
+        first_pass = step // span + 1
+    for p in range(first_pass, REPLAY_PASSES):
+        ranges.append((p * span, window_size, total_rows))
+    return ranges
 
 
 class PriceFlow:
-    def __init__(self, window_size=60, token_selection='somi'):
-        self.window_size = window_size
+    def __init__(self, window_size=DEFAULT_WINDOW_SIZE, token_selection='somi', protocol=PROTOCOL_LEGACY,
+                 session_label='', speed=1.0, encoding=ENCODING_ROWS, price_scale=None,
+                 codec: FrameCodec = JSON_CODEC, klines=None):
         self.token_selection = token_selection
-        self.total_rows = len(spike_df_map[self.token_selection])
-        self.window = []
+        # the frame prefetch_klines returned; looking the token up again could reload it on the loop
+        self.klines = klines if klines is not None else spike_df_map[self.token_selection]
+        self.total_rows = len(self.klines)
+        self.window_size = min(window_size, self.total_rows - 1)
+        self.protocol = protocol
+        self.seq = 0
+        # frames are pre-encoded in the session's framing
+        self.codec = codec
+        if encoding != ENCODING_COLUMNAR or protocol not in DELTA_PROTOCOLS:
+            encoding, price_scale = ENCODING_ROWS, None
+        self.encoding = encoding
+        # built off the event loop by prefetch_klines, so this is a cache lookup
+        self.ticks = get_stream_table(self.klines, codec, encoding, price_scale)
+        # row indices of the visible window, sized for the largest client window
+        self.tick_window = TickWindow(max(self.window_size, MAX_WINDOW_SIZE))
         self.current_index = 0
+        self.step = -1  # position of the current tick in timeline(), -1 before the first one
+        # events set whenever the tick index moves (wallet tasks wait on them)
+        self.tick_listeners = set()
+        # (WalletEngine, slot) receiving the position on every advance, see WalletEngine.attach_flow
+        self.engine_slot = None
+        self.speed = speed
+        self.tick_interval = TICK_INTERVAL / speed
+        self.scheduler = TickScheduler(self.tick_interval, label=session_label or token_selection)
 
     @staticmethod
     def serialize_row(row):
-        """Convert a DataFrame row to a JSON-serializable dict"""
-        row_dict = row.to_dict()
+        """Convert a DataFrame row (or KlineFrame.row dict) to a JSON-serializable dict"""
+        row_dict = row if isinstance(row, dict) else row.to_dict()
         return {k: (v.isoformat() if isinstance(v, pd.Timestamp) else v)
                 for k, v in row_dict.items()}
 
+    @property
+    def window(self):
+        """Current window as row dicts (built on demand, not kept per tick)"""
+        return [self.klines.row(i) for i in self.window_indices()]
+
+    def window_indices(self, n=None):
+        """Row indices of the last n ticks (default: the session window size)"""
+        return self.tick_window.indices(self.window_size if n is None else n)
+
+    def window_column(self, name, n=None):
+        """Last n values of a kline column, a view of the shared array when possible"""
+        return self.tick_window.column(self.klines, name, self.window_size if n is None else n)
+
     async def initialize_dict(self):
         # restart window
-        self.window = []
-        for i in range(self.window_size):
-            self.window.append(self.serialize_row(spike_df_map[self.token_selection].iloc[i]))
-
+        self.tick_window.fill(0, self.window_size)
+        self.step = -1
+        self._publish_position()
         return self.window
 
-    async def handle_websocket_flow(self, websocket: WebSocket):  # , futures_wallet: FuturesWallet):
-        # Start sliding
-        for i in range(self.window_size, self.total_rows):
-            self.current_index = i
-            self.window.pop(0)
-            self.window.append(self.serialize_row(spike_df_map[self.token_selection].iloc[i]))
-            await websocket.send_json({
-                "type": "prices",
-                "count": i + 1,
-                "window": self.window,
-                # "wallet": await futures_wallet.get_wallet_state()
-            })
-            await asyncio.sleep(1)
-
-        for i in range(self.window_size, self.total_rows):
-            self.current_index = i
-            self.window.pop(0)
-            self.window.append(self.serialize_row(spike_df_map[self.token_selection].iloc[i]))
-            await websocket.send_json({
-                "type": "prices",
-                "count": i + 1,
-                "window": self.window,
-                # "wallet": await futures_wallet.get_wallet_state()
-            })
-
-            await asyncio.sleep(1)
+    def initial_message(self) -> Encoded:
+        """Initial window snapshot, pre-encoded"""
+        if self.protocol in DELTA_PROTOCOLS:
+            self.seq = 0
+            return self.ticks.snapshot_message(self.window_indices(), self.seq, self.protocol)
+        return self.ticks.initial_message(self.window_indices())
+
+    def advance(self, index: int):
+        """Moves the window to tick `index`"""
+        self.current_index = index
+        self.step += 1
+        self.tick_window.push(index)
+        self._publish_position()
+        for event in self.tick_listeners:
+            event.set()
+
+    def _publish_position(self):
+        if self.engine_slot is not None:
+            engine, slot = self.engine_slot
+            engine.flow_index[slot] = self.current_index
+            engine.flow_step[slot] = self.step
+
+    def add_tick_listener(self, event: asyncio.Event):
+        self.tick_listeners.add(event)
+
+    def remove_tick_listener(self, event: asyncio.Event):
+        self.tick_listeners.discard(event)
+
+    def tick_message(self, indices) -> Encoded:
+        """Frame for the rows that became visible this tick (several when coalesced)"""
+        if self.protocol in DELTA_PROTOCOLS:
+            self.seq += 1
+            if len(indices) == 1:
+                return self.ticks.delta_message(indices[0], self.seq)
+            return self.ticks.coalesced_delta_message(indices, self.seq)
+        return self.ticks.prices_message(indices[-1], self.window_indices())
+
+    def resync_message(self) -> Encoded:
+        """
+        Replaces stale pending price frames of a lagging client: a snapshot of
+        the current window for delta clients, the current window otherwise
+        """
+        if self.protocol in DELTA_PROTOCOLS:
+            return self.ticks.snapshot_message(self.window_indices(), self.seq, self.protocol)
+        return self.ticks.prices_message(self.current_index, self.window_indices())
+
+    def timeline(self):
+        """Row index shown at every tick: the session is replayed REPLAY_PASSES times"""
+        return list(range(self.window_size, self.total_rows)) * REPLAY_PASSES
+
+    def upcoming_ranges(self, step=None):
+        """Rows still to be evaluated from tick `step` (default: the current one), see timeline_ranges"""
+        return timeline_ranges(self.step if step is None else step, self.current_index,
+                               self.window_size, self.total_rows)
+
+    async def run(self, send, start_delay: float = 0.0):
+        """
+        Streams the session through `send(text)`; ticks follow absolute deadlines
+        and late ones are coalesced. Rows are pre-encoded in the shared tick table.
+        """
+        timeline = self.timeline()
+        position = 0
+        self.scheduler.start(start_delay)
+        while position < len(timeline):
+            due = await self.scheduler.wait()
+            batch = timeline[position:position + due]
+            position += len(batch)
+            for i in batch:
+                self.advance(i)
+            await send(self.tick_message(batch))
+
+    async def stream_to(self, outbound, start_delay: float = 0.0):
+        """Streams into an OutboundQueue; a pending price frame is coalesced with newer ones"""
+        async def send(text):
+            await outbound.send_text(text, "prices", self.resync_message)
+        await self.run(send, start_delay)
 
 
 if __name__ == '__main__':
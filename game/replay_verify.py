@@ -0,0 +1,139 @@
+"""
+Offline replay of stored game sessions.
+
+Loads trade_decisions documents, replays each session's actions through
+FuturesWallet on the session's klines and compares the recomputed
+final_profit with the stored one. Sessions are grouped by token-session and
+verified on a process pool, so every worker opens a kline file once.
+
+Only documents saved with a "session" field (token-session, window size,
+wallet parameters, final tick) can be replayed; older ones are reported as
+skipped.
+
+    python -m game.replay_verify --date 2026-10-16 [--workers 8] [--tolerance 1e-6]
+"""
+import os
+import asyncio
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+
+def final_profit_of(balance_total: float, capital: float) -> float:
+    """Same rule as the websocket endpoint uses when saving"""
+    return balance_total - capital if balance_total != 0.0 else balance_total
+
+
+async def replay_session(doc: Dict[str, Any], frame) -> Dict[str, Any]:
+    """Replays one trade_decisions document on its KlineFrame"""
+    from game.wallet import FuturesWallet
+    from game.price_flow import timeline_ranges
+
+    session = doc["session"]
+    window_size = session["window_size"]
+    total_rows = session.get("total_rows", len(frame))
+    wallet = FuturesWallet(token_selection=session["token"], leverage=session["leverage"],
+                           capital=session["capital"], klines=frame)
+    wallet.position_size = session["position_size"]
+
+    for action in doc.get("actions", [])[session.get("first_action", 0):]:
+        index, step = action["index"], action.get("step")
+        ranges = lambda from_step, index=index: timeline_ranges(from_step, index, window_size, total_rows)
+        await wallet.push_order(action["action"], index, step)
+        await wallet.consume_queue(ranges)
+        # the session's wallet pass right after the order
+        await wallet.calculate_final_balance(index, step)
+
+    await wallet.calculate_final_balance(session["final_index"], session["final_step"])
+    return {
+        "trade_env_id": doc.get("trade_env_id"),
+        "fid": doc.get("fid"),
+        "token": session["token"],
+        "stored": doc.get("final_profit"),
+        "replayed": final_profit_of(wallet.balance_total, wallet.capital),
+    }
+
+
+def verify_token_batch(token: str, docs: List[Dict[str, Any]], tolerance: float) -> List[Dict[str, Any]]:
+    """Process pool entry point: all sessions of one token-session"""
+    from game.data_preparation import spike_df_map
+
+    try:
+        frame = spike_df_map[token]
+    except Exception as e:
+        return [{"trade_env_id": d.get("trade_env_id"), "fid": d.get("fid"), "token": token,
+                 "status": "error", "error": f"klines unavailable: {e}"} for d in docs]
+
+    async def run():
+        results = []
+        for doc in docs:
+            try:
+                result = await replay_session(doc, frame)
+                stored, replayed = result["stored"], result["replayed"]
+                ok = stored is not None and abs(stored - replayed) <= tolerance * max(1.0, abs(stored))
+                result["status"] = "ok" if ok else "mismatch"
+            except Exception as e:
+                result = {"trade_env_id": doc.get("trade_env_id"), "fid": doc.get("fid"), "token": token,
+                          "status": "error", "error": str(e)}
+            results.append(result)
+        return results
+
+    return asyncio.run(run())
+
+
+def verify_documents(docs: List[Dict[str, Any]], workers: int = os.cpu_count() or 1,
+                     tolerance: float = 1e-6) -> Dict[str, Any]:
+    """Verifies the documents; returns counts plus every mismatch, error and skip"""
+    by_token = defaultdict(list)
+    skipped = []
+    for doc in docs:
+        session = doc.get("session")
+        if not session or "token" not in session:
+            skipped.append({"trade_env_id": doc.get("trade_env_id"), "fid": doc.get("fid"), "status": "skipped"})
+        else:
+            by_token[session["token"]].append(doc)
+
+    results = []
+    if by_token:
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(by_token)))) as pool:
+            futures = [pool.submit(verify_token_batch, token, batch, tolerance) for token, batch in by_token.items()]
+            for future in futures:
+                results.extend(future.result())
+
+    counts = defaultdict(int)
+    for result in results + skipped:
+        counts[result["status"]] += 1
+    return {
+        "counts": dict(counts),
+        "flagged": [r for r in results if r["status"] != "ok"],
+        "skipped": skipped,
+    }
+
+
+async def load_day(day: datetime) -> List[Dict[str, Any]]:
+    from storage.firestore_client import FirestoreManager
+    start = day.replace(tzinfo=timezone.utc)
+    return await FirestoreManager().get_trade_decisions_between(start, start + timedelta(days=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay stored sessions and verify their final_profit")
+    parser.add_argument("--date", required=True, help="UTC day to verify, YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="relative tolerance on final_profit")
+    args = parser.parse_args()
+
+    docs = asyncio.run(load_day(datetime.strptime(args.date, "%Y-%m-%d")))
+    start = datetime.now()
+    report = verify_documents(docs, args.workers, args.tolerance)
+    elapsed = (datetime.now() - start).total_seconds()
+
+    for result in report["flagged"]:
+        print(f"❌ {result['status']}: {result}")
+    print(f"{len(docs)} sessions in {elapsed:.2f}s: {report['counts']}")
+
+
+if __name__ == '__main__':
+    main()
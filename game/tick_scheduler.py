@@ -0,0 +1,60 @@
+import time
+import asyncio
+import weakref
+from utils.metrics import LatencyRecorder
+
+# every session's tick lag, aggregated per worker
+worker_tick_lag = LatencyRecorder(max_samples=8192)
+_active_schedulers = weakref.WeakSet()
+
+
+class TickScheduler:
+    """
+    Paces ticks on absolute monotonic deadlines (start + n * interval), so send
+    and encode time never accumulate as drift. When a session falls behind by
+    one or more intervals, wait() reports how many ticks are due at once and the
+    caller coalesces them into one frame instead of replaying them late.
+    """
+
+    def __init__(self, interval: float = 1.0, label: str = ""):
+        self.interval = interval
+        self.label = label
+        self.next_deadline = None
+        self.ticks = 0
+        self.coalesced = 0
+        self.lag = LatencyRecorder()
+        _active_schedulers.add(self)
+
+    def start(self, delay: float = 0.0):
+        """First tick is due `delay` seconds from now"""
+        self.next_deadline = time.monotonic() + delay
+
+    async def wait(self) -> int:
+        """Sleeps until the next deadline; returns the number of ticks now due (>= 1)"""
+        if self.next_deadline is None:
+            self.start()
+        delay = self.next_deadline - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        lag = max(0.0, time.monotonic() - self.next_deadline)
+        self.lag.record(lag)
+        worker_tick_lag.record(lag)
+
+        due = 1 + int(lag // self.interval)
+        self.next_deadline += due * self.interval
+        self.ticks += due
+        self.coalesced += due - 1
+        return due
+
+    def metrics(self) -> dict:
+        return {"label": self.label, "ticks": self.ticks, "coalesced": self.coalesced,
+                "lag": self.lag.snapshot()}
+
+
+def tick_lag_metrics() -> dict:
+    """Worker-wide tick lag percentiles plus every running session's own"""
+    return {
+        "worker": worker_tick_lag.snapshot(),
+        "sessions": [s.metrics() for s in list(_active_schedulers) if s.next_deadline is not None],
+    }
@@ -0,0 +1,181 @@
+import sys
+from typing import List, Optional
+import numpy as np
+from game.kline_store import KlineFrame, PRICE_COLUMNS
+from utils.json_utils import dumps
+from game.framing import FrameCodec, JSON_CODEC, Encoded
+
+# window encodings for the delta protocols ("encoding" in the auth message);
+# legacy full-window frames always use rows
+ENCODING_ROWS = "rows"  # one object per row
+ENCODING_COLUMNAR = "columnar"  # one array per column, optional fixed-point prices ("price_scale")
+
+# column order of the columnar encoding (those present in the session)
+COLUMNAR_FIELDS = ("time", "open", "high", "low", "close", "volume")
+
+
+def encode_json(data) -> str:
+    """Compact JSON through the configured serializer (utils.json_utils)"""
+    return dumps(data)
+
+
+class TickTable:
+    """
+    Ready-to-send fragment for every row of a kline session, in one framing
+    (JSON text by default, or msgpack/CBOR bytes, see game.framing).
+    Built once per session per framing per worker and shared by all games on
+    it, so streaming a tick is a slice of prebuilt fragments instead of a
+    pandas row materialization + isoformat + encoding.
+    """
+
+    def __init__(self, frame: KlineFrame, codec: FrameCodec = JSON_CODEC):
+        self.name = frame.name
+        self.codec = codec
+        self.rows: List[Encoded] = [codec.encode(frame.row(i)) for i in range(len(frame))]
+        self._types = {t: codec.encode(t) for t in ("prices", "snapshot", "tick")}
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def nbytes(self) -> int:
+        return encoded_nbytes(self.rows)
+
+    def encode_window(self, indices) -> Encoded:
+        """Array of the given rows (e.g. TickWindow.indices())"""
+        rows = self.rows
+        return self.codec.array([rows[i] for i in indices])
+
+    def initial_message(self, indices) -> Encoded:
+        encode = self.codec.encode
+        return self.codec.message([("count", encode(len(indices))), ("window", self.encode_window(indices))])
+
+    def prices_message(self, index: int, indices) -> Encoded:
+        """Legacy full-window frame for tick `index`"""
+        encode = self.codec.encode
+        return self.codec.message([("type", self._types["prices"]), ("count", encode(index + 1)),
+                                   ("window", self.encode_window(indices))])
+
+    def snapshot_message(self, indices, seq: int, version: int = 2) -> Encoded:
+        """Delta protocol: initial window, later frames only carry the new row"""
+        encode = self.codec.encode
+        return self.codec.message([("type", self._types["snapshot"]), ("v", encode(version)),
+                                   ("seq", encode(seq)), ("count", encode(len(indices))),
+                                   ("window", self.encode_window(indices))])
+
+    def delta_message(self, index: int, seq: int) -> Encoded:
+        """Delta protocol: the row appended to the client window at tick `index`"""
+        encode = self.codec.encode
+        return self.codec.message([("type", self._types["tick"]), ("seq", encode(seq)),
+                                   ("count", encode(index + 1)), ("row", self.rows[index])])
+
+    def coalesced_delta_message(self, indices, seq: int) -> Encoded:
+        """Delta protocol: several rows appended at once (a late session catching up)"""
+        encode = self.codec.encode
+        return self.codec.message([("type", self._types["tick"]), ("seq", encode(seq)),
+                                   ("count", encode(indices[-1] + 1)), ("rows", self.encode_window(indices))])
+
+
+def encoded_nbytes(rows: List[Encoded]) -> int:
+    """Memory held by a list of pre-encoded fragments (the strings/bytes and the list)"""
+    return sys.getsizeof(rows) + sum(map(sys.getsizeof, rows))
+
+
+def column_values(frame: KlineFrame, field: str, price_scale: Optional[int] = None) -> list:
+    """
+    One kline column as JSON-ready Python values for the columnar encoding:
+    times as epoch milliseconds, prices as fixed-point integers when scaled
+    """
+    arr = frame[field]
+    if arr.dtype.kind == "M":
+        return (arr.astype("datetime64[ms]").astype(np.int64)).tolist()
+    if price_scale is not None and field in PRICE_COLUMNS:
+        return np.rint(arr.astype(np.float64) * 10 ** price_scale).astype(np.int64).tolist()
+    if arr.dtype == np.float32:
+        return [float(str(v)) for v in arr]
+    return arr.tolist()
+
+
+class ColumnarTickTable:
+    """
+    Struct-of-arrays variant of TickTable for the delta protocols: the snapshot
+    carries one array per column (names sent once in "fields") and each tick
+    row is a plain array in that order. With price_scale, prices are integers
+    (price * 10**scale).
+    """
+
+    def __init__(self, frame: KlineFrame, price_scale: Optional[int] = None, codec: FrameCodec = JSON_CODEC):
+        self.name = frame.name
+        self.codec = codec
+        self.price_scale = price_scale
+        self.fields = [f for f in COLUMNAR_FIELDS if f in frame]
+        self.columns = [column_values(frame, f, price_scale) for f in self.fields]
+        self.rows: List[Encoded] = [codec.encode(list(values)) for values in zip(*self.columns)]
+        self._header = [("encoding", codec.encode("columnar")), ("scale", codec.encode(price_scale)),
+                        ("fields", codec.encode(self.fields))]
+        self._types = {t: codec.encode(t) for t in ("snapshot", "tick")}
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def nbytes(self) -> int:
+        return encoded_nbytes(self.rows) + sum(encoded_nbytes(column) for column in self.columns)
+
+    def encode_columns(self, indices) -> Encoded:
+        """Array of column arrays for the given rows"""
+        encode = self.codec.encode
+        return self.codec.array([encode([col[i] for i in indices]) for col in self.columns])
+
+    def snapshot_message(self, indices, seq: int, version: int = 2) -> Encoded:
+        encode = self.codec.encode
+        return self.codec.message([("type", self._types["snapshot"]), ("v", encode(version)),
+                                   ("seq", encode(seq)), ("count", encode(len(indices))), *self._header,
+                                   ("columns", self.encode_columns(indices))])
+
+    def delta_message(self, index: int, seq: int) -> Encoded:
+        encode = self.codec.encode
+        return self.codec.message([("type", self._types["tick"]), ("seq", encode(seq)),
+                                   ("count", encode(index + 1)), ("row", self.rows[index])])
+
+    def coalesced_delta_message(self, indices, seq: int) -> Encoded:
+        encode = self.codec.encode
+        return self.codec.message([("type", self._types["tick"]), ("seq", encode(seq)),
+                                   ("count", encode(indices[-1] + 1)), ("columns", self.encode_columns(indices))])
+
+
+def cached_tick_table(frame: KlineFrame, codec: FrameCodec = JSON_CODEC) -> Optional[TickTable]:
+    """The session's tick table for a framing if it is built already"""
+    return frame.cached_derived(("tick_table", codec.name))
+
+
+def get_tick_table(frame: KlineFrame, codec: FrameCodec = JSON_CODEC) -> TickTable:
+    """
+    The shared tick table of a session for a framing, built on first use. It is
+    cached on the frame itself (KlineFrame.derived), so its size counts against
+    the kline cache budget and it goes away when the cache evicts the session.
+    """
+    return frame.derived(("tick_table", codec.name), lambda frame: TickTable(frame, codec))
+
+
+def get_columnar_table(frame: KlineFrame, price_scale: Optional[int] = None,
+                       codec: FrameCodec = JSON_CODEC) -> ColumnarTickTable:
+    """Shared columnar table of a session for the given price scale and framing, cached like get_tick_table"""
+    return frame.derived(("columnar_table", codec.name, price_scale),
+                         lambda frame: ColumnarTickTable(frame, price_scale, codec))
+
+
+def get_stream_table(frame: KlineFrame, codec: FrameCodec = JSON_CODEC, encoding: str = ENCODING_ROWS,
+                     price_scale: Optional[int] = None):
+    """The table a session streams from: columnar for ENCODING_COLUMNAR, rows otherwise"""
+    if encoding == ENCODING_COLUMNAR:
+        return get_columnar_table(frame, price_scale, codec)
+    return get_tick_table(frame, codec)
+
+
+def cached_stream_table(frame: KlineFrame, codec: FrameCodec = JSON_CODEC, encoding: str = ENCODING_ROWS,
+                        price_scale: Optional[int] = None):
+    """get_stream_table if that table is built already, else None"""
+    if encoding == ENCODING_COLUMNAR:
+        return frame.cached_derived(("columnar_table", codec.name, price_scale))
+    return cached_tick_table(frame, codec)
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class TickWindow:
+    """
+    Fixed-capacity ring buffer of row indices into a session's shared kline arrays.
+    Pushing a tick writes one int, nothing is allocated per tick, and the last
+    n rows of any size up to the capacity can be read back without copying the
+    price data.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._rows = np.zeros(capacity, dtype=np.int64)
+        self._head = 0  # slot the next push writes to
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+    def push(self, row_index: int):
+        self._rows[self._head] = row_index
+        self._head = (self._head + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def fill(self, start: int, end: int):
+        """Resets the window to rows [start, end)"""
+        self.clear()
+        for row_index in range(max(start, end - self.capacity), end):
+            self.push(row_index)
+
+    @property
+    def last_row(self) -> int:
+        return int(self._rows[(self._head - 1) % self.capacity])
+
+    def indices(self, n: int = None) -> np.ndarray:
+        """
+        Row indices of the last n ticks, oldest first.
+        A view of the ring when it does not wrap, a small index copy otherwise.
+        """
+        n = self._size if n is None else min(n, self._size)
+        start = (self._head - n) % self.capacity
+        end = start + n
+        if end <= self.capacity:
+            return self._rows[start:end]
+        return np.concatenate((self._rows[start:], self._rows[:end - self.capacity]))
+
+    def contiguous_range(self, n: int = None):
+        """(first, last + 1) when the last n rows are consecutive in the session, else None"""
+        idx = self.indices(n)
+        if len(idx) and idx[-1] - idx[0] == len(idx) - 1:
+            return int(idx[0]), int(idx[-1]) + 1
+        return None
+
+    def column(self, frame, name: str, n: int = None) -> np.ndarray:
+        """
+        Last n values of a kline column: a zero-copy slice of the shared array
+        unless the window spans the replay wrap-around.
+        """
+        rows = self.contiguous_range(n)
+        if rows is not None:
+            return frame[name][rows[0]:rows[1]]
+        return frame[name][self.indices(n)]
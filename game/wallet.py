@@ -1,13 +1,45 @@
 from game.data_preparation import random_token, spike_df_map
+from game.kline_store import KlineFrame
+from game.liquidation import get_liquidation_index
 from collections import deque
-import asyncio
+from array import array
+import numpy as np
+
+class WalletPrices:
+    """
+    close/low/high of a session as contiguous float64 arrays, extracted once
+    per token and shared by every wallet on it. Indexing returns Python floats,
+    so the per-tick wallet math never touches numpy/pandas scalars.
+    """
+    __slots__ = ("close", "low", "high")
+
+    def __init__(self, frame: KlineFrame):
+        self.close = array("d", np.ascontiguousarray(frame["close"], dtype=np.float64).tobytes())
+        self.low = array("d", np.ascontiguousarray(frame["low"], dtype=np.float64).tobytes())
+        self.high = array("d", np.ascontiguousarray(frame["high"], dtype=np.float64).tobytes())
+
+    def __len__(self):
+        return len(self.close)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(a) * a.itemsize for a in (self.close, self.low, self.high))
+
+
+def get_wallet_prices(frame: KlineFrame) -> WalletPrices:
+    """Shared WalletPrices of a session, cached on the frame like the tick table"""
+    return frame.derived("wallet_prices", WalletPrices)
 
 
 class FuturesWallet:
-    def __init__(self, token_selection='somi', leverage: int = 20, capital: float = 1000.0):
+    def __init__(self, token_selection='somi', leverage: int = 20, capital: float = 1000.0,
+                 klines: KlineFrame = None):
         self.leverage = leverage
         self.position_size = 100.0
         self.token_selection = token_selection
+        self.klines = klines if klines is not None else spike_df_map[token_selection]
+        self.prices = get_wallet_prices(self.klines)
+        self.lookahead = get_liquidation_index(self.klines)
 
         self.capital = float(capital)  # starting capital (constant baseline)
 
@@ -16,17 +48,18 @@ class FuturesWallet:
         self.balance_in_position = 0.0  # margin currently locked in positions
         self.balance_total = float(capital)  # equity (free + in_position + unrealized PnL)
 
-        # position tracking
-        self.long_positions = {'average_price': None, 'total_price': 0.0, 'num_pos': 0}
-        self.short_positions = {'average_price': None, 'total_price': 0.0, 'num_pos': 0}
+        # position tracking: only one side can be open at a time, so the open
+        # side is self.direction and its entries are summed in scalar fields
+        self.num_pos = 0
+        self.total_price = 0.0  # sum of entry prices
+        self.average_price = None
         self.direction = None  # "long" or "short" or None when no position
+        # (tick step, row) where the open position gets liquidated, see schedule_liquidation
+        self.liquidation = None
 
-        # async lock for concurrent access from websocket tasks
-        self._lock = asyncio.Lock()
-
-        self.long_queue = []
-        self.short_queue = []
-        self.close_pos_queue = []
+        # orders in arrival order as (action, index, step); drained by the
+        # session's WalletActor, the only task that touches the wallet
+        self.inbox = deque()
 
         def get_order_packet_send_time():
             ...
@@ -36,91 +69,78 @@ class FuturesWallet:
     # small helper to clear positions without touching balances
     async def _clear_positions(self):
         self.balance_in_position = 0.0
-        self.long_positions = {'average_price': None, 'total_price': 0.0, 'num_pos': 0}
-        self.short_positions = {'average_price': None, 'total_price': 0.0, 'num_pos': 0}
+        self.num_pos = 0
+        self.total_price = 0.0
+        self.average_price = None
         self.direction = None
+        self.liquidation = None
 
     async def get_wallet_state(self):
-        async with self._lock:
-            total_profit = (self.balance_total - self.capital) / self.capital
-            return {
-                "balance_total": self.balance_total,
-                "total_profit": total_profit,
-                "balance_free": self.balance_free,
-                "in_position": self.balance_in_position,
-                "long_average": self.long_positions['average_price'],
-                "short_average": self.short_positions['average_price'],
-                "direction": self.direction
-            }
+        total_profit = (self.balance_total - self.capital) / self.capital
+        return {
+            "balance_total": self.balance_total,
+            "total_profit": total_profit,
+            "balance_free": self.balance_free,
+            "in_position": self.balance_in_position,
+            "long_average": self.average_price if self.direction == "long" else None,
+            "short_average": self.average_price if self.direction == "short" else None,
+            "direction": self.direction
+        }
+
+    def _add_entry(self, price: float):
+        self.total_price += price
+        self.num_pos += 1
+        self.average_price = self.total_price / self.num_pos
 
     # open a long (returns True if opened)
     async def add_long(self, index) -> bool:
-        async with self._lock:
-            if self.short_positions['num_pos'] > 0:
-                return False
-            if self.balance_free < self.position_size:
-                return False
-            price = float(spike_df_map[self.token_selection]['close'].iloc[index])
-            self.long_positions['total_price'] += price
-            self.long_positions['num_pos'] += 1
-            self.long_positions['average_price'] = (self.long_positions['total_price'] /
-                                                    self.long_positions['num_pos'])
-
-            self.direction = "long"
-            self.balance_in_position += self.position_size
-            self.balance_free -= self.position_size
-            # update total equity after opening (no unrealized PnL yet)
-            self.balance_total = self.balance_free + self.balance_in_position
-            return True
+        if self.direction == "short":
+            return False
+        if self.balance_free < self.position_size:
+            return False
+        self._add_entry(self.prices.close[index])
+
+        self.direction = "long"
+        self.balance_in_position += self.position_size
+        self.balance_free -= self.position_size
+        # update total equity after opening (no unrealized PnL yet)
+        self.balance_total = self.balance_free + self.balance_in_position
+        return True
 
     async def add_short(self, index) -> bool:
-        async with self._lock:
-            if self.long_positions['num_pos'] > 0:
-                return False
-            if self.balance_free < self.position_size:
-                return False
-            price = float(spike_df_map[self.token_selection]['close'].iloc[index])
-            self.short_positions['total_price'] += price
-            self.short_positions['num_pos'] += 1
-            self.short_positions['average_price'] = (self.short_positions['total_price'] /
-                                                     self.short_positions['num_pos'])
-
-            self.direction = "short"
-            self.balance_in_position += self.position_size
-            self.balance_free -= self.position_size
-            self.balance_total = self.balance_free + self.balance_in_position
-            return True
+        if self.direction == "long":
+            return False
+        if self.balance_free < self.position_size:
+            return False
+        self._add_entry(self.prices.close[index])
+
+        self.direction = "short"
+        self.balance_in_position += self.position_size
+        self.balance_free -= self.position_size
+        self.balance_total = self.balance_free + self.balance_in_position
+        return True
 
     # close fully: release margin and apply realized PnL
     async def close_position_full(self, index) -> bool:
-        async with self._lock:
-            # choose which position we're closing
-            if self.direction == "long":
-                positions = self.long_positions
-            elif self.direction == "short":
-                positions = self.short_positions
-            else:
-                return False  # nothing to close
-
-            if positions['num_pos'] == 0 or positions['average_price'] is None:
-                return False
-
-            cur_price = float(spike_df_map[self.token_selection]['close'].iloc[index])
-            change = (cur_price - positions['average_price']) / positions['average_price']  # decimal
-            profit = self.balance_in_position * change * self.leverage
-            # for short, profit sign is reversed
-            if self.direction == "short":
-                profit = -profit
+        if self.direction is None or self.num_pos == 0:
+            return False  # nothing to close
 
-            # release margin + realized PnL back to free balance
-            self.balance_free += self.balance_in_position + profit
+        entry = self.average_price
+        change = (self.prices.close[index] - entry) / entry  # decimal
+        profit = self.balance_in_position * change * self.leverage
+        # for short, profit sign is reversed
+        if self.direction == "short":
+            profit = -profit
 
-            # clear positions (without overwriting new balance_free)
-            await self._clear_positions()
+        # release margin + realized PnL back to free balance
+        self.balance_free += self.balance_in_position + profit
 
-            # set total equity to free balance (no open positions)
-            self.balance_total = self.balance_free
-            return True
+        # clear positions (without overwriting new balance_free)
+        await self._clear_positions()
+
+        # set total equity to free balance (no open positions)
+        self.balance_total = self.balance_free
+        return True
 
     # handle liquidation: margin is lost (already removed from balance_free at open),
     # so we just clear positions and set balance_total = balance_free
@@ -129,76 +149,97 @@ class FuturesWallet:
         await self._clear_positions()
         self.balance_total = self.balance_free
 
-    # called periodically (every 0.4s). computes unrealized pnl and updates balance_total,
-    # checks liquidation using decimal thresholds (<= -1 or >= 1)
-    async def calculate_final_balance(self, current_index):
-        async with self._lock:
-            # if no open positions, equity is simply free cash
-            if self.direction is None:
-                self.balance_total = self.balance_free
-                return
+    def liquidation_row(self, start: int, stop: int = None):
+        """Exact first row in [start, stop) where the open position is liquidated, or None"""
+        if self.direction is None or self.num_pos == 0:
+            return None
+        return self.lookahead.find(self.average_price, self.direction, self.leverage, start, stop)
+
+    def schedule_liquidation(self, ranges):
+        """
+        Looks the open position's liquidation up over the rows still to come
+        (PriceFlow.upcoming_ranges()) and stores it as (step, row), or None
+        when the position survives the replay. Call after every position change.
+        """
+        self.liquidation = None
+        for step, start, stop in ranges:
+            row = self.liquidation_row(start, stop)
+            if row is not None:
+                self.liquidation = (step + row - start, row)
+                break
+        return self.liquidation
+
+    # called on every tick. computes unrealized pnl and updates balance_total.
+    # With `step` (the tick position), liquidation fires at the scheduled tick,
+    # which also covers bars skipped by coalesced ticks; without it, the current
+    # bar is checked using decimal thresholds (<= -1 or >= 1)
+    async def calculate_final_balance(self, current_index, step=None):
+        # if no open positions, equity is simply free cash
+        if self.direction is None or self.num_pos == 0:
+            self.balance_total = self.balance_free
+            return
 
-            if self.direction == "long":
-                positions = self.long_positions
-            else:
-                positions = self.short_positions
+        prices = self.prices
+        entry = self.average_price
+        change_close_lev = (prices.close[current_index] - entry) / entry * self.leverage
 
-            if positions['num_pos'] == 0 or positions['average_price'] is None:
-                self.balance_total = self.balance_free
+        if step is not None:
+            if self.liquidation is not None and step >= self.liquidation[0]:
+                await self.liq_position()
                 return
-
-            cur_price = float(spike_df_map[self.token_selection]['close'].iloc[current_index])
-            cur_low = float(spike_df_map[self.token_selection]['low'].iloc[current_index])
-            cur_high = float(spike_df_map[self.token_selection]['high'].iloc[current_index])
-
-            entry = positions['average_price']
-            change_close = (cur_price - entry) / entry
-            change_low = (cur_low - entry) / entry
-            change_close_lev = change_close * self.leverage
-            change_low_lev = change_low * self.leverage
-
-            if self.direction == "long":
-                # liquidation if worst intrabar price -> loss >= margin
-                if change_low_lev <= -1.0:
-                    await self.liq_position()
-                    return
-                unrealized = self.balance_in_position * change_close_lev
-                self.balance_total = self.balance_free + self.balance_in_position + unrealized
-            else:
-                change_high = (cur_high - entry) / entry
-                change_high_lev = change_high * self.leverage
-                if change_high_lev >= 1.0:
-                    await self.liq_position()
-                    return
-                # short unrealized PnL (profit when price goes down -> negative change)
-                unrealized = - self.balance_in_position * change_close_lev
-                self.balance_total = self.balance_free + self.balance_in_position + unrealized
-
-    async def push_order_long(self, index):
-        self.long_queue.append(index)
-
-    async def push_order_short(self, index):
-        self.short_queue.append(index)
-
-    async def push_close(self, index):
-        self.close_pos_queue.append(index)
-
-    # runs as a task
-    async def consume_queue(self):
-        # while True:
-        for index in self.long_queue:
-            await self.add_long(index)
-
-        for index in self.short_queue:
-            await self.add_short(index)
-
-        for index in self.close_pos_queue:
-            await self.close_position_full(index)
-
-        self.long_queue = []
-        self.short_queue = []
-        self.close_pos_queue = []
-
+            unrealized = self.balance_in_position * change_close_lev
+            if self.direction == "short":
+                unrealized = -unrealized
+            self.balance_total = self.balance_free + self.balance_in_position + unrealized
+            return
+
+        if self.direction == "long":
+            # liquidation if worst intrabar price -> loss >= margin
+            if (prices.low[current_index] - entry) / entry * self.leverage <= -1.0:
+                await self.liq_position()
+                return
+            unrealized = self.balance_in_position * change_close_lev
+            self.balance_total = self.balance_free + self.balance_in_position + unrealized
+        else:
+            if (prices.high[current_index] - entry) / entry * self.leverage >= 1.0:
+                await self.liq_position()
+                return
+            # short unrealized PnL (profit when price goes down -> negative change)
+            unrealized = - self.balance_in_position * change_close_lev
+            self.balance_total = self.balance_free + self.balance_in_position + unrealized
+
+    async def push_order(self, action: str, index, step=None):
+        """Queues an order ("long", "short" or "close") recorded at row `index` / tick `step`"""
+        self.inbox.append((action, index, step))
+
+    async def push_order_long(self, index, step=None):
+        await self.push_order("long", index, step)
+
+    async def push_order_short(self, index, step=None):
+        await self.push_order("short", index, step)
+
+    async def push_close(self, index, step=None):
+        await self.push_order("close", index, step)
+
+    async def consume_queue(self, upcoming_ranges=None):
+        """
+        Executes the queued orders strictly in arrival order, each at its
+        recorded index; returns [(action, index, accepted), ...].
+        A scheduled liquidation due at or before an order's tick happens first.
+        With upcoming_ranges (PriceFlow.upcoming_ranges), the liquidation is
+        rescheduled from the tick of every accepted order.
+        """
+        results = []
+        handlers = {"long": self.add_long, "short": self.add_short, "close": self.close_position_full}
+        while self.inbox:
+            action, index, step = self.inbox.popleft()
+            if step is not None and self.liquidation is not None and step >= self.liquidation[0]:
+                await self.liq_position()
+            accepted = await handlers[action](index)
+            if accepted and upcoming_ranges is not None:
+                self.schedule_liquidation(upcoming_ranges(step))
+            results.append((action, index, accepted))
+        return results
 
 if __name__ == '__main__':
     futures_wallet = FuturesWallet(leverage=20, token_selection=random_token)
@@ -0,0 +1,117 @@
+import asyncio
+from typing import Callable, Optional
+from game.wallet import FuturesWallet
+from game.price_flow import PriceFlow
+from game.outbound import OutboundQueue
+
+
+class WalletActor:
+    """
+    The one task per session that touches its FuturesWallet. Orders go into
+    the wallet's ordered inbox through submit(); each pass executes them in
+    arrival order at their recorded index, updates the balance for the current
+    tick and, in the same pass, sends the order acks, the new liquidation tick
+    and (when it changed) the wallet state.
+    - listen_ticks: also run a pass on every price tick (off when the price
+      stream drains the actor itself, as combined frames do)
+    - send_wallet: send {"type": "wallet"} frames
+    - send_acks: send {"type": "ack"} frames (not understood by legacy clients)
+    - engine: a batched WalletEngine that marks the position to market on
+      ticks instead of this actor (implies listen_ticks=False)
+    """
+
+    def __init__(self, wallet: FuturesWallet, flow: PriceFlow, outbound: OutboundQueue,
+                 listen_ticks: bool = True, send_wallet: bool = True, send_acks: bool = True,
+                 is_expired: Optional[Callable[[], bool]] = None, engine=None):
+        self.engine = engine
+        self.row = None
+        if engine is not None:
+            listen_ticks = False
+        self.wallet = wallet
+        self.flow = flow
+        self.outbound = outbound
+        self.listen_ticks = listen_ticks
+        self.send_wallet = send_wallet
+        self.send_acks = send_acks
+        self.is_expired = is_expired
+        self.wake = asyncio.Event()
+        self.last_state = None
+
+    async def submit(self, action: str, index: int, step: Optional[int] = None):
+        await self.wallet.push_order(action, index, step)
+        self.wake.set()
+
+    async def drain(self) -> dict:
+        """One pass: orders, balance, acks and liquidation tick; returns the wallet state"""
+        wallet = self.wallet
+        flow = self.flow
+        results = await wallet.consume_queue(flow.upcoming_ranges)
+        await wallet.calculate_final_balance(flow.current_index, flow.step)
+        state = await wallet.get_wallet_state()
+        if self.row is not None:
+            self.engine.sync(self.row, wallet)
+
+        if self.send_acks:
+            for action, order_index, accepted in results:
+                await self.outbound.send_json({
+                    "type": "ack",
+                    "action": action,
+                    "index": order_index,
+                    "ok": accepted,
+                    "wallet": state
+                })
+        if any(accepted for _, _, accepted in results):
+            liquidation = wallet.liquidation
+            await self.outbound.send_json({
+                "type": "liquidation",
+                "tick": liquidation[0] if liquidation else None,
+                "index": liquidation[1] if liquidation else None
+            })
+        return state
+
+    async def publish(self, state: dict):
+        """Sends the wallet state if it changed since the last frame"""
+        if not self.send_wallet or state == self.last_state:
+            return
+        # a dropped frame leaves last_state alone, so the state is sent again next pass
+        if await self.outbound.send_json({
+            "type": "wallet",
+            "wallet": state
+        }, kind="wallet"):
+            self.last_state = state
+
+    async def on_mark(self, balance_total: float, liquidated: bool):
+        """Result of the engine's pass for this session"""
+        if liquidated:
+            await self.wallet.liq_position()
+            self.engine.sync(self.row, self.wallet)
+        else:
+            self.wallet.balance_total = balance_total
+        await self.publish(await self.wallet.get_wallet_state())
+
+    async def run(self):
+        if self.listen_ticks:
+            self.flow.add_tick_listener(self.wake)
+        if self.engine is not None:
+            self.row = self.engine.register(self.wallet, self.flow, self.on_mark)
+        self.wake.set()
+        try:
+            while True:
+                await self.wake.wait()
+                self.wake.clear()
+
+                if self.is_expired is not None and self.is_expired():
+                    print("⏰ Session expired, wallet actor stopping")
+                    break
+
+                await self.publish(await self.drain())
+
+        except asyncio.CancelledError:
+            print("wallet actor was cancelled")
+        except Exception as e:
+            print(f"error in wallet actor: {e}")
+        finally:
+            self.flow.remove_tick_listener(self.wake)
+            if self.row is not None:
+                self.engine.unregister(self.row)
+                self.row = None
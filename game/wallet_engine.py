@@ -0,0 +1,255 @@
+"""
+Batched wallet engine (WALLET_ENGINE=batched).
+
+Every active session's open position is a row in per-worker arrays (entry
+price, margin, free balance, leverage, direction, token id, flow slot,
+scheduled liquidation tick). Each price flow owns a slot holding its current
+index and tick, written by PriceFlow.advance() itself, so a cohort's sessions
+share one slot. Each pass marks all rows to market at once: index and tick
+are gathered through the flow slots, close prices from one buffer holding all
+registered tokens back to back, and unrealized PnL, balances and liquidation
+flags are computed in a few numpy operations; only the rows whose tick moved
+(or that got liquidated) are dispatched back to their session.
+
+Orders still execute on each session's FuturesWallet (WalletActor); the actor
+copies the resulting position into its row with sync().
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+import numpy as np
+from configs.config import WALLET_ENGINE, WALLET_ENGINE_INTERVAL
+from game.tick_scheduler import TickScheduler
+from game.wallet import FuturesWallet, get_wallet_prices
+
+DIRECTIONS = {"long": 1, "short": -1, None: 0}
+
+# on_mark(balance_total, liquidated) callback of a session
+MarkCallback = Callable[[float, bool], Awaitable[None]]
+
+
+class WalletEngine:
+    def __init__(self, interval: float = WALLET_ENGINE_INTERVAL, capacity: int = 1024,
+                 close_capacity: int = 1 << 16):
+        self.interval = interval
+        self.size = 0  # rows in use (free rows below it are inactive)
+        self._free_rows: List[int] = []
+        self._allocate(capacity)
+
+        # current index and tick of every attached flow, see attach_flow
+        self.flow_index = np.zeros(capacity, dtype=np.int64)
+        self.flow_step = np.full(capacity, -1, dtype=np.int64)
+        self._flow_slots: Dict[int, int] = {}  # id(flow) -> slot
+        self._flow_sessions: Dict[int, int] = {}  # slot -> rows using it
+        self._free_flow_slots: List[int] = []
+
+        # close prices of every registered token back to back in one buffer;
+        # tokens without sessions are dropped when the buffer has to grow
+        self.token_ids: Dict[str, int] = {}
+        self._token_length: Dict[int, int] = {}
+        self._token_sessions: Dict[int, int] = {}
+        self._free_token_ids: List[int] = []
+        self.close = np.zeros(close_capacity, dtype=np.float64)
+        self.close_size = 0
+        self.offsets = np.zeros(0, dtype=np.int64)
+
+        self.flows = {}  # row -> PriceFlow
+        self.callbacks: Dict[int, MarkCallback] = {}
+        self.passes = 0
+        self.dispatched = 0
+        self._task = None
+
+    def _allocate(self, capacity: int):
+        def grow(name, dtype, fill=0):
+            old = getattr(self, name, None)
+            arr = np.full(capacity, fill, dtype=dtype)
+            if old is not None:
+                arr[:len(old)] = old
+            setattr(self, name, arr)
+
+        grow("active", np.bool_, False)
+        grow("token", np.int64)
+        grow("flow_row", np.int64)
+        grow("last_index", np.int64, -1)
+        grow("direction", np.int8)
+        grow("entry", np.float64, 1.0)
+        grow("margin", np.float64)
+        grow("free", np.float64)
+        grow("leverage", np.float64, 1.0)
+        grow("liq_step", np.int64, -1)
+        self.capacity = capacity
+
+    def _token_id(self, wallet: FuturesWallet) -> int:
+        """Id of the wallet's token; its close prices are appended to the buffer on first use"""
+        token = wallet.klines.name
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            close = np.frombuffer(get_wallet_prices(wallet.klines).close, dtype=np.float64)
+            if self.close_size + len(close) > len(self.close):
+                self._compact(len(close))
+            if self._free_token_ids:
+                token_id = self._free_token_ids.pop()
+            else:
+                token_id = len(self.offsets)
+                self.offsets = np.append(self.offsets, 0)
+            self.offsets[token_id] = self.close_size
+            self.close[self.close_size:self.close_size + len(close)] = close
+            self.close_size += len(close)
+            self.token_ids[token] = token_id
+            self._token_length[token_id] = len(close)
+            self._token_sessions[token_id] = 0
+        return token_id
+
+    def _compact(self, extra: int):
+        """Drops tokens without sessions and regrows the buffer (doubling) to fit `extra` more prices"""
+        for token, token_id in list(self.token_ids.items()):
+            if not self._token_sessions[token_id]:
+                del self.token_ids[token]
+                del self._token_length[token_id]
+                del self._token_sessions[token_id]
+                self._free_token_ids.append(token_id)
+        live = sum(self._token_length.values())
+        capacity = len(self.close)
+        while capacity < live + extra:
+            capacity *= 2
+        close = np.zeros(capacity, dtype=np.float64)
+        pos = 0
+        for token_id, length in self._token_length.items():
+            start = self.offsets[token_id]
+            close[pos:pos + length] = self.close[start:start + length]
+            self.offsets[token_id] = pos
+            pos += length
+        self.close = close
+        self.close_size = pos
+
+    def attach_flow(self, flow) -> int:
+        """
+        Slot of a flow's position; the flow writes its index and tick into it
+        on every advance (PriceFlow.engine_slot), so passes never visit flows
+        """
+        slot = self._flow_slots.get(id(flow))
+        if slot is None:
+            if self._free_flow_slots:
+                slot = self._free_flow_slots.pop()
+            else:
+                slot = len(self._flow_slots)
+                if slot == len(self.flow_index):
+                    self.flow_index = np.concatenate([self.flow_index, np.zeros_like(self.flow_index)])
+                    self.flow_step = np.concatenate([self.flow_step, np.full_like(self.flow_step, -1)])
+            self._flow_slots[id(flow)] = slot
+            self._flow_sessions[slot] = 0
+            self.flow_index[slot] = flow.current_index
+            self.flow_step[slot] = flow.step
+            flow.engine_slot = (self, slot)
+        self._flow_sessions[slot] += 1
+        return slot
+
+    def _detach_flow(self, flow, slot: int):
+        self._flow_sessions[slot] -= 1
+        if not self._flow_sessions[slot]:
+            del self._flow_sessions[slot]
+            del self._flow_slots[id(flow)]
+            self._free_flow_slots.append(slot)
+            flow.engine_slot = None
+
+    def register(self, wallet: FuturesWallet, flow, on_mark: MarkCallback) -> int:
+        """Adds a session; returns its row"""
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            if self.size == self.capacity:
+                self._allocate(self.capacity * 2)
+            row = self.size
+            self.size += 1
+        token_id = self._token_id(wallet)
+        self.token[row] = token_id
+        self._token_sessions[token_id] += 1
+        self.flow_row[row] = self.attach_flow(flow)
+        self.last_index[row] = -1
+        self.flows[row] = flow
+        self.callbacks[row] = on_mark
+        self.sync(row, wallet)
+        self.active[row] = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return row
+
+    def unregister(self, row: int):
+        self.active[row] = False
+        self.direction[row] = 0
+        self._token_sessions[int(self.token[row])] -= 1
+        flow = self.flows.pop(row, None)
+        if flow is not None:
+            self._detach_flow(flow, int(self.flow_row[row]))
+        self.callbacks.pop(row, None)
+        self._free_rows.append(row)
+
+    def sync(self, row: int, wallet: FuturesWallet):
+        """Copies a wallet's position into its row (after orders or a liquidation)"""
+        direction = DIRECTIONS[wallet.direction] if wallet.num_pos else 0
+        self.direction[row] = direction
+        self.entry[row] = wallet.average_price if direction else 1.0
+        self.margin[row] = wallet.balance_in_position
+        self.free[row] = wallet.balance_free
+        self.leverage[row] = wallet.leverage
+        self.liq_step[row] = wallet.liquidation[0] if wallet.liquidation else -1
+
+    def mark(self):
+        """
+        One vectorized pass over all rows. Returns (rows, balances, liquidated)
+        for the active rows whose tick moved or that got liquidated. Same float
+        operations as FuturesWallet.calculate_final_balance with a step.
+        """
+        n = self.size
+        active = self.active[:n]
+        flow_row = self.flow_row[:n]
+        index = self.flow_index[flow_row]
+        step = self.flow_step[flow_row]
+        entry = self.entry[:n]
+        margin = self.margin[:n]
+        free = self.free[:n]
+        direction = self.direction[:n]
+        liq_step = self.liq_step[:n]
+
+        # inactive rows may point at released tokens and flow slots
+        price = self.close[np.where(active, self.offsets[self.token[:n]] + index, 0)]
+        unrealized = margin * ((price - entry) / entry * self.leverage[:n]) * direction
+        in_position = direction != 0
+        balances = np.where(in_position, free + margin + unrealized, free)
+        liquidated = in_position & (liq_step >= 0) & (step >= liq_step)
+
+        changed = active & ((index != self.last_index[:n]) | liquidated)
+        self.last_index[:n] = index
+        rows = np.flatnonzero(changed)
+        self.passes += 1
+        return rows, balances[rows], liquidated[rows]
+
+    async def dispatch(self):
+        rows, balances, liquidated = self.mark()
+        for row, balance, liq in zip(rows.tolist(), balances.tolist(), liquidated.tolist()):
+            callback = self.callbacks.get(row)
+            if callback is None:
+                continue
+            try:
+                await callback(balance, liq)
+            except Exception as e:
+                print(f"Wallet engine dispatch failed for row {row}: {e}")
+        self.dispatched += len(rows)
+
+    async def run(self):
+        scheduler = TickScheduler(self.interval, label="wallet-engine")
+        scheduler.start(self.interval)
+        try:
+            while self.callbacks:
+                await scheduler.wait()
+                await self.dispatch()
+        except asyncio.CancelledError:
+            pass
+
+    def metrics(self) -> dict:
+        return {"sessions": len(self.callbacks), "capacity": self.capacity, "flows": len(self._flow_slots),
+                "tokens": len(self.token_ids), "close_capacity": len(self.close), "passes": self.passes,
+                "dispatched": self.dispatched}
+
+
+# the worker's engine, None unless WALLET_ENGINE=batched
+wallet_engine: Optional[WalletEngine] = WalletEngine() if WALLET_ENGINE == "batched" else None
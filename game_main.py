@@ -1,21 +1,43 @@
-from fastapi import FastAPI, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from game.price_flow import *
 from game.wallet import *
 import json, random
-from utils.auth_utils import decrypt
+from utils.auth_utils import AuthDecoder, AuthPoolSaturated
+from utils.metrics import worker_info
+from utils.json_utils import FastJSONResponse, serializer_name
+from game.kline_store import memory_report, LazyKlineCatalog
+from game.data_preparation import prefetch_klines
+from game.tick_scheduler import tick_lag_metrics
+from game.cohort import cohort_hub
+from game.outbound import OutboundQueue, outbound_totals
+from game.framing import negotiate_framing
+from game.wallet_actor import WalletActor
+from game.wallet_engine import wallet_engine
 import uvicorn
 from configs.config import WS_ALLOWED_ORIGINS, CORS_ALLOWED_ORIGINS
 from storage.firestore_client import FirestoreManager
+from storage.session_journal import SessionJournal
 import time
 import uuid
 from collections import deque
-from configs.config import SECRET
+from configs.config import SECRET, SECRETS, AUTH_POOL_KIND, AUTH_POOL_WORKERS, AUTH_MAX_PENDING
 from fastapi.middleware.cors import CORSMiddleware
 import requests, threading
 
 SECRET_KEY = SECRET
 
-game_app = FastAPI()
+# close code sent when the auth pool is saturated (1013 = try again later)
+AUTH_BUSY_CLOSE_CODE = 1013
+
+# token decryption runs off the event loop on a bounded pool
+auth_decoder = AuthDecoder(
+    SECRETS,
+    kind=AUTH_POOL_KIND,
+    workers=AUTH_POOL_WORKERS,
+    max_pending=AUTH_MAX_PENDING
+)
+
+game_app = FastAPI(default_response_class=FastJSONResponse)
 
 game_app.add_middleware(
     CORSMiddleware,
@@ -29,6 +51,7 @@ game_app.add_middleware(
 debug_ = False 
 
 firestore_manager = FirestoreManager()
+session_journal = SessionJournal()
 
 
 def increase_tracker_thread(fid, timeout=10):
@@ -50,6 +73,34 @@ async def game_router_status():
     return {'status': 'running'}
 
 
+@game_app.get('/metrics')
+async def game_metrics():
+    """Per-worker metrics (each gunicorn worker answers for itself)"""
+    return {
+        **worker_info(),
+        "memory": memory_report(),
+        "klines": spike_df_map.stats() if isinstance(spike_df_map, LazyKlineCatalog) else {"sessions": len(spike_df_map)},
+        "auth": auth_decoder.metrics(),
+        "tick_lag": tick_lag_metrics(),
+        "cohorts": cohort_hub.metrics(),
+        "outbound": outbound_totals,
+        "json_serializer": serializer_name(),
+        "wallet_engine": wallet_engine.metrics() if wallet_engine else None,
+        "journal": await session_journal.metrics(),
+    }
+
+
+@game_app.on_event("startup")
+async def start_journal():
+    await session_journal.start(firestore_manager)
+
+
+@game_app.on_event("shutdown")
+async def shutdown_pools():
+    auth_decoder.shutdown()
+    await session_journal.stop(firestore_manager)
+
+
 
 @game_app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -66,7 +117,8 @@ async def websocket_endpoint(websocket: WebSocket):
     trade_env_id = str(uuid.uuid4())
     fid = None
     auth_time = None
-    session_timeout = 250
+    base_session_timeout = 250
+    session_timeout = base_session_timeout
     
     rate_limit_window = deque(maxlen=15)
     rate_limit_duration = 1.0
@@ -95,6 +147,23 @@ async def websocket_endpoint(websocket: WebSocket):
         print(auth_data)
 
         encrypted_token = auth_data.get('encrypted_token')
+        # old clients send no "protocol" and keep the full-window stream
+        protocol = negotiate_protocol(auth_data.get('protocol', PROTOCOL_LEGACY))
+        window_size = negotiate_window_size(auth_data.get('window_size', DEFAULT_WINDOW_SIZE))
+        # cohort mode: share the price stream with everyone starting in the same slot
+        cohort_mode = bool(auth_data.get('cohort', False))
+        # replay speed scales tick pacing, wallet refresh and the session timeout together
+        speed = negotiate_speed(auth_data.get('speed', '1x'))
+        session_timeout = base_session_timeout / speed
+        # combined frames carry each player's wallet, so a shared cohort stream falls back to delta
+        if cohort_mode and protocol == PROTOCOL_COMBINED:
+            protocol = PROTOCOL_DELTA
+        combined_mode = protocol == PROTOCOL_COMBINED
+        encoding, price_scale = negotiate_encoding(auth_data.get('encoding'), auth_data.get('price_scale'))
+        if protocol not in DELTA_PROTOCOLS:
+            encoding, price_scale = ENCODING_ROWS, None
+        # binary framing applies to every frame after the (JSON) auth reply
+        codec = negotiate_framing(auth_data.get('framing'))
         if not encrypted_token:
             try:
                 await websocket.send_json({"error": "No encrypted_token provided"})
@@ -105,7 +174,16 @@ async def websocket_endpoint(websocket: WebSocket):
 
         # Decrypt and validate the token
         try:
-            decrypted_json = decrypt(encrypted_token, SECRET_KEY)
+            try:
+                decrypted_json = await auth_decoder.decrypt(encrypted_token)
+            except AuthPoolSaturated as e:
+                print(f"❌ Auth pool saturated: {e}")
+                try:
+                    await websocket.send_json({"error": "Server busy, try again"})
+                except Exception:
+                    pass
+                await websocket.close(code=AUTH_BUSY_CLOSE_CODE)
+                return
             payload = json.loads(decrypted_json)
             print(payload)
 
@@ -132,7 +210,10 @@ async def websocket_endpoint(websocket: WebSocket):
                 thread.start()
 
                 try:
-                    await websocket.send_json({"authenticated": True, "fid": fid})
+                    await websocket.send_json({"authenticated": True, "fid": fid, "protocol": protocol,
+                                              "cohort": cohort_mode, "speed": speed,
+                                              "encoding": encoding, "price_scale": price_scale,
+                                              "framing": codec.name})
                 except Exception as e:
                     print(f"Failed to send auth success (client disconnected): {e}")
                     return
@@ -167,77 +248,92 @@ async def websocket_endpoint(websocket: WebSocket):
 
     # WebSocket logic
     sending_task = None
-    handle_wallet_task = None
+    wallet_task = None
+    # trade_actions from this offset on belong to the current wallet (a new one is made on start)
+    wallet_first_action = 0
     timeout_task = None
 
-    keys = list(spike_df_map.keys())
-    random_token = random.choice(keys)
-    print(random_token)
+    if cohort_mode:
+        # the cohort ticker brings its session and price flow on "start"
+        random_token = price_flow = futures_wallet = None
+    else:
+        keys = list(spike_df_map.keys())
+        random_token = random.choice(keys)
+        print(random_token)
+
+        # load the session off the event loop on a cache miss
+        try:
+            klines = await prefetch_klines(random_token, codec, encoding, price_scale)
+        except Exception as e:
+            print(f"❌ Failed to load klines for {random_token}: {e}")
+            await websocket.close(code=1011)
+            return
+
+        price_flow = PriceFlow(window_size=window_size, token_selection=random_token, protocol=protocol,
+                               session_label=trade_env_id, speed=speed, encoding=encoding,
+                               price_scale=price_scale, codec=codec, klines=klines)
+        futures_wallet = FuturesWallet(leverage=20, token_selection=random_token, klines=price_flow.klines)
 
-    price_flow = PriceFlow(token_selection=random_token)
-    futures_wallet = FuturesWallet(leverage=20, token_selection=random_token)
+    # every frame from here on goes through one bounded, coalescing queue per socket
+    outbound = OutboundQueue(websocket, codec=codec)
+    outbound.start()
 
     async def auto_close_after_timeout():
         try:
             await asyncio.sleep(session_timeout)
             print(f"⏰ Session timeout reached for FID: {fid}")
             try:
-                await websocket.send_json({
+                await outbound.send_json({
                     "type": "session_timeout",
-                    "message": "Session expired after 6 minutes"
+                    "message": f"Session expired after {session_timeout:g} seconds"
                 })
-                await websocket.close(code=1000, reason="Session timeout")
+                await outbound.close(code=1000, reason="Session timeout")
             except Exception as e:
                 print(f"Error closing timed out session: {e}")
         except asyncio.CancelledError:
             print("Timeout task cancelled")
 
-    async def handle_wallet():
-        try:
-            a = 0
-            while True:
-                if is_session_expired():
-                    print(f"⏰ Session expired for FID: {fid}")
-                    break
-                    
-                if debug_:
-                    print(a)
-                    print("[x] consume queue")
-                await futures_wallet.consume_queue()
-                if debug_:
-                    print("[x] calculate final balance")
-                await futures_wallet.calculate_final_balance(price_flow.current_index)
-                if debug_:
-                    print("[x] send wallet to websocket")
-                
-                try:
-                    await websocket.send_json({
-                        "type": "wallet",
-                        "wallet": await futures_wallet.get_wallet_state()
-                    })
-                except Exception as e:
-                    print(f"Failed to send wallet state: {e}")
-                    break
-                    
-                if debug_:
-                    print("[x] sleep")
-                await asyncio.sleep(0.1)
-                a += 1
+    def new_wallet_actor(wallet, flow):
+        # combined frames carry the wallet: the price stream drains the actor on
+        # every tick, the actor's own task only runs passes for orders
+        return WalletActor(wallet, flow, outbound, listen_ticks=not combined_mode,
+                           send_wallet=not combined_mode, send_acks=protocol in DELTA_PROTOCOLS,
+                           is_expired=is_session_expired,
+                           engine=None if combined_mode else wallet_engine)
 
-        except asyncio.CancelledError:
-            print("stream was cancelled handle_wallet")
-        except Exception as e:
-            print(f"error in stream: {e}")
+    async def wallet_encoded():
+        # in the session's framing, so it can be appended to pre-encoded frames
+        return codec.encode(await wallet_actor.drain())
+
+    async def stream_combined():
+        # one frame per tick: the price delta plus the post-tick wallet
+        last_wallet = await wallet_encoded()
+
+        def resync():
+            return codec.with_field(price_flow.resync_message(), "wallet", last_wallet)
+
+        await outbound.send_text(codec.with_field(price_flow.initial_message(), "wallet", last_wallet),
+                                 "prices", resync)
+
+        async def send(frame):
+            nonlocal last_wallet
+            last_wallet = await wallet_encoded()
+            await outbound.send_text(codec.with_field(frame, "wallet", last_wallet), "prices", resync)
+
+        await price_flow.run(send, start_delay=price_flow.tick_interval)
 
     async def stream_rows():
         try:
-            window = await price_flow.initialize_dict()
+            await price_flow.initialize_dict()
             window_size = price_flow.window_size
 
-            await websocket.send_json({"count": window_size, "window": window})
+            if combined_mode:
+                await stream_combined()
+                return
+
+            await outbound.send_text(price_flow.initial_message(), "prices", price_flow.resync_message)
             print(f"Sent initial window of {window_size} rows")
-            await asyncio.sleep(1)
-            await price_flow.handle_websocket_flow(websocket)
+            await price_flow.stream_to(outbound, start_delay=price_flow.tick_interval)
 
         except asyncio.CancelledError:
             print("Stream was cancelled stream_rows")
@@ -246,6 +342,17 @@ async def websocket_endpoint(websocket: WebSocket):
             print(f"Error in stream_rows: {e}")
             raise
 
+    async def stream_cohort(ticker):
+        # frames are pushed by the shared ticker, this task only tracks the subscription
+        try:
+            await ticker.finished.wait()
+        finally:
+            ticker.unsubscribe(outbound)
+
+    # orders sent before "start" queue up here (a new wallet is made on start);
+    # a cohort player has no price flow before joining, so there is nothing to trade on
+    wallet_actor = new_wallet_actor(futures_wallet, price_flow) if price_flow is not None else None
+
     try:
         timeout_task = asyncio.create_task(auto_close_after_timeout())
         
@@ -258,40 +365,55 @@ async def websocket_endpoint(websocket: WebSocket):
 
             if message == "start":
                 if sending_task is None or sending_task.done():
-                    futures_wallet = FuturesWallet(leverage=20, token_selection=random_token)
-                    sending_task = asyncio.create_task(stream_rows())
-                    handle_wallet_task = asyncio.create_task(handle_wallet())
+                    if cohort_mode:
+                        ticker = await cohort_hub.join(outbound, window_size, protocol, speed,
+                                                      encoding, price_scale, codec)
+                        price_flow = ticker.price_flow
+                        random_token = ticker.token
+                        futures_wallet = FuturesWallet(leverage=20, token_selection=random_token,
+                                                       klines=price_flow.klines)
+                        wallet_actor = new_wallet_actor(futures_wallet, price_flow)
+                        wallet_first_action = len(trade_actions)
+                        sending_task = asyncio.create_task(stream_cohort(ticker))
+                    else:
+                        futures_wallet = FuturesWallet(leverage=20, token_selection=random_token,
+                                                       klines=price_flow.klines)
+                        wallet_actor = new_wallet_actor(futures_wallet, price_flow)
+                        wallet_first_action = len(trade_actions)
+                        sending_task = asyncio.create_task(stream_rows())
+                    wallet_task = asyncio.create_task(wallet_actor.run())
 
                     await asyncio.sleep(0.01)
                     try:
-                        await websocket.send_text("Streaming started.")
+                        await outbound.send_text("Streaming started.")
                     except Exception:
                         break
                 else:
                     try:
-                        await websocket.send_text("Already streaming.")
+                        await outbound.send_text("Already streaming.")
                     except Exception:
                         break
 
             elif message == "stop":
                 if sending_task:
                     sending_task.cancel()
-                    handle_wallet_task.cancel()
+                    if wallet_task:
+                        wallet_task.cancel()
                     await asyncio.sleep(0.01)
                     try:
-                        await websocket.send_text("Streaming stopped.")
+                        await outbound.send_text("Streaming stopped.")
                     except Exception:
                         break
                 else:
                     try:
-                        await websocket.send_text("Nothing is streaming.")
+                        await outbound.send_text("Nothing is streaming.")
                     except Exception:
                         break
 
             elif message in ["long", "short", "close"]:
                 if is_rate_limited():
                     try:
-                        await websocket.send_json({
+                        await outbound.send_json({
                             "error": "Rate limit exceeded",
                             "message": "Maximum 15 actions per second"
                         })
@@ -299,42 +421,31 @@ async def websocket_endpoint(websocket: WebSocket):
                         break
                     continue
 
+                if wallet_actor is None:
+                    try:
+                        await outbound.send_text("Nothing is streaming.")
+                    except Exception:
+                        break
+                    continue
+
                 index = price_flow.current_index
+                step = price_flow.step
                 current_time = time.time()
-                
-                if message == "long":
-                    if debug_:
-                        print("long")
-                    await futures_wallet.push_order_long(index)
-                    trade_actions.append({
-                        "action": "long",
-                        "time": current_time,
-                        "index": index
-                    })
-
-                elif message == "short":
-                    if debug_:
-                        print("short")
-                    await futures_wallet.push_order_short(index)
-                    trade_actions.append({
-                        "action": "short",
-                        "time": current_time,
-                        "index": index
-                    })
-
-                elif message == "close":
-                    if debug_:
-                        print("close")
-                    await futures_wallet.push_close(index)
-                    trade_actions.append({
-                        "action": "close",
-                        "time": current_time,
-                        "index": index
-                    })
+
+                if debug_:
+                    print(message)
+                # the wallet actor executes it in arrival order at this index and acks it
+                await wallet_actor.submit(message, index, step)
+                trade_actions.append({
+                    "action": message,
+                    "time": current_time,
+                    "index": index,
+                    "step": step
+                })
 
             else:
                 try:
-                    await websocket.send_text(f"Message received: {message}")
+                    await outbound.send_text(f"Message received: {message}")
                 except Exception:
                     break
 
@@ -346,34 +457,56 @@ async def websocket_endpoint(websocket: WebSocket):
         # Cancel all tasks
         if sending_task:
             sending_task.cancel()
-        if handle_wallet_task:
-            handle_wallet_task.cancel()
+        if wallet_task:
+            wallet_task.cancel()
         if timeout_task:
             timeout_task.cancel()
+        outbound.stop()
         
         # Save session data to Firestore
         if fid and trade_actions:
             try:
+                # settle orders still in the inbox and mark to the last tick, so the
+                # result is exactly what game.replay_verify recomputes
+                await futures_wallet.consume_queue(price_flow.upcoming_ranges)
+                await futures_wallet.calculate_final_balance(price_flow.current_index, price_flow.step)
                 wallet_state = await futures_wallet.get_wallet_state()
                 final_profit = wallet_state.get('balance_total', 0.0)
                 if final_profit != 0.0:
                     final_profit = final_profit - 1000
                 final_pnl = final_profit/10 
                 
-                print(f"💾 Saving session {trade_env_id} with {len(trade_actions)} actions")
-                success = await firestore_manager.save_game_session_result(
+                result = dict(
                     fid=str(fid),
                     trade_env_id=trade_env_id,
                     actions=trade_actions,
                     final_pnl=final_pnl,
-                    final_profit=final_profit
+                    final_profit=final_profit,
+                    session={
+                        "token": futures_wallet.klines.name,
+                        "window_size": price_flow.window_size,
+                        "total_rows": price_flow.total_rows,
+                        "leverage": futures_wallet.leverage,
+                        "capital": futures_wallet.capital,
+                        "position_size": futures_wallet.position_size,
+                        "first_action": wallet_first_action,
+                        "final_index": price_flow.current_index,
+                        "final_step": price_flow.step,
+                    }
                 )
-                
-                if success:
-                    print(f"✅ Session saved successfully for FID: {fid}")
-                else:
-                    print(f"❌ Failed to save session for FID: {fid}")
-                    
+
+                print(f"💾 Journaling session {trade_env_id} with {len(trade_actions)} actions")
+                try:
+                    # the background flusher commits it to Firestore
+                    await session_journal.record(**result)
+                except Exception as e:
+                    print(f"❌ Journal write failed ({e}), saving session directly")
+                    success = await firestore_manager.save_game_session_result(**result)
+                    if success:
+                        print(f"✅ Session saved successfully for FID: {fid}")
+                    else:
+                        print(f"❌ Failed to save session for FID: {fid}")
+
             except Exception as e:
                 print(f"❌ Error saving session on disconnect: {e}")
 
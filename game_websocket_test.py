@@ -1,4 +1,4 @@
-from fastapi import FastAPI, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from game.price_flow import *
 from game.wallet import *
 import json, random
@@ -184,7 +184,7 @@ async def websocket_endpoint(websocket: WebSocket):
 
             print(f"Sent initial window of {window_size} rows")
             await asyncio.sleep(1)
-            await price_flow.handle_websocket_flow(websocket)
+            await price_flow.run(websocket.send_text)
 
         except asyncio.CancelledError:
             print("Stream was cancelled stream_rows")
@@ -5,3 +5,36 @@ timeout = 0
 keepalive = 75
 loglevel = "info"
 
+# Each worker owns its own token decryption pool (AUTH_POOL_WORKERS threads or
+# processes), so the host runs workers * AUTH_POOL_WORKERS crypto workers in total.
+# Check auth queue_wait / decode_time on /metrics of each worker when sizing it.
+
+
+def on_starting(server):
+    # convert new/changed parquet klines once in the master (unchanged ones are skipped);
+    # workers then map the binary files, or attach to the shared segment in "shm" mode
+    from configs.config import KLINE_BACKEND
+    from game.kline_binary import convert_klines, open_binary_klines
+    from game.kline_store import publish_shared_klines, memory_report
+
+    if KLINE_BACKEND == "parquet":
+        return
+
+    stats = convert_klines()
+    server.log.info(f"Kline conversion: {stats}")
+
+    if KLINE_BACKEND == "shm":
+        frames = open_binary_klines()
+        shm = publish_shared_klines(frames)
+        server.log.info(f"Published {len(frames)} kline sessions to shared memory "
+                        f"({shm.size / 1024 / 1024:.1f} MB)")
+        shm.close()
+    server.log.info(f"Master memory (MB): {memory_report()}")
+
+
+def on_exit(server):
+    from configs.config import KLINE_BACKEND
+    from game.kline_store import unlink_shared_klines
+
+    if KLINE_BACKEND == "shm":
+        unlink_shared_klines()
@@ -11,9 +11,10 @@ print(4)
 from htmls import *
 from fastapi.responses import HTMLResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
+from utils.json_utils import FastJSONResponse
 
 print(3)
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 #app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -2,10 +2,8 @@ from fastapi import APIRouter
 from fastapi import Request
 import json
 import base64
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
-from cryptography.hazmat.backends import default_backend
-from configs.config import SECRET
+from utils.auth_utils import decrypt_any
+from configs.config import SECRETS
 
 session_router = APIRouter()
 # change secret key and place in .env
@@ -24,7 +22,7 @@ async def start_session(request: Request):
             return {"error": "No encrypted_token provided"}
 
         # Decrypt the token
-        decrypted_json = decrypt(encrypted_token, SECRET)
+        decrypted_json = decrypt_any(encrypted_token, SECRETS)
         print("🔓 Decrypted message:", decrypted_json)
 
         # Parse the JSON payload
@@ -4,8 +4,11 @@ from storage.firestore_client import FirestoreManager
 from utils.route_utils import handle_streak
 from typing import Optional
 from fastapi import Request
+from utils.json_utils import FastJSONResponse
 
-user_router = APIRouter()
+# routes returning FastJSONResponse directly skip jsonable_encoder; utils.json_utils
+# renders Firestore timestamps itself and falls back to it for other types
+user_router = APIRouter(default_response_class=FastJSONResponse)
 firestore_manager = FirestoreManager()
 #giveaway_handler = GiveawayHandler(firestore_manager)
 
@@ -56,7 +59,7 @@ async def get_profile(
     print(latest_trades)
     updated["latest_trades"] = latest_trades
 
-    return updated
+    return FastJSONResponse(updated)
 
 @user_router.get("/leaderboard")
 async def get_leaderboard(fid: int, top_n: int = 10):
@@ -90,9 +93,9 @@ async def get_leaderboard(fid: int, top_n: int = 10):
     # Get leaderboard
     leaderboard = await firestore_manager.get_leaderboard(fid_str, top_n=top_n)
     
-    return {
+    return FastJSONResponse({
         "leaderboard": leaderboard
-    }
+    })
 
 @user_router.get("/leaderboard/weekly")
 async def get_weekly_leaderboard(fid: int, top_n: int = 10):
@@ -126,9 +129,9 @@ async def get_weekly_leaderboard(fid: int, top_n: int = 10):
     # Get weekly leaderboard
     leaderboard = await firestore_manager.get_weekly_leaderboard(fid_str, top_n=top_n)
     
-    return {
+    return FastJSONResponse({
         "leaderboard": leaderboard
-    }
+    })
 
 
 @user_router.get("/leaderboard/daily")
@@ -163,7 +166,7 @@ async def get_daily_leaderboard(fid: int, top_n: int = 5):
     # Get weekly leaderboard
     leaderboard = await firestore_manager.get_daily_leaderboard(fid_str, top_n=top_n)
 
-    return {
+    return FastJSONResponse({
         "leaderboard": leaderboard
-    }
+    })
 
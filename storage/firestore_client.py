@@ -1,4 +1,5 @@
 from google.cloud import firestore
+from google.api_core.exceptions import AlreadyExists, NotFound
 from google.cloud.firestore_v1.async_client import AsyncClient
 from datetime import datetime, timedelta
 import string, time, asyncio, random
@@ -267,6 +268,25 @@ class FirestoreManager:
             return doc.to_dict()
         return None
 
+    async def get_trade_decisions_between(self, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """
+        Get all trade decisions created in [start, end)
+
+        Args:
+            start: Inclusive lower bound of created_at
+            end: Exclusive upper bound of created_at
+
+        Returns:
+            List of trade decision documents
+        """
+        query = self.db.collection(self.trade_decisions_collection).where(
+            "created_at", ">=", start
+        ).where(
+            "created_at", "<", end
+        )
+        docs = await query.get()
+        return [doc.to_dict() for doc in docs]
+
     async def delete_user(self, fid: str) -> bool:
         """
         Delete a user and all associated data
@@ -327,7 +347,8 @@ class FirestoreManager:
             trade_env_id: str,
             actions: List[Dict[str, Any]],
             final_pnl: float,
-            final_profit: float
+            final_profit: float,
+            session: Optional[Dict[str, Any]] = None
     ) -> bool:
         """
         Save game session results and update user stats atomically
@@ -338,6 +359,8 @@ class FirestoreManager:
             actions: List of trade actions with timestamps
             final_pnl: Final PnL for this session
             final_profit: Final profit for this session
+            session: What the offline replay needs (token-session, window size,
+                wallet parameters, final tick), see game.replay_verify
 
         Returns:
             True if successful, False otherwise
@@ -352,6 +375,8 @@ class FirestoreManager:
                 "final_profit": final_profit,
                 "created_at": firestore.SERVER_TIMESTAMP
             }
+            if session is not None:
+                trade_decisions_data["session"] = session
             await self.db.collection(self.trade_decisions_collection).document(trade_env_id).set(
                 trade_decisions_data
             )
@@ -370,6 +395,81 @@ class FirestoreManager:
             print(f"Error saving game session result for {fid}: {e}")
             return False
 
+    async def save_game_session_results(self, results: List[Dict[str, Any]]) -> List[str]:
+        """
+        Idempotent batch version of save_game_session_result: results whose
+        trade_decisions document already exists are skipped, the rest are
+        written and their user totals incremented in one batch commit.
+        Documents are written with create(), so a result another writer
+        stored after the read fails the whole commit instead of being
+        counted twice; the batch is then retried one result at a time.
+        Like save_game_session_result, a result of a user without a users
+        document is stored without totals
+
+        Args:
+            results: Dicts with fid, trade_env_id, actions, final_pnl,
+                final_profit and optionally session
+
+        Returns:
+            trade_env_ids now stored (newly written or already present)
+        """
+        refs = {r["trade_env_id"]: self.db.collection(self.trade_decisions_collection).document(r["trade_env_id"])
+                for r in results}
+        user_refs = {r["fid"]: self.db.collection(self.users_collection).document(r["fid"]) for r in results}
+        user_paths = {ref.path for ref in user_refs.values()}
+        existing, users = set(), set()
+        async for snapshot in self.db.get_all([*refs.values(), *user_refs.values()]):
+            if snapshot.exists:
+                (users if snapshot.reference.path in user_paths else existing).add(snapshot.id)
+
+        batch = self.db.batch()
+        written = 0
+        totals = {}  # fid -> [games, profit, pnl]; one update per user
+        for r in results:
+            if r["trade_env_id"] in existing:
+                continue
+            trade_decisions_data = {
+                "fid": r["fid"],
+                "trade_env_id": r["trade_env_id"],
+                "actions": r["actions"],
+                "final_pnl": r["final_pnl"],
+                "final_profit": r["final_profit"],
+                "created_at": firestore.SERVER_TIMESTAMP
+            }
+            if r.get("session") is not None:
+                trade_decisions_data["session"] = r["session"]
+            batch.create(refs[r["trade_env_id"]], trade_decisions_data)
+            written += 1
+            if r["fid"] not in users:
+                # update() would fail the whole batch with NotFound
+                print(f"No user document for {r['fid']}, {r['trade_env_id']} stored without totals")
+                continue
+            total = totals.setdefault(r["fid"], [0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += r["final_profit"]
+            total[2] += r["final_pnl"]
+
+        for fid, (games, profit, pnl) in totals.items():
+            batch.update(user_refs[fid], {
+                "total_games": firestore.Increment(games),
+                "total_profit": firestore.Increment(profit),
+                "total_PnL": firestore.Increment(pnl),
+                "last_online": firestore.SERVER_TIMESTAMP
+            })
+
+        if written:
+            try:
+                await batch.commit()
+            except AlreadyExists:
+                # nothing of the batch was applied
+                if len(results) > 1:
+                    for r in results:
+                        await self.save_game_session_results([r])
+            except NotFound:
+                # a user document was deleted after the read: nothing applied, read again
+                await self.save_game_session_results(results)
+        return list(refs)
+
     async def get_leaderboard(self, fid: str, top_n: int = 10) -> List[Dict[str, Any]]:
         """
         Get leaderboard based on total_profit from users collection
@@ -0,0 +1,264 @@
+"""
+Write-behind journal of finished game sessions.
+
+The websocket endpoint records each result in a local SQLite database (WAL
+mode) and returns; a background flusher per worker commits the journal to
+Firestore in batches (FirestoreManager.save_game_session_results, idempotent
+on trade_env_id) with exponential backoff.
+
+All gunicorn workers share one journal file. A flusher leases the rows it
+sends, so a row is only in flight on one worker at a time; a worker that
+dies mid-flush leaves its lease to expire. On boot, leases held by processes
+that are gone are released right away and everything pending is replayed.
+"""
+import os
+import json
+import time
+import socket
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from configs.config import (get_session_journal_path, JOURNAL_FLUSH_INTERVAL, JOURNAL_BATCH_SIZE,
+                            JOURNAL_MAX_ATTEMPTS, JOURNAL_LEASE_SECONDS)
+from utils.json_utils import dumps
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_results (
+    trade_env_id TEXT PRIMARY KEY,
+    fid TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    flushed_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS session_results_pending ON session_results (status, next_attempt_at);
+"""
+
+# flushed rows are kept this long before being pruned
+DONE_RETENTION_SECONDS = 24 * 3600
+MAX_BACKOFF_SECONDS = 300.0
+
+
+class SessionJournal:
+    def __init__(self, path: Optional[str] = None, batch_size: int = JOURNAL_BATCH_SIZE,
+                 flush_interval: float = JOURNAL_FLUSH_INTERVAL, max_attempts: int = JOURNAL_MAX_ATTEMPTS,
+                 lease_seconds: float = JOURNAL_LEASE_SECONDS):
+        self.path = path or get_session_journal_path()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        # one thread owns the connection, so every statement runs in order off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-journal")
+        self._conn = None
+        self._task = None
+        self._wake = None
+        self.counters = {"recorded": 0, "flushed": 0, "retried": 0, "failed": 0, "replayed": 0,
+                         "loop_errors": 0}
+        self.last_flush_ms = None
+
+    # ---- connection thread -------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # survives process crashes; only an OS crash can lose the last commits
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _insert(self, trade_env_id: str, fid: str, payload: str):
+        conn = self._connect()
+        conn.execute("INSERT OR IGNORE INTO session_results (trade_env_id, fid, payload, created_at) "
+                     "VALUES (?, ?, ?, ?)", (trade_env_id, fid, payload, time.time()))
+
+    def _release_dead_leases(self) -> int:
+        """Releases leases of processes on this host that no longer run; returns the pending count"""
+        conn = self._connect()
+        host = socket.gethostname()
+        owners = conn.execute("SELECT DISTINCT lease_owner FROM session_results "
+                              "WHERE status = 'pending' AND lease_owner IS NOT NULL").fetchall()
+        for (owner,) in owners:
+            owner_host, _, pid = owner.rpartition(":")
+            if owner_host != host or owner == self.owner:
+                continue
+            try:
+                os.kill(int(pid), 0)
+                continue  # still alive
+            except ProcessLookupError:
+                pass
+            except (PermissionError, ValueError):
+                continue
+            conn.execute("UPDATE session_results SET lease_owner = NULL, lease_until = 0 "
+                         "WHERE status = 'pending' AND lease_owner = ?", (owner,))
+        return conn.execute("SELECT COUNT(*) FROM session_results WHERE status = 'pending'").fetchone()[0]
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        """Leases up to batch_size due rows to this worker"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT trade_env_id, payload, attempts FROM session_results "
+                "WHERE status = 'pending' AND next_attempt_at <= ? AND lease_until <= ? "
+                "ORDER BY created_at LIMIT ?", (now, now, self.batch_size)).fetchall()
+            conn.executemany("UPDATE session_results SET lease_owner = ?, lease_until = ? WHERE trade_env_id = ?",
+                             [(self.owner, now + self.lease_seconds, row[0]) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [{**json.loads(payload), "_attempts": attempts} for _, payload, attempts in rows]
+
+    def _mark_done(self, trade_env_ids: List[str]):
+        conn = self._connect()
+        now = time.time()
+        conn.executemany("UPDATE session_results SET status = 'done', flushed_at = ?, lease_owner = NULL, "
+                         "lease_until = 0 WHERE trade_env_id = ?", [(now, i) for i in trade_env_ids])
+        conn.execute("DELETE FROM session_results WHERE status = 'done' AND flushed_at < ?",
+                     (now - DONE_RETENTION_SECONDS,))
+
+    def _mark_retry(self, results: List[Dict[str, Any]], error: str) -> int:
+        """Backs the results off (or marks them failed); returns how many failed for good"""
+        conn = self._connect()
+        now = time.time()
+        failed = 0
+        for result in results:
+            attempts = result["_attempts"] + 1
+            if attempts >= self.max_attempts:
+                failed += 1
+                conn.execute("UPDATE session_results SET status = 'failed', attempts = ?, last_error = ?, "
+                             "lease_owner = NULL, lease_until = 0 WHERE trade_env_id = ?",
+                             (attempts, error, result["trade_env_id"]))
+            else:
+                delay = min(MAX_BACKOFF_SECONDS, self.flush_interval * 2 ** attempts)
+                conn.execute("UPDATE session_results SET attempts = ?, next_attempt_at = ?, last_error = ?, "
+                             "lease_owner = NULL, lease_until = 0 WHERE trade_env_id = ?",
+                             (attempts, now + delay, error, result["trade_env_id"]))
+        return failed
+
+    def _lag(self) -> Dict[str, Any]:
+        conn = self._connect()
+        now = time.time()
+        pending, oldest = conn.execute("SELECT COUNT(*), MIN(created_at) FROM session_results "
+                                       "WHERE status = 'pending'").fetchone()
+        failed = conn.execute("SELECT COUNT(*) FROM session_results WHERE status = 'failed'").fetchone()[0]
+        return {"pending": pending, "failed": failed,
+                "lag_seconds": round(now - oldest, 3) if oldest is not None else 0.0}
+
+    # ---- event loop side ---------------------------------------------------
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def record(self, fid: str, trade_env_id: str, actions: List[Dict[str, Any]], final_pnl: float,
+                     final_profit: float, session: Optional[Dict[str, Any]] = None):
+        """Durably records a session result; it reaches Firestore through the flusher"""
+        payload = dumps({"fid": fid, "trade_env_id": trade_env_id, "actions": actions, "final_pnl": final_pnl,
+                         "final_profit": final_profit, "session": session})
+        await self._run(self._insert, trade_env_id, fid, payload)
+        self.counters["recorded"] += 1
+        if self._wake is not None:
+            self._wake.set()
+
+    async def flush_once(self, firestore_manager) -> int:
+        """Sends one batch of due results; returns how many were stored"""
+        batch = await self._run(self._claim)
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        try:
+            stored = await self._send(firestore_manager, batch)
+        except Exception as e:
+            print(f"❌ Journal flush of {len(batch)} results failed: {e}")
+            if len(batch) == 1:
+                await self._retry(batch, e)
+                return 0
+            # one bad result must not hold the batch back: send them one by one
+            stored = []
+            for result in batch:
+                try:
+                    stored += await self._send(firestore_manager, [result])
+                except Exception as single_error:
+                    await self._retry([result], single_error)
+        if stored:
+            await self._run(self._mark_done, stored)
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self.counters["flushed"] += len(stored)
+        return len(stored)
+
+    @staticmethod
+    async def _send(firestore_manager, batch: List[Dict[str, Any]]) -> List[str]:
+        return await firestore_manager.save_game_session_results(
+            [{k: v for k, v in r.items() if k != "_attempts"} for r in batch])
+
+    async def _retry(self, results: List[Dict[str, Any]], error: Exception):
+        failed = await self._run(self._mark_retry, results, str(error))
+        self.counters["retried"] += len(results) - failed
+        self.counters["failed"] += failed
+
+    async def _flush_loop(self, firestore_manager):
+        errors = 0
+        try:
+            while True:
+                try:
+                    stored = await self.flush_once(firestore_manager)
+                    errors = 0
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # e.g. a locked or full journal: keep the flusher alive and back off
+                    errors += 1
+                    self.counters["loop_errors"] += 1
+                    delay = min(MAX_BACKOFF_SECONDS, self.flush_interval * 2 ** errors)
+                    print(f"❌ Journal flusher error ({e}), retrying in {delay:g}s")
+                    await asyncio.sleep(delay)
+                    continue
+                if stored >= self.batch_size:
+                    continue  # more may be due right away
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            pass
+
+    async def start(self, firestore_manager):
+        """Replays what earlier runs left pending, then starts the flusher"""
+        pending = await self._run(self._release_dead_leases)
+        self.counters["replayed"] = pending
+        if pending:
+            print(f"💾 Replaying {pending} journaled session results")
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop(firestore_manager))
+
+    async def stop(self, firestore_manager=None, timeout: float = 5.0):
+        """Stops the flusher after a last bounded flush; what is left stays journaled"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if firestore_manager is not None:
+            try:
+                await asyncio.wait_for(self.flush_once(firestore_manager), timeout=timeout)
+            except Exception as e:
+                print(f"Journal flush on shutdown failed: {e}")
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    async def metrics(self) -> Dict[str, Any]:
+        return {**self.counters, **await self._run(self._lag), "last_flush_ms": self.last_flush_ms,
+                "alive": self._task is not None and not self._task.done()}
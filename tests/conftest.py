@@ -0,0 +1,44 @@
+import os
+import atexit
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pytest
+import configs.config as config
+from benchmarks.sample_data import synthetic_klines
+from game.kline_store import KlineFrame
+
+KLINE_SCHEMA = {"time": "open_time", "open": "open", "high": "high", "low": "low", "close": "close",
+                "volume": "volume"}
+
+# game.data_preparation opens the klines directory on import: point the working
+# dir at synthetic sessions before any test module imports it
+_working_dir = tempfile.mkdtemp(prefix="tradcast-tests-")
+atexit.register(shutil.rmtree, _working_dir, ignore_errors=True)
+os.makedirs(os.path.join(_working_dir, "klines"))
+for _session in range(2):
+    synthetic_klines(rows=400, seed=_session).to_parquet(
+        os.path.join(_working_dir, "klines", f"TEST_1s_{_session}_synthetic.parquet"))
+config.working_dir = _working_dir
+
+
+def make_frame(df: pd.DataFrame, name: str = "test-session-0") -> KlineFrame:
+    return KlineFrame.from_dataframe(name, df, KLINE_SCHEMA)
+
+
+def crash_frame(rows=50, crash_row=10):
+    """Flat 1.0 closes with one bar whose low crashes to 0.5"""
+    low = np.full(rows, 0.999)
+    low[crash_row] = 0.5
+    return make_frame(pd.DataFrame({
+        "open_time": pd.date_range("2025-01-01", periods=rows, freq="1s"),
+        "open": np.ones(rows), "high": np.full(rows, 1.001), "low": low, "close": np.ones(rows),
+        "volume": np.ones(rows),
+    }))
+
+
+@pytest.fixture
+def frame():
+    """A synthetic kline session (1s bars)"""
+    return make_frame(synthetic_klines(rows=400, seed=3))
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import pytest
+import utils.auth_utils as auth_utils
+from utils.auth_utils import decrypt, decrypt_any, encrypt, get_cipher, AuthDecoder, AuthPoolSaturated
+
+OLD_SECRET, NEW_SECRET = "old-secret", "new-secret"
+
+
+def test_decrypt_round_trip_derives_the_key_once():
+    get_cipher.cache_clear()
+    token = encrypt('{"fid": 1}', NEW_SECRET)
+    assert decrypt(token, NEW_SECRET) == '{"fid": 1}'
+    assert decrypt(token, NEW_SECRET) == '{"fid": 1}'
+    assert get_cipher.cache_info().misses == 1
+
+
+def test_tokens_of_a_rotated_out_secret_still_decrypt():
+    old_token, new_token = encrypt('{"fid": 1}', OLD_SECRET), encrypt('{"fid": 2}', NEW_SECRET)
+    assert decrypt_any(old_token, ["", NEW_SECRET, OLD_SECRET]) == '{"fid": 1}'
+    assert decrypt_any(new_token, [NEW_SECRET, OLD_SECRET]) == '{"fid": 2}'
+    # once the old secret is dropped, its tokens are rejected
+    with pytest.raises(ValueError):
+        decrypt_any(old_token, [NEW_SECRET])
+
+
+def test_malformed_token_is_rejected():
+    with pytest.raises(ValueError):
+        decrypt_any("not-a-token", [NEW_SECRET])
+
+
+def test_keys_are_warmed_on_the_pool(monkeypatch):
+    warmed_on = []
+    warm = auth_utils.warm_key_cache
+    monkeypatch.setattr(auth_utils, "warm_key_cache",
+                        lambda secrets: (warmed_on.append(threading.current_thread().name), warm(secrets)))
+    token = encrypt('{"fid": 3}', OLD_SECRET)
+
+    async def scenario():
+        decoder = AuthDecoder([NEW_SECRET, OLD_SECRET], kind="thread", workers=1)
+        try:
+            return await decoder.decrypt(token)
+        finally:
+            decoder.shutdown()
+
+    assert asyncio.run(scenario()) == '{"fid": 3}'
+    assert len(warmed_on) == 1 and warmed_on[0].startswith("auth")
+
+
+def test_saturated_pool_rejects_at_once():
+    async def scenario():
+        decoder = AuthDecoder([NEW_SECRET], max_pending=0)
+        with pytest.raises(AuthPoolSaturated):
+            await decoder.decrypt(encrypt("{}", NEW_SECRET))
+        return decoder.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["rejected"] == 1 and metrics["pending"] == 0
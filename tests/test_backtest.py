@@ -0,0 +1,88 @@
+import sys
+import asyncio
+import numpy as np
+import pandas as pd
+import pytest
+from game.backtest import strategy_grid, momentum_returns, run_batch, main, STRATEGY_FIELDS
+from game.data_preparation import spike_df_map
+from game.price_flow import timeline_ranges
+from game.wallet import FuturesWallet, get_wallet_prices
+
+TOKENS = ["test-session-0", "test-session-1"]
+START = 30
+
+
+def grid():
+    return strategy_grid([3, 10], [0.0005, 0.002], [0.0, 0.5], [20, 200], [100, 400])
+
+
+class CountingWallet(FuturesWallet):
+    liquidations = 0
+
+    async def liq_position(self):
+        self.liquidations += 1
+        await super().liq_position()
+
+
+def run_wallet(frame, strategy, start):
+    """One strategy through FuturesWallet, as a session plays it: one order per bar at most"""
+    async def play():
+        wallet = CountingWallet(leverage=strategy["leverage"], klines=frame)
+        wallet.position_size = strategy["position_size"]
+        lookback = int(strategy["lookback"])
+        returns = momentum_returns(np.asarray(wallet.prices.close), np.array([lookback]))[0]
+        trades = 0
+
+        def upcoming_ranges(step):
+            return timeline_ranges(step, start + step, start, len(frame))
+
+        for step, t in enumerate(range(start, len(frame))):
+            r = returns[t]
+            if r > strategy["threshold"]:
+                action = "long"
+            elif r < -strategy["threshold"]:
+                action = "short"
+            elif abs(r) < strategy["threshold"] * strategy["exit_ratio"]:
+                action = "close"
+            else:
+                action = None
+            if action is not None:
+                await wallet.push_order(action, t, step)
+                trades += sum(accepted for _, _, accepted in await wallet.consume_queue(upcoming_ranges))
+            await wallet.calculate_final_balance(t, step)
+        return wallet.balance_total, trades, wallet.liquidations
+
+    return asyncio.run(play())
+
+
+@pytest.mark.parametrize("token", TOKENS)
+def test_batch_matches_the_wallet_rules(token):
+    frame = spike_df_map[token]
+    strategies = grid()
+    prices = get_wallet_prices(frame)
+    close, low, high = (np.frombuffer(arr, dtype=np.float64) for arr in (prices.close, prices.low, prices.high))
+    batch = run_batch(close, low, high, strategies, START)
+
+    expected = [run_wallet(frame, {name: strategies[name][k] for name in STRATEGY_FIELDS}, START)
+                for k in range(len(strategies["leverage"]))]
+    balances, trades, liquidations = (np.array(values) for values in zip(*expected))
+    assert np.allclose(batch["final_balance"], balances, rtol=1e-12, atol=1e-9)
+    assert batch["trades"].tolist() == trades.tolist()
+    assert batch["liquidations"].tolist() == liquidations.tolist()
+    # the grid exercises every rule
+    assert trades.sum() > 0 and liquidations.sum() > 0 and (balances != 1000.0).any()
+
+
+def test_run_backtest_writes_the_summary(tmp_path, monkeypatch):
+    out, details = str(tmp_path / "summary.parquet"), str(tmp_path / "details.parquet")
+    monkeypatch.setattr(sys, "argv", ["backtest", "--lookbacks", "3", "--thresholds", "0.001", "0.002",
+                                      "--exit-ratios", "0.5", "--leverages", "20", "--position-sizes", "100",
+                                      "--start", str(START), "--workers", "1", "--out", out, "--details", details])
+    main()
+
+    summary, per_token = pd.read_parquet(out), pd.read_parquet(details)
+    assert len(summary) == 2 and (summary["tokens"] == 2).all()
+    assert summary["lookback"].tolist() == [3, 3]
+    assert len(per_token) == 4 and sorted(set(per_token["token"])) == TOKENS
+    mean = per_token.groupby("threshold")["profit"].mean().to_numpy()
+    assert np.allclose(summary["mean_profit"].to_numpy(), mean)
@@ -0,0 +1,46 @@
+import asyncio
+from game.cohort import CohortHub, cohort_token, cohort_slot
+from game.framing import JSON_CODEC
+from game.price_flow import PROTOCOL_DELTA
+
+
+class RecordingOutbound:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    async def send_text(self, text, kind=None, resync=None):
+        if self.fail:
+            raise ConnectionError("closed")
+        self.sent.append(text)
+
+
+def test_slot_picks_the_same_token_everywhere():
+    assert cohort_token(12345) == cohort_token(12345)
+    assert cohort_slot(3600.5) == cohort_slot(3600.5)
+
+
+def test_players_of_a_slot_share_one_ticker():
+    async def scenario():
+        hub = CohortHub()
+        first, second, third = RecordingOutbound(), RecordingOutbound(), RecordingOutbound(fail=True)
+        ticker = await hub.join(first, 30, PROTOCOL_DELTA, codec=JSON_CODEC)
+        same = await hub.join(second, 30, PROTOCOL_DELTA, codec=JSON_CODEC)
+        other = await hub.join(RecordingOutbound(), 60, PROTOCOL_DELTA, codec=JSON_CODEC)
+        ticker.subscribers.add(third)
+        # one encoded frame fans out; a closed socket is dropped
+        await ticker.broadcast("frame")
+        metrics = hub.metrics()
+        await asyncio.sleep(0)  # the tickers wait for the slot boundary
+        for t in (ticker, other):
+            t.task.cancel()
+        await asyncio.gather(ticker.task, other.task)
+        return ticker, same, other, first, second, metrics, hub
+
+    ticker, same, other, first, second, metrics, hub = asyncio.run(scenario())
+    assert same is ticker and other is not ticker
+    assert ticker.price_flow.klines.name == ticker.token
+    assert first.sent == second.sent == [ticker.initial, "frame"]
+    assert metrics == {"tickers": 2, "subscribers": 3}
+    # finished tickers leave the hub
+    assert hub.metrics()["tickers"] == 0
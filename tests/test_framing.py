@@ -0,0 +1,53 @@
+import json
+import pytest
+from game.framing import negotiate_framing, JSON_CODEC
+from game.tick_table import TickTable, ColumnarTickTable
+
+msgpack = pytest.importorskip("msgpack")
+cbor2 = pytest.importorskip("cbor2")
+
+DECODERS = {"msgpack": msgpack.unpackb, "cbor": cbor2.loads}
+
+
+def messages(table, indices):
+    out = [table.snapshot_message(indices, 3), table.delta_message(indices[-1], 4),
+           table.coalesced_delta_message(indices[-3:], 5)]
+    if isinstance(table, TickTable):
+        out += [table.initial_message(indices), table.prices_message(indices[-1], indices)]
+    return out
+
+
+@pytest.mark.parametrize("framing", sorted(DECODERS))
+@pytest.mark.parametrize("make", [
+    lambda frame, codec: TickTable(frame, codec),
+    lambda frame, codec: ColumnarTickTable(frame, None, codec),
+    lambda frame, codec: ColumnarTickTable(frame, 6, codec),
+])
+def test_pre_encoded_frames_match_json(frame, framing, make):
+    codec = negotiate_framing(framing)
+    assert codec.name == framing
+    indices = list(range(20, 80))
+    for text, binary in zip(messages(make(frame, JSON_CODEC), indices), messages(make(frame, codec), indices)):
+        assert DECODERS[framing](binary) == json.loads(text)
+
+
+@pytest.mark.parametrize("framing", sorted(DECODERS))
+def test_with_field_appends_to_binary_message(frame, framing):
+    codec = negotiate_framing(framing)
+    wallet = {"balance_total": 1012.5, "direction": "long"}
+    message = codec.with_field(TickTable(frame, codec).delta_message(10, 1), "wallet", codec.encode(wallet))
+    expected = json.loads(JSON_CODEC.with_field(TickTable(frame).delta_message(10, 1), "wallet",
+                                                JSON_CODEC.encode(wallet)))
+    assert DECODERS[framing](message) == expected
+
+
+def test_status_strings():
+    assert JSON_CODEC.status("Streaming started.") == "Streaming started."
+    codec = negotiate_framing("msgpack")
+    assert msgpack.unpackb(codec.status("Streaming started.")) == {"type": "status",
+                                                                   "message": "Streaming started."}
+
+
+def test_unknown_framing_falls_back_to_json():
+    assert negotiate_framing("protobuf") is JSON_CODEC
+    assert negotiate_framing(None) is JSON_CODEC
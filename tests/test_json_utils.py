@@ -0,0 +1,34 @@
+import json
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+from fastapi.encoders import jsonable_encoder
+from utils.json_utils import dumps, dumps_bytes, FastJSONResponse
+
+firestore = pytest.importorskip("google.cloud.firestore")
+from google.cloud.firestore_v1 import GeoPoint
+from google.cloud.firestore_v1.document import DocumentReference
+
+
+def test_firestore_values_render_like_jsonable_encoder():
+    doc = {"location": GeoPoint(1.5, 2.0), "avatar": b"abc", "ref": DocumentReference("users", "42", client=None)}
+    assert json.loads(dumps(doc)) == jsonable_encoder(doc)
+
+
+def test_timestamps_numpy_and_server_timestamp():
+    created = datetime(2026, 10, 17, 12, 30, tzinfo=timezone.utc)
+    doc = {"created_at": created, "pnl": np.float64(4.25), "games": np.int64(3), "updated_at": firestore.SERVER_TIMESTAMP}
+    assert json.loads(dumps(doc)) == {"created_at": created.isoformat(), "pnl": 4.25, "games": 3, "updated_at": None}
+
+
+def test_only_the_firestore_sentinel_becomes_null():
+    class Sentinel:
+        def __init__(self):
+            self.description = "not firestore"
+
+    assert json.loads(dumps({"value": Sentinel()})) == {"value": {"description": "not firestore"}}
+
+
+def test_response_renders_through_dumps_bytes():
+    content = {"leaderboard": [{"username": "trader", "total_profit": np.float32(1.5)}]}
+    assert FastJSONResponse(content).body == dumps_bytes(content)
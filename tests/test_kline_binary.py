@@ -0,0 +1,70 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from configs.config import get_klines_dir
+from benchmarks.sample_data import synthetic_klines
+from game.kline_store import iter_kline_files, load_parquet_frame
+import game.kline_binary as kline_binary
+from game.kline_binary import convert_klines, open_binary_klines, binary_session_loaders, read_manifest
+
+
+@pytest.fixture
+def klines_dir(tmp_path):
+    """A copy of the synthetic parquet sessions the converter may modify"""
+    path = tmp_path / "klines"
+    shutil.copytree(get_klines_dir(), path)
+    return str(path)
+
+
+def test_converted_sessions_match_the_parquet_files(klines_dir, tmp_path):
+    out_dir = str(tmp_path / "klines_bin")
+    assert convert_klines(klines_dir, out_dir, start_index=5) == \
+        {"converted": 2, "unchanged": 0, "removed": 0, "failed": 0}
+
+    frames = open_binary_klines(out_dir)
+    for token, fp in iter_kline_files(klines_dir):
+        expected, frame = load_parquet_frame(token, fp, 5), frames[token]
+        assert frame.columns == expected.columns and len(frame) == len(expected)
+        for col in expected.columns:
+            assert frame[col].dtype == expected[col].dtype
+            assert np.array_equal(frame[col], expected[col])
+        assert frame.row(7) == expected.row(7)
+
+    loaders, sizes = binary_session_loaders(out_dir)
+    assert set(loaders) == set(frames)
+    assert all(sizes[token] == frames[token].nbytes for token in frames)
+
+
+def test_only_changed_sessions_are_reconverted(klines_dir, tmp_path):
+    out_dir = str(tmp_path / "klines_bin")
+    convert_klines(klines_dir, out_dir, start_index=0)
+    assert convert_klines(klines_dir, out_dir, start_index=0)["unchanged"] == 2
+
+    files = dict(iter_kline_files(klines_dir))
+    synthetic_klines(rows=300, seed=42).to_parquet(files["test-session-0"])
+    os.remove(files["test-session-1"])
+    assert convert_klines(klines_dir, out_dir, start_index=0) == \
+        {"converted": 1, "unchanged": 0, "removed": 1, "failed": 0}
+
+    manifest = read_manifest(out_dir)
+    assert list(manifest["sessions"]) == ["test-session-0"]
+    assert manifest["sessions"]["test-session-0"]["rows"] == 300
+    assert not os.path.exists(os.path.join(out_dir, "test-session-1.klines"))
+
+    # a changed start index invalidates every session
+    assert convert_klines(klines_dir, out_dir, start_index=3)["converted"] == 1
+
+
+def test_opening_without_a_manifest_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        open_binary_klines(str(tmp_path))
+    with pytest.raises(FileNotFoundError):
+        binary_session_loaders(str(tmp_path))
+
+
+def test_a_new_price_tolerance_reconverts(klines_dir, tmp_path, monkeypatch):
+    out_dir = str(tmp_path / "klines_bin")
+    convert_klines(klines_dir, out_dir)
+    monkeypatch.setattr(kline_binary, "KLINE_PRICE_RTOL", 1e-3)
+    assert convert_klines(klines_dir, out_dir)["converted"] == 2
@@ -0,0 +1,128 @@
+import os
+import asyncio
+import numpy as np
+import pytest
+from benchmarks.sample_data import synthetic_klines
+from game.kline_store import (KlineFrame, LazyKlineCatalog, project_columns, load_parquet_frame, price_dtype,
+                              load_kline_frames, publish_shared_klines, SharedKlineStore, unlink_shared_klines,
+                              ALIGNMENT)
+from game.tick_table import get_tick_table, cached_tick_table
+from tests.conftest import make_frame, KLINE_SCHEMA
+
+
+def catalog(budget_frames: float, tokens=("a", "b", "c")):
+    loaders = {token: (lambda token=token: make_frame(synthetic_klines(rows=400, seed=ord(token)), token))
+               for token in tokens}
+    frame_bytes = loaders[tokens[0]]().nbytes
+    return LazyKlineCatalog(loaders, int(budget_frames * frame_bytes)), frame_bytes
+
+
+def test_derived_tables_are_charged_to_the_budget():
+    klines, frame_bytes = catalog(2.5)
+    a, b = klines["a"], klines["b"]
+    assert klines.cached_bytes == 2 * frame_bytes
+
+    table = get_tick_table(b)
+    # the JSON table outweighs the columns: "a" (least recently used) is dropped
+    assert table.nbytes > frame_bytes
+    assert not klines.is_cached("a") and klines.is_cached("b")
+    assert klines.cached_bytes == frame_bytes + table.nbytes
+    assert cached_tick_table(b) is table
+
+    # a table built on an evicted frame still referenced by a game is not charged
+    get_tick_table(a)
+    assert klines.cached_bytes == frame_bytes + table.nbytes
+    assert klines.stats()["evictions"] == 1
+
+
+def test_least_recently_used_sessions_are_evicted_over_budget():
+    klines, frame_bytes = catalog(2)
+    a = klines["a"]
+    klines["b"]
+    assert klines["a"] is a  # hit, "b" is now the least recently used
+    klines["c"]
+    assert [token for token in klines if klines.is_cached(token)] == ["a", "c"]
+    assert klines.cached_bytes == 2 * frame_bytes
+    assert (klines.hits, klines.misses, klines.evictions) == (1, 3, 1)
+    # an evicted session is loaded again on its next lookup
+    assert klines["b"] is not None and klines.misses == 4
+
+
+def test_a_session_over_budget_stays_cached_alone():
+    klines, _ = catalog(0.5)
+    klines["a"], klines["b"]
+    assert [token for token in klines if klines.is_cached(token)] == ["b"]
+
+
+def test_prefetch_caches_the_session():
+    klines, _ = catalog(3)
+    frame = asyncio.run(klines.prefetch("a"))
+    assert klines.is_cached("a") and asyncio.run(klines.prefetch("a")) is frame
+    assert (klines.hits, klines.misses) == (1, 1)
+
+
+def test_projection_resolves_the_schema_and_reads_only_its_columns(tmp_path):
+    df = synthetic_klines(rows=50, seed=1).rename(columns={"open_time": "Timestamp", "close": "CLOSE"})
+    df["trades"] = np.arange(50)
+    fp = str(tmp_path / "X_1s_0_test.parquet")
+    df.to_parquet(fp)
+
+    projection = project_columns(fp)
+    assert projection["time"] == "Timestamp" and projection["close"] == "CLOSE"
+    frame = load_parquet_frame("x-session-0", fp)
+    assert "trades" not in frame.columns
+    assert np.array_equal(frame["close"], df["CLOSE"].to_numpy())
+
+    df.drop(columns=["low"]).to_parquet(fp)
+    with pytest.raises(ValueError, match="low"):
+        project_columns(fp)
+
+
+def test_price_dtype_policies():
+    exact = np.array([0.5, 1.25, 3.0])
+    noisy = np.array([0.1234567891234, 1.0])
+    assert price_dtype(noisy, "float64") == np.float64
+    assert price_dtype(noisy, "float32") == np.float32
+    assert price_dtype(exact, "auto") == np.float32
+    assert price_dtype(noisy, "auto", rtol=1e-12) == np.float64
+    assert price_dtype(np.arange(3), "float32") == np.arange(3).dtype
+    with pytest.raises(ValueError):
+        price_dtype(exact, "float16")
+
+
+def test_downcast_prices_keep_their_shortest_repr():
+    frame = make_frame(synthetic_klines(rows=20, seed=2))
+    small = KlineFrame.from_dataframe("s", synthetic_klines(rows=20, seed=2), KLINE_SCHEMA, "float32")
+    assert small["close"].dtype == np.float32 and small["volume"].dtype == np.float64
+    assert small.nbytes < frame.nbytes
+    assert small.row(3)["close"] == float(str(np.float32(frame["close"][3])))
+
+
+def test_every_parquet_session_loads_in_parallel():
+    frames = load_kline_frames(threads=2)
+    assert sorted(frames) == ["test-session-0", "test-session-1"]
+    assert all(len(frame) == 400 for frame in frames.values())
+
+
+def test_shared_segment_round_trip():
+    name = f"tradcast_test_{os.getpid()}"
+    frames = {"a": make_frame(synthetic_klines(rows=30, seed=1), "a"),
+              "b": make_frame(synthetic_klines(rows=40, seed=2), "b")}
+    shm = publish_shared_klines(frames, name)
+    try:
+        store = SharedKlineStore(name)
+        assert sorted(store) == ["a", "b"]
+        for token, frame in frames.items():
+            shared = store[token]
+            assert shared.columns == frame.columns and shared.schema == frame.schema
+            assert all(np.array_equal(shared[col], frame[col]) for col in frame.columns)
+            assert shared.row(5) == frame.row(5)
+            assert not shared["close"].flags.writeable
+            # columns sit at aligned offsets of the segment
+            assert all(shared[col].ctypes.data % ALIGNMENT == 0 for col in shared.columns)
+        store.shm.close()
+    finally:
+        shm.close()
+        unlink_shared_klines(name)
+    with pytest.raises(FileNotFoundError):
+        SharedKlineStore(name)
@@ -0,0 +1,99 @@
+import random
+import asyncio
+import numpy as np
+import pytest
+from game.liquidation import SparseExtremaTable, LiquidationIndex
+from game.price_flow import timeline_ranges, REPLAY_PASSES
+from game.wallet import FuturesWallet
+from tests.conftest import crash_frame
+
+
+def scan_crossing(values, value, start, stop, use_max):
+    for i in range(max(start, 0), min(stop, len(values))):
+        if (values[i] >= value) if use_max else (values[i] <= value):
+            return i
+    return None
+
+
+def scan_liquidation(low, high, entry, direction, leverage, start, stop):
+    """The wallet's own per-bar test, row by row"""
+    for i in range(max(start, 0), min(stop, len(low))):
+        if direction == "long" and (low[i] - entry) / entry * leverage <= -1.0:
+            return i
+        if direction == "short" and (high[i] - entry) / entry * leverage >= 1.0:
+            return i
+    return None
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 65, 257])
+@pytest.mark.parametrize("use_max", [False, True])
+def test_first_crossing_matches_scan(size, use_max):
+    rng = np.random.default_rng(size)
+    values = rng.normal(0, 1, size)
+    table = SparseExtremaTable(values, use_max=use_max)
+    for _ in range(300):
+        start = int(rng.integers(-2, size + 2))
+        stop = int(rng.integers(start, size + 3)) if start < size + 2 else size
+        # thresholds at the stored values exercise the <= / >= boundary
+        value = float(rng.choice(values)) if rng.random() < 0.5 else float(rng.normal(0, 1.5))
+        assert table.first_crossing(value, start, stop) == scan_crossing(values, value, start, stop, use_max)
+
+
+def test_find_matches_the_wallet_predicate():
+    rng = np.random.default_rng(11)
+    close = 0.05 * np.exp(np.cumsum(rng.normal(0, 0.01, 500)))
+    low = close * (1 - np.abs(rng.normal(0, 0.01, 500)))
+    high = close * (1 + np.abs(rng.normal(0, 0.01, 500)))
+    index = LiquidationIndex(low, high)
+    for _ in range(2000):
+        direction = random.choice(["long", "short"])
+        leverage = random.choice([5, 10, 20, 40, 100])
+        start = random.randrange(500)
+        stop = random.randrange(start, 501)
+        entry = float(close[random.randrange(500)])
+        if random.random() < 0.3:
+            # entries right at the liquidation threshold of some bar
+            bar = random.randrange(500)
+            entry = float(low[bar] / (1 - 1 / leverage) if direction == "long" else high[bar] / (1 + 1 / leverage))
+        assert index.find(entry, direction, leverage, start, stop) == \
+            scan_liquidation(low, high, entry, direction, leverage, start, stop)
+
+
+def test_schedule_liquidation_crosses_into_the_next_pass():
+    window_size, frame = 5, crash_frame()
+    total_rows = len(frame)
+    span = total_rows - window_size
+    wallet = FuturesWallet(leverage=10, klines=frame)
+    # opened at row 30 in the first pass: rows 31.. never reach the crash at row 10,
+    # which comes back at step span + (10 - window_size) in the second pass
+    step = 30 - window_size
+    asyncio.run(wallet.add_long(30))
+    assert wallet.schedule_liquidation(timeline_ranges(step, 30, window_size, total_rows)) == \
+        (span + 10 - window_size, 10)
+
+    # once in the last pass there is nothing left to replay
+    wallet.liquidation = None
+    last_step = (REPLAY_PASSES - 1) * span + 30 - window_size
+    assert wallet.schedule_liquidation(timeline_ranges(last_step, 30, window_size, total_rows)) is None
+
+
+def test_schedule_liquidation_matches_tick_by_tick_replay(frame):
+    window_size = 30
+    total_rows = len(frame)
+    timeline = list(range(window_size, total_rows)) * REPLAY_PASSES
+    low, high = frame["low"], frame["high"]
+    rng = random.Random(5)
+    for _ in range(200):
+        step = rng.randrange(len(timeline))
+        row = timeline[step]
+        wallet = FuturesWallet(leverage=rng.choice([20, 50, 100]), klines=frame)
+        asyncio.run(wallet.add_long(row) if rng.random() < 0.5 else wallet.add_short(row))
+        scheduled = wallet.schedule_liquidation(timeline_ranges(step, row, window_size, total_rows))
+
+        expected = None
+        for later in range(step, len(timeline)):
+            i = timeline[later]
+            if scan_liquidation(low, high, wallet.average_price, wallet.direction, wallet.leverage, i, i + 1) is not None:
+                expected = (later, i)
+                break
+        assert scheduled == expected
@@ -0,0 +1,118 @@
+import asyncio
+import pytest
+from game.outbound import OutboundQueue, OutboundClosed, OVERFLOW_CLOSE_CODE
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=""):
+        self.closed_with = code
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_pending_price_frame_is_coalesced():
+    async def scenario():
+        socket = RecordingSocket()
+        queue = OutboundQueue(socket)
+        await queue.send_text("p1", "prices")
+        await queue.send_text("p2", "prices")
+        await queue.send_text("ack", None)
+        await queue.send_text("p3", "prices")
+        queue.start()
+        await asyncio.sleep(0.01)
+        queue.stop()
+        return socket.sent, queue.counters
+
+    sent, counters = run(scenario())
+    # p3 replaces p2 in the slot p1 opened, ahead of the ack
+    assert sent == ["p3", "ack"]
+    assert counters["coalesced"] == 2
+
+
+def test_coalesced_delta_frame_becomes_resync_snapshot():
+    async def scenario():
+        socket = RecordingSocket()
+        queue = OutboundQueue(socket)
+        await queue.send_text("d1", "prices", lambda: "snapshot")
+        await queue.send_text("d2", "prices", lambda: "snapshot")
+        queue.start()
+        await asyncio.sleep(0.01)
+        queue.stop()
+        return socket.sent
+
+    assert run(scenario()) == ["snapshot"]
+
+
+def test_dropped_delta_frame_owes_a_resync():
+    async def scenario():
+        socket = RecordingSocket()
+        queue = OutboundQueue(socket, max_frames=2)
+        await queue.send_text("a1", None)
+        await queue.send_text("a2", None)
+        # queue full and no pending price frame: dropped, a snapshot is owed
+        accepted = await queue.send_text("d1", "prices", lambda: "snapshot")
+        queue.start()
+        await asyncio.sleep(0.01)
+        await queue.send_text("d2", "prices", lambda: "snapshot")
+        await asyncio.sleep(0.01)
+        await queue.send_text("d3", "prices", lambda: "snapshot")
+        await asyncio.sleep(0.01)
+        queue.stop()
+        return accepted, socket.sent, queue.counters
+
+    accepted, sent, counters = run(scenario())
+    assert accepted is False
+    assert sent == ["a1", "a2", "snapshot", "d3"]
+    assert counters["dropped"] == 1
+    assert counters["resyncs"] == 1
+
+
+def test_dropped_wallet_frame_reports_false():
+    async def scenario():
+        queue = OutboundQueue(RecordingSocket(), max_frames=1)
+        await queue.send_text("a1", None)
+        return await queue.send_json({"type": "wallet"}, kind="wallet")
+
+    assert run(scenario()) is False
+
+
+def test_non_coalescible_overflow_disconnects():
+    async def scenario():
+        socket = RecordingSocket()
+        queue = OutboundQueue(socket, max_frames=2)
+        await queue.send_text("a1", None)
+        await queue.send_text("a2", None)
+        with pytest.raises(OutboundClosed):
+            await queue.send_text("a3", None)
+        await asyncio.sleep(0.01)
+        with pytest.raises(OutboundClosed):
+            await queue.send_text("a4", None)
+        return socket.closed_with, queue.metrics()
+
+    closed_with, metrics = run(scenario())
+    assert closed_with == OVERFLOW_CLOSE_CODE
+    assert metrics["queued"] == 0
+
+
+def test_byte_bound_applies_to_every_kind():
+    async def scenario():
+        queue = OutboundQueue(RecordingSocket(), max_bytes=10)
+        await queue.send_text("12345678", None)
+        dropped = await queue.send_text("abc", "prices")
+        with pytest.raises(OutboundClosed):
+            await queue.send_text("abc", None)
+        return dropped
+
+    assert run(scenario()) is False
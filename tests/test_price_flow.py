@@ -0,0 +1,75 @@
+import json
+import asyncio
+from game.data_preparation import prefetch_klines, spike_df_map
+from game.framing import JSON_CODEC
+from game.price_flow import (PriceFlow, PROTOCOL_DELTA, PROTOCOL_LEGACY, ENCODING_COLUMNAR, ENCODING_ROWS,
+                             negotiate_protocol, negotiate_speed, negotiate_window_size, TICK_INTERVAL,
+                             MAX_WINDOW_SIZE, DEFAULT_WINDOW_SIZE)
+from game.tick_table import cached_stream_table, ColumnarTickTable
+from game.wallet import FuturesWallet
+
+TOKEN = "test-session-1"
+
+
+def test_prefetch_builds_the_table_the_session_streams_from():
+    frame = asyncio.run(prefetch_klines(TOKEN, JSON_CODEC, ENCODING_COLUMNAR, 4))
+    table = cached_stream_table(frame, JSON_CODEC, ENCODING_COLUMNAR, 4)
+    assert isinstance(table, ColumnarTickTable) and table.price_scale == 4
+    assert spike_df_map._charged[TOKEN] >= frame.nbytes + table.nbytes
+
+    flow = PriceFlow(window_size=30, token_selection=TOKEN, protocol=PROTOCOL_DELTA,
+                     encoding=ENCODING_COLUMNAR, price_scale=4, klines=frame)
+    assert flow.klines is frame and flow.ticks is table
+
+
+def test_legacy_sessions_stream_rows():
+    frame = asyncio.run(prefetch_klines(TOKEN, JSON_CODEC, ENCODING_ROWS))
+    flow = PriceFlow(window_size=30, token_selection=TOKEN, protocol=PROTOCOL_LEGACY,
+                     encoding=ENCODING_COLUMNAR, price_scale=4, klines=frame)
+    assert flow.encoding == ENCODING_ROWS
+    assert flow.ticks is cached_stream_table(frame, JSON_CODEC)
+
+
+def test_prefetch_builds_the_wallet_tables():
+    frame = asyncio.run(prefetch_klines(TOKEN))
+    prices, index = frame.cached_derived("wallet_prices"), frame.cached_derived("liquidation_index")
+    assert prices is not None and index is not None
+    wallet = FuturesWallet(token_selection=TOKEN, klines=frame)
+    assert wallet.prices is prices and wallet.lookahead is index
+
+
+def test_protocol_negotiation():
+    assert negotiate_protocol(None) == PROTOCOL_LEGACY
+    assert negotiate_protocol("2") == PROTOCOL_DELTA
+    assert negotiate_protocol(9) == PROTOCOL_LEGACY
+
+
+def test_delta_stream_numbers_its_frames_and_resyncs():
+    flow = PriceFlow(window_size=30, token_selection=TOKEN, protocol=PROTOCOL_DELTA)
+    asyncio.run(flow.initialize_dict())
+    snapshot = json.loads(flow.initial_message())
+    assert (snapshot["type"], snapshot["seq"], snapshot["count"]) == ("snapshot", 0, 30)
+
+    frames = []
+    for i in (30, 31, 32):
+        flow.advance(i)
+        frames.append(json.loads(flow.tick_message([i])))
+    assert [(f["seq"], f["count"], f["row"]) for f in frames] == \
+        [(n + 1, i + 1, flow.klines.row(i)) for n, i in enumerate((30, 31, 32))]
+
+    resync = json.loads(flow.resync_message())
+    assert (resync["type"], resync["seq"]) == ("snapshot", 3)
+    assert resync["window"] == [flow.klines.row(i) for i in range(3, 33)]
+
+
+def test_speed_negotiation_scales_the_tick_pacing():
+    assert [negotiate_speed(s) for s in ("1x", "2X", 5, "turbo", "3x", None, True)] == \
+        [1.0, 2.0, 5.0, 10.0, 1.0, 1.0, 1.0]
+    flow = PriceFlow(window_size=30, token_selection=TOKEN, speed=negotiate_speed("5x"))
+    assert flow.tick_interval == TICK_INTERVAL / 5
+    assert flow.scheduler.interval == flow.tick_interval
+
+
+def test_window_size_negotiation():
+    assert [negotiate_window_size(n) for n in (30, "45", 0, 10 ** 6, "x")] == \
+        [30, 45, 1, MAX_WINDOW_SIZE, DEFAULT_WINDOW_SIZE]
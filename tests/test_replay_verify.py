@@ -0,0 +1,72 @@
+import random
+import asyncio
+from game.price_flow import PriceFlow
+from game.wallet import FuturesWallet
+from game.wallet_actor import WalletActor
+from game.data_preparation import spike_df_map
+from game.replay_verify import replay_session, verify_token_batch
+
+TOKEN = "test-session-0"
+
+
+class NullOutbound:
+    async def send_json(self, data, kind=None):
+        return True
+
+
+async def live_session(seed, window_size=30):
+    """Plays a session the way the websocket endpoint does and returns its trade_decisions document"""
+    rng = random.Random(seed)
+    flow = PriceFlow(window_size=window_size, token_selection=TOKEN)
+    await flow.initialize_dict()
+    actions = []
+
+    def new_actor():
+        return WalletActor(FuturesWallet(leverage=20, token_selection=TOKEN), flow, NullOutbound(),
+                           send_wallet=False, send_acks=False)
+
+    # orders of the first wallet are recorded but a restart replaces it
+    actor, first_action = new_actor(), 0
+    for index in flow.timeline():
+        flow.advance(index)
+        if rng.random() < 0.05:
+            action = rng.choice(["long", "short", "close"])
+            await actor.submit(action, flow.current_index, flow.step)
+            actions.append({"action": action, "time": 0.0, "index": flow.current_index, "step": flow.step})
+        # the actor sometimes runs only after the next tick
+        if rng.random() < 0.7:
+            await actor.drain()
+        if flow.step == 100:
+            actor, first_action = new_actor(), len(actions)
+        if flow.step == len(flow.timeline()) - 50:
+            break
+
+    wallet = actor.wallet
+    await wallet.consume_queue(flow.upcoming_ranges)
+    await wallet.calculate_final_balance(flow.current_index, flow.step)
+    final_profit = (await wallet.get_wallet_state()).get("balance_total", 0.0)
+    if final_profit != 0.0:
+        final_profit = final_profit - 1000
+    return {
+        "fid": "1", "trade_env_id": f"env-{seed}", "actions": actions, "final_profit": final_profit,
+        "session": {
+            "token": wallet.klines.name, "window_size": flow.window_size, "total_rows": flow.total_rows,
+            "leverage": wallet.leverage, "capital": wallet.capital, "position_size": wallet.position_size,
+            "first_action": first_action, "final_index": flow.current_index, "final_step": flow.step,
+        },
+    }
+
+
+def test_replay_reproduces_live_final_profit():
+    for seed in range(5):
+        doc = asyncio.run(live_session(seed))
+        assert len(doc["actions"]) > doc["session"]["first_action"]
+        result = asyncio.run(replay_session(doc, spike_df_map[TOKEN]))
+        assert result["replayed"] == doc["final_profit"]
+
+
+def test_verify_flags_a_tampered_result():
+    docs = [asyncio.run(live_session(seed)) for seed in (11, 12)]
+    docs[1]["final_profit"] += 1.0
+    statuses = [result["status"] for result in verify_token_batch(TOKEN, docs, tolerance=1e-9)]
+    assert statuses == ["ok", "mismatch"]
@@ -0,0 +1,214 @@
+import sqlite3
+import asyncio
+from google.cloud import firestore
+from google.api_core.exceptions import AlreadyExists, NotFound
+from storage.firestore_client import FirestoreManager
+from storage.session_journal import SessionJournal
+
+
+class FakeSnapshot:
+    def __init__(self, ref, exists):
+        self.id = ref.id
+        self.reference = ref
+        self.exists = exists
+
+
+class FakeRef:
+    def __init__(self, collection, id):
+        self.key = (collection, id)
+        self.id = id
+        self.path = f"{collection}/{id}"
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+
+    def document(self, id):
+        return FakeRef(self.name, id)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def create(self, ref, data):
+        self.writes.append(("create", ref, data))
+
+    def update(self, ref, data):
+        self.writes.append(("update", ref, data))
+
+    async def commit(self):
+        self.db.before_commit()
+        # atomic, like Firestore: one existing document fails the whole batch
+        if any(op == "create" and ref.key in self.db.docs for op, ref, _ in self.writes):
+            raise AlreadyExists("document already exists")
+        if any(op == "update" and ref.key not in self.db.docs for op, ref, _ in self.writes):
+            raise NotFound("no document to update")
+        for op, ref, data in self.writes:
+            if op == "create":
+                self.db.docs[ref.key] = data
+            else:
+                doc = self.db.docs[ref.key]
+                for field, value in data.items():
+                    if isinstance(value, firestore.Increment):
+                        doc[field] = doc.get(field, 0) + value.value
+                    else:
+                        doc[field] = value
+        self.db.commits += 1
+
+
+class FakeAsyncClient:
+    """The slice of the async Firestore client save_game_session_results uses"""
+
+    def __init__(self):
+        self.docs = {}
+        self.commits = 0
+        self.concurrent_writes = []  # documents another writer stores right before the next commit
+
+    def collection(self, name):
+        return FakeCollection(name)
+
+    async def get_all(self, refs):
+        for ref in refs:
+            yield FakeSnapshot(ref, ref.key in self.docs)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def before_commit(self):
+        while self.concurrent_writes:
+            self.docs[("trade_decisions", self.concurrent_writes.pop())] = {}
+
+
+def fake_manager(fids=("1",)):
+    manager = FirestoreManager.__new__(FirestoreManager)
+    manager.db = FakeAsyncClient()
+    manager.db.docs.update({("users", fid): {} for fid in fids})
+    manager.users_collection = "users"
+    manager.trade_decisions_collection = "trade_decisions"
+    return manager
+
+
+def result(trade_env_id, fid="1", final_profit=10.0):
+    return {"fid": fid, "trade_env_id": trade_env_id, "actions": [], "final_pnl": final_profit / 10,
+            "final_profit": final_profit}
+
+
+def user(manager, fid="1"):
+    return manager.db.docs.get(("users", fid), {})
+
+
+def test_saving_twice_counts_once():
+    async def scenario():
+        manager = fake_manager()
+        first = await manager.save_game_session_results([result("a"), result("b")])
+        second = await manager.save_game_session_results([result("a"), result("b"), result("c")])
+        return manager, first, second
+
+    manager, first, second = asyncio.run(scenario())
+    assert first == ["a", "b"] and second == ["a", "b", "c"]
+    assert user(manager)["total_games"] == 3
+    assert user(manager)["total_profit"] == 30.0
+
+
+def test_document_written_after_the_read_is_not_counted_again():
+    async def scenario():
+        manager = fake_manager()
+        # another worker stores "a" between the read and the commit
+        manager.db.concurrent_writes.append("a")
+        stored = await manager.save_game_session_results([result("a"), result("b", final_profit=5.0)])
+        return manager, stored
+
+    manager, stored = asyncio.run(scenario())
+    assert stored == ["a", "b"]
+    assert user(manager)["total_games"] == 1
+    assert user(manager)["total_profit"] == 5.0
+
+
+def test_journal_flushes_each_result_once(tmp_path):
+    async def scenario():
+        manager = fake_manager()
+        path = str(tmp_path / "journal.sqlite3")
+        journal = SessionJournal(path)
+        for i in range(3):
+            await journal.record(**result(f"env-{i}"))
+        flushed = await journal.flush_once(manager)
+        # a second worker on the same file finds nothing left to send
+        other = SessionJournal(path)
+        again = await other.flush_once(manager)
+        metrics = await journal.metrics()
+        await journal.stop()
+        await other.stop()
+        return manager, flushed, again, metrics
+
+    manager, flushed, again, metrics = asyncio.run(scenario())
+    assert (flushed, again) == (3, 0)
+    assert metrics["pending"] == 0 and metrics["flushed"] == 3
+    assert user(manager)["total_games"] == 3
+
+
+def test_flusher_survives_journal_errors(tmp_path):
+    async def scenario():
+        manager = fake_manager()
+        journal = SessionJournal(str(tmp_path / "journal.sqlite3"), flush_interval=0.01)
+        claim = journal._claim
+        failures = [sqlite3.OperationalError("database is locked")]
+
+        def flaky_claim():
+            if failures:
+                raise failures.pop()
+            return claim()
+
+        journal._claim = flaky_claim
+        await journal.record(**result("a"))
+        await journal.start(manager)
+        for _ in range(200):
+            if journal.counters["flushed"]:
+                break
+            await asyncio.sleep(0.01)
+        metrics = await journal.metrics()
+        await journal.stop()
+        return metrics
+
+    metrics = asyncio.run(scenario())
+    assert metrics["loop_errors"] == 1
+    assert metrics["flushed"] == 1
+    assert metrics["alive"] is True
+
+
+def test_result_of_a_user_without_document_is_stored_without_totals(tmp_path):
+    async def scenario():
+        manager = fake_manager()
+        journal = SessionJournal(str(tmp_path / "journal.sqlite3"))
+        await journal.record(**result("a"))
+        await journal.record(**result("b", fid="gone"))
+        flushed = await journal.flush_once(manager)
+        metrics = await journal.metrics()
+        await journal.stop()
+        return manager, flushed, metrics
+
+    manager, flushed, metrics = asyncio.run(scenario())
+    assert flushed == 2 and metrics["pending"] == 0 and metrics["failed"] == 0
+    assert manager.db.docs[("trade_decisions", "b")]["fid"] == "gone"
+    assert ("users", "gone") not in manager.db.docs
+    assert user(manager)["total_games"] == 1
+
+
+def test_user_deleted_after_the_read_is_read_again():
+    async def scenario():
+        manager = fake_manager()
+        before_commit = manager.db.before_commit
+
+        def delete_user():
+            manager.db.docs.pop(("users", "1"), None)
+            before_commit()
+
+        manager.db.before_commit = delete_user
+        stored = await manager.save_game_session_results([result("a")])
+        return manager, stored
+
+    manager, stored = asyncio.run(scenario())
+    assert stored == ["a"] and ("trade_decisions", "a") in manager.db.docs
+    assert ("users", "1") not in manager.db.docs
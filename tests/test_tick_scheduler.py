@@ -0,0 +1,68 @@
+import json
+import asyncio
+import pytest
+import game.tick_scheduler as tick_scheduler
+from game.tick_scheduler import TickScheduler, tick_lag_metrics
+from game.price_flow import PriceFlow, PROTOCOL_DELTA
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.now += delay
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(tick_scheduler.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(tick_scheduler.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def test_late_ticks_are_coalesced_without_drift(clock):
+    async def scenario():
+        scheduler = TickScheduler(interval=1.0, label="test")
+        scheduler.start(0.5)
+        dues = [await scheduler.wait()]
+        clock.now += 2.5  # a slow send: the deadlines at 101.5 and 102.5 pass
+        dues.append(await scheduler.wait())
+        dues.append(await scheduler.wait())
+        return scheduler, dues
+
+    scheduler, dues = asyncio.run(scenario())
+    assert dues == [1, 2, 1]
+    # deadlines stay on the start + n * interval grid
+    assert clock.now == 103.5 and scheduler.next_deadline == 104.5
+    assert (scheduler.ticks, scheduler.coalesced) == (4, 1)
+    assert any(s["label"] == "test" for s in tick_lag_metrics()["sessions"])
+
+
+def test_price_flow_sends_due_ticks_in_one_frame():
+    flow = PriceFlow(window_size=30, token_selection="test-session-0", protocol=PROTOCOL_DELTA)
+    dues = iter([1, 3, 1 << 20])
+
+    async def wait():
+        return next(dues)
+
+    flow.scheduler.wait = wait
+    frames = []
+
+    async def send(text):
+        frames.append(json.loads(text))
+
+    async def scenario():
+        await flow.initialize_dict()
+        await flow.run(send)
+
+    asyncio.run(scenario())
+    timeline = flow.timeline()
+    assert frames[0]["row"] == flow.klines.row(timeline[0])
+    assert frames[1]["rows"] == [flow.klines.row(i) for i in timeline[1:4]]
+    assert [f["seq"] for f in frames] == [1, 2, 3]
+    assert (flow.step, flow.current_index) == (len(timeline) - 1, timeline[-1])
@@ -0,0 +1,65 @@
+import json
+import numpy as np
+from game.tick_table import TickTable, ColumnarTickTable, get_tick_table, ENCODING_ROWS, ENCODING_COLUMNAR
+from game.price_flow import negotiate_encoding, MAX_PRICE_SCALE
+
+
+def test_rows_are_the_frame_rows(frame):
+    table = TickTable(frame)
+    assert len(table) == len(frame)
+    assert [json.loads(table.rows[i]) for i in (0, 17, len(frame) - 1)] == \
+        [frame.row(i) for i in (0, 17, len(frame) - 1)]
+
+
+def test_legacy_messages(frame):
+    table = TickTable(frame)
+    indices = list(range(40, 70))
+    window = [frame.row(i) for i in indices]
+    assert json.loads(table.initial_message(indices)) == {"count": 30, "window": window}
+    assert json.loads(table.prices_message(69, indices)) == {"type": "prices", "count": 70, "window": window}
+
+
+def test_one_table_per_session(frame):
+    table = get_tick_table(frame)
+    assert get_tick_table(frame) is table
+    assert table.nbytes > sum(len(row) for row in table.rows)
+
+
+def test_delta_messages(frame):
+    table = TickTable(frame)
+    indices = list(range(40, 70))
+    assert json.loads(table.snapshot_message(indices, 0)) == \
+        {"type": "snapshot", "v": 2, "seq": 0, "count": 30, "window": [frame.row(i) for i in indices]}
+    assert json.loads(table.delta_message(70, 1)) == {"type": "tick", "seq": 1, "count": 71, "row": frame.row(70)}
+    assert json.loads(table.coalesced_delta_message([71, 72], 2)) == \
+        {"type": "tick", "seq": 2, "count": 73, "rows": [frame.row(71), frame.row(72)]}
+
+
+def test_columnar_messages(frame):
+    table = ColumnarTickTable(frame, price_scale=2)
+    indices = list(range(40, 43))
+    snapshot = json.loads(table.snapshot_message(indices, 0))
+    assert (snapshot["encoding"], snapshot["scale"], snapshot["count"]) == ("columnar", 2, 3)
+    assert snapshot["fields"] == table.fields and "close" in table.fields
+    close = snapshot["columns"][table.fields.index("close")]
+    # fixed-point prices
+    assert close == [round(frame["close"][i] * 100) for i in indices]
+    times = snapshot["columns"][table.fields.index("time")]
+    assert times == [int(t) for t in frame["time"][indices].astype("datetime64[ms]").astype(np.int64)]
+
+    tick = json.loads(table.delta_message(43, 1))
+    assert tick == {"type": "tick", "seq": 1, "count": 44, "row": [column[43] for column in table.columns]}
+    coalesced = json.loads(table.coalesced_delta_message([44, 45], 2))
+    assert coalesced["count"] == 46 and coalesced["columns"] == [column[44:46] for column in table.columns]
+
+
+def test_unscaled_columnar_prices_are_the_floats(frame):
+    table = ColumnarTickTable(frame)
+    assert table.columns[table.fields.index("close")] == frame["close"].tolist()
+
+
+def test_encoding_negotiation():
+    assert negotiate_encoding("rows", 4) == (ENCODING_ROWS, None)
+    assert negotiate_encoding("columnar") == (ENCODING_COLUMNAR, None)
+    assert negotiate_encoding("columnar", 99) == (ENCODING_COLUMNAR, MAX_PRICE_SCALE)
+    assert negotiate_encoding("columnar", "x") == (ENCODING_COLUMNAR, None)
@@ -0,0 +1,42 @@
+import numpy as np
+from game.tick_window import TickWindow
+
+
+def test_keeps_the_last_rows_oldest_first():
+    window = TickWindow(4)
+    for row in range(6):
+        window.push(row)
+    assert len(window) == 4 and window.last_row == 5
+    assert window.indices().tolist() == [2, 3, 4, 5]
+    assert window.indices(2).tolist() == [4, 5]
+    assert window.indices(10).tolist() == [2, 3, 4, 5]
+
+
+def test_indices_are_a_view_unless_the_ring_wraps():
+    window = TickWindow(4)
+    window.fill(0, 3)
+    assert np.shares_memory(window.indices(), window._rows)
+    window.push(3)
+    window.push(4)
+    assert window.indices().tolist() == [1, 2, 3, 4]
+    assert window.indices(1).tolist() == [4]
+
+
+def test_fill_resets_to_the_last_rows_of_a_range():
+    window = TickWindow(3)
+    window.push(99)
+    window.fill(10, 20)
+    assert window.indices().tolist() == [17, 18, 19]
+
+
+def test_column_slices_consecutive_rows_without_copying(frame):
+    window = TickWindow(5)
+    window.fill(0, 5)
+    close = window.column(frame, "close")
+    assert np.shares_memory(close, frame["close"])
+    assert window.contiguous_range() == (0, 5)
+
+    # the replay wraps back to the first row: gathered, not sliced
+    window.push(0)
+    assert window.contiguous_range() is None
+    assert window.column(frame, "close").tolist() == frame["close"][[1, 2, 3, 4, 0]].tolist()
@@ -0,0 +1,88 @@
+import asyncio
+from game.price_flow import timeline_ranges
+from game.wallet import FuturesWallet, get_wallet_prices
+from tests.conftest import crash_frame
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_consume_queue_runs_orders_in_arrival_order(frame):
+    async def scenario():
+        wallet = FuturesWallet(leverage=5, klines=frame)
+        for action, index in [("long", 10), ("short", 11), ("long", 12), ("close", 13), ("close", 14),
+                              ("short", 15), ("long", 16)]:
+            await wallet.push_order(action, index)
+        return wallet, await wallet.consume_queue()
+
+    wallet, results = run(scenario())
+    assert results == [("long", 10, True), ("short", 11, False), ("long", 12, True), ("close", 13, True),
+                       ("close", 14, False), ("short", 15, True), ("long", 16, False)]
+    assert wallet.direction == "short"
+    assert wallet.average_price == wallet.prices.close[15]
+
+
+def test_orders_execute_at_their_recorded_index(frame):
+    async def scenario():
+        wallet = FuturesWallet(leverage=5, klines=frame)
+        await wallet.push_order("long", 20)
+        await wallet.push_order("long", 40)
+        await wallet.consume_queue()
+        return wallet
+
+    wallet = run(scenario())
+    assert wallet.num_pos == 2
+    assert wallet.average_price == (wallet.prices.close[20] + wallet.prices.close[40]) / 2
+    assert wallet.balance_free == 800.0
+
+
+def test_rejected_when_free_balance_is_short(frame):
+    async def scenario():
+        wallet = FuturesWallet(leverage=5, capital=250.0, klines=frame)
+        for index in (1, 2, 3):
+            await wallet.push_order("long", index)
+        return await wallet.consume_queue()
+
+    assert [accepted for _, _, accepted in run(scenario())] == [True, True, False]
+
+
+def test_due_liquidation_happens_before_the_next_order():
+    window_size, frame = 5, crash_frame()
+    total_rows = len(frame)
+
+    def ranges(step, index=None):
+        return timeline_ranges(step, 8 if index is None else index, window_size, total_rows)
+
+    async def scenario():
+        wallet = FuturesWallet(leverage=10, klines=frame)
+        # long at row 8 (step 3) is liquidated by the crash at row 10 (step 5)
+        await wallet.push_order("long", 8, 3)
+        first = await wallet.consume_queue(ranges)
+        scheduled = wallet.liquidation
+        # the close arrives at step 6, after the liquidation tick
+        await wallet.push_order("close", 11, 6)
+        second = await wallet.consume_queue(ranges)
+        return wallet, first, scheduled, second
+
+    wallet, first, scheduled, second = run(scenario())
+    assert first == [("long", 8, True)]
+    assert scheduled == (5, 10)
+    # nothing left to close: the margin was lost at the liquidation
+    assert second == [("close", 11, False)]
+    assert wallet.direction is None
+    assert wallet.balance_total == 900.0
+
+
+def test_wallet_prices_are_shared_python_floats(frame):
+    prices = get_wallet_prices(frame)
+    assert get_wallet_prices(frame) is prices
+    assert len(prices) == len(frame) and prices.nbytes == 3 * 8 * len(frame)
+    assert list(prices.close) == frame["close"].astype(float).tolist()
+    assert type(prices.low[3]) is float and prices.high[3] == float(frame["high"][3])
+
+    wallet = FuturesWallet(leverage=5, klines=frame)
+    assert wallet.prices is prices
+    run(wallet.push_order("long", 20))
+    run(wallet.consume_queue())
+    assert type(wallet.average_price) is float and type(wallet.balance_total) is float
@@ -0,0 +1,102 @@
+import json
+import asyncio
+from game.price_flow import PriceFlow, PROTOCOL_DELTA
+from game.wallet import FuturesWallet
+from game.wallet_actor import WalletActor
+from game.framing import JSON_CODEC
+
+TOKEN = "test-session-0"
+
+
+class RecordingOutbound:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, data, kind=None):
+        self.sent.append(data)
+        return True
+
+
+def frames(sent, kind):
+    return [frame for frame in sent if frame["type"] == kind]
+
+
+def test_ticks_wake_the_actor_instead_of_a_polling_loop():
+    async def scenario():
+        flow = PriceFlow(window_size=30, token_selection=TOKEN, protocol=PROTOCOL_DELTA)
+        await flow.initialize_dict()
+        outbound = RecordingOutbound()
+        wallet = FuturesWallet(leverage=5, token_selection=TOKEN, klines=flow.klines)
+        actor = WalletActor(wallet, flow, outbound)
+        task = asyncio.create_task(actor.run())
+        await asyncio.sleep(0)
+        assert actor.wake in flow.tick_listeners
+        first = list(outbound.sent)
+
+        # no tick, no order: the actor sleeps
+        await asyncio.sleep(0.05)
+        assert outbound.sent == first
+
+        flow.advance(30)
+        await actor.submit("long", 30, flow.step)
+        await asyncio.sleep(0)
+        opened = list(outbound.sent)
+        flow.advance(31)
+        await asyncio.sleep(0)
+        task.cancel()
+        await task
+        return flow, actor, first, opened, outbound
+
+    flow, actor, first, opened, outbound = asyncio.run(scenario())
+    assert [frame["type"] for frame in first] == ["wallet"]
+    acks = frames(outbound.sent, "ack")
+    assert [(ack["action"], ack["index"], ack["ok"]) for ack in acks] == [("long", 30, True)]
+    assert len(frames(outbound.sent, "liquidation")) == 1
+    assert len(frames(outbound.sent, "wallet")) == 3 and frames(opened, "wallet")[-1]["wallet"]["direction"] == "long"
+    # the last wallet frame is marked at the tick that woke the actor
+    assert outbound.sent[-1]["wallet"] == actor.last_state
+    assert actor.wake not in flow.tick_listeners
+
+
+def test_actor_without_tick_listening_runs_only_for_orders():
+    async def scenario():
+        flow = PriceFlow(window_size=30, token_selection=TOKEN)
+        await flow.initialize_dict()
+        outbound = RecordingOutbound()
+        wallet = FuturesWallet(leverage=5, token_selection=TOKEN, klines=flow.klines)
+        actor = WalletActor(wallet, flow, outbound, listen_ticks=False, send_acks=False)
+        task = asyncio.create_task(actor.run())
+        await asyncio.sleep(0)
+        flow.advance(30)
+        await asyncio.sleep(0)
+        before = len(outbound.sent)
+        await actor.submit("short", 30, flow.step)
+        await asyncio.sleep(0)
+        task.cancel()
+        await task
+        return flow, outbound, before
+
+    flow, outbound, before = asyncio.run(scenario())
+    assert not flow.tick_listeners
+    assert before == 1 and not frames(outbound.sent, "ack")
+    assert outbound.sent[-1]["wallet"]["direction"] == "short"
+
+
+def test_combined_frames_carry_the_wallet_of_their_tick():
+    async def scenario():
+        flow = PriceFlow(window_size=30, token_selection=TOKEN, protocol=PROTOCOL_DELTA)
+        await flow.initialize_dict()
+        outbound = RecordingOutbound()
+        wallet = FuturesWallet(leverage=5, token_selection=TOKEN, klines=flow.klines)
+        # as in combined mode: the price stream drains the actor, no wallet frames of its own
+        actor = WalletActor(wallet, flow, outbound, listen_ticks=False, send_wallet=False, send_acks=False)
+        await actor.submit("long", 30, 0)
+        flow.advance(30)
+        state = await actor.drain()
+        combined = JSON_CODEC.with_field(flow.tick_message([30]), "wallet", JSON_CODEC.encode(state))
+        return flow, outbound, json.loads(combined)
+
+    flow, outbound, combined = asyncio.run(scenario())
+    assert combined["type"] == "tick" and combined["row"] == flow.klines.row(30)
+    assert combined["wallet"]["direction"] == "long"
+    assert not frames(outbound.sent, "wallet")
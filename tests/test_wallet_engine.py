@@ -0,0 +1,108 @@
+import random
+import asyncio
+from game.price_flow import PriceFlow
+from game.wallet import FuturesWallet
+from game.wallet_engine import WalletEngine
+
+TOKENS = ["test-session-0", "test-session-1"]
+
+
+async def noop(balance, liquidated):
+    pass
+
+
+async def open_session(rng, token, engine=None, flow=None):
+    flow = flow or PriceFlow(window_size=30, token_selection=token)
+    await flow.initialize_dict()
+    flow.advance(rng.randrange(30, flow.total_rows))
+    wallet = FuturesWallet(token_selection=token, leverage=rng.choice([10, 50, 100]))
+    if rng.random() < 0.8:
+        await (wallet.add_long(flow.current_index) if rng.random() < 0.5 else wallet.add_short(flow.current_index))
+        wallet.schedule_liquidation(flow.upcoming_ranges())
+    row = engine.register(wallet, flow, noop) if engine is not None else None
+    return wallet, flow, row
+
+
+def test_mark_matches_calculate_final_balance():
+    async def scenario():
+        rng = random.Random(7)
+        engine = WalletEngine(interval=3600, capacity=4)
+        sessions = [await open_session(rng, rng.choice(TOKENS), engine) for _ in range(40)]
+        checked = liquidations = 0
+        for _ in range(60):
+            for _, flow, _ in sessions:
+                flow.advance(flow.current_index + 1 if flow.current_index + 1 < flow.total_rows else 30)
+            rows, balances, liquidated = engine.mark()
+            marks = dict(zip(rows.tolist(), zip(balances.tolist(), liquidated.tolist())))
+            assert set(marks) == {row for _, _, row in sessions}
+            for wallet, flow, row in sessions:
+                balance, liq = marks[row]
+                in_position = wallet.direction is not None
+                await wallet.calculate_final_balance(flow.current_index, flow.step)
+                if liq:
+                    assert in_position and wallet.direction is None
+                    liquidations += 1
+                else:
+                    assert balance == wallet.balance_total
+                engine.sync(row, wallet)
+                checked += 1
+        engine._task.cancel()
+        return checked, liquidations
+
+    checked, liquidations = asyncio.run(scenario())
+    assert checked == 40 * 60
+    assert liquidations > 0
+
+
+def test_only_moved_rows_are_dispatched():
+    async def scenario():
+        rng = random.Random(3)
+        engine = WalletEngine(interval=3600)
+        (_, moving, row), (_, idle, _) = [await open_session(rng, TOKENS[0], engine) for _ in range(2)]
+        engine.mark()
+        moving.advance(moving.current_index + 1)
+        rows, _, _ = engine.mark()
+        engine._task.cancel()
+        return rows.tolist(), row
+
+    rows, row = asyncio.run(scenario())
+    assert rows == [row]
+
+
+def test_sessions_of_one_flow_share_a_slot():
+    async def scenario():
+        rng = random.Random(5)
+        engine = WalletEngine(interval=3600)
+        flow = PriceFlow(window_size=30, token_selection=TOKENS[0])
+        sessions = [await open_session(rng, TOKENS[0], engine, flow) for _ in range(3)]
+        shared = {int(engine.flow_row[row]) for _, _, row in sessions}
+        slot_after_register = flow.engine_slot
+        for _, _, row in sessions:
+            engine.unregister(row)
+        engine._task.cancel()
+        return shared, slot_after_register, flow.engine_slot, engine.metrics()
+
+    shared, slot, released, metrics = asyncio.run(scenario())
+    assert len(shared) == 1 and slot[1] in shared
+    assert released is None
+    assert metrics["flows"] == 0 and metrics["sessions"] == 0
+
+
+def test_token_buffer_grows_and_drops_unused_tokens():
+    async def scenario():
+        rng = random.Random(9)
+        engine = WalletEngine(interval=3600, close_capacity=16)
+        _, _, first = await open_session(rng, TOKENS[0], engine)
+        engine.unregister(first)
+        # does not fit: the buffer doubles and the token without sessions is dropped
+        wallet, flow, row = await open_session(rng, TOKENS[1], engine)
+        engine._task.cancel()
+        return engine, wallet, flow, row
+
+    engine, wallet, flow, row = asyncio.run(scenario())
+    rows = len(wallet.prices)
+    assert list(engine.token_ids) == [TOKENS[1]]
+    assert engine.close_size == rows
+    assert len(engine.close) == 16 << (rows - 1).bit_length() - 4
+    token = engine.token_ids[TOKENS[1]]
+    assert engine.close[engine.offsets[token]:engine.offsets[token] + rows].tolist() == wallet.prices.close.tolist()
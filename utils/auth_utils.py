@@ -1,45 +1,199 @@
+import os
 import json
+import time
 import base64
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
+from typing import Iterable, List
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 from cryptography.hazmat.backends import default_backend
+from cryptography.exceptions import InvalidTag
+from utils.metrics import LatencyRecorder
+
+
+# Must match the Node.js scryptSync parameters used to encrypt the tokens
+SCRYPT_SALT = b'salt'
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+def derive_key(secret: str) -> bytes:
+    """Derive the AES-256 key from a secret using Scrypt (slow, uncached)"""
+    kdf = Scrypt(
+        salt=SCRYPT_SALT,
+        length=32,
+        n=SCRYPT_N,
+        r=SCRYPT_R,
+        p=SCRYPT_P,
+        backend=default_backend()
+    )
+    return kdf.derive(secret.encode())
+
+
+@lru_cache(maxsize=8)
+def get_cipher(secret: str) -> AESGCM:
+    """
+    Returns a prebuilt AESGCM instance for the secret.
+    The Scrypt derivation runs once per secret per process.
+    """
+    return AESGCM(derive_key(secret))
+
+
+def warm_key_cache(secrets: Iterable[str]):
+    """Derive the keys for all active secrets up front (call at startup)"""
+    for secret in secrets:
+        if secret:
+            get_cipher(secret)
+
+
+def _split_token(encrypted_data: str):
+    # Split the encrypted data: iv:authTag:encrypted
+    parts = encrypted_data.split(':')
+    if len(parts) != 3:
+        raise ValueError("Invalid encrypted data format")
+
+    iv_hex, auth_tag_hex, encrypted_hex = parts
+
+    # Convert from hex
+    iv = bytes.fromhex(iv_hex)
+    auth_tag = bytes.fromhex(auth_tag_hex)
+    encrypted = bytes.fromhex(encrypted_hex)
+
+    # Combine encrypted data with auth tag for decryption
+    return iv, encrypted + auth_tag
 
 
 # use salt
 def decrypt(encrypted_data: str, secret: str) -> str:
     """Decrypt AES-256-GCM encrypted data"""
     try:
-        # Split the encrypted data: iv:authTag:encrypted
-        parts = encrypted_data.split(':')
-        if len(parts) != 3:
-            raise ValueError("Invalid encrypted data format")
-
-        iv_hex, auth_tag_hex, encrypted_hex = parts
-
-        # Convert from hex
-        iv = bytes.fromhex(iv_hex)
-        auth_tag = bytes.fromhex(auth_tag_hex)
-        encrypted = bytes.fromhex(encrypted_hex)
-
-        # Derive key using Scrypt (matching Node.js scryptSync)
-        kdf = Scrypt(
-            salt=b'salt',  # Must match Node.js salt
-            length=32,
-            n=2**14,
-            r=8,
-            p=1,
-            backend=default_backend()
-        )
-        key = kdf.derive(secret.encode())
-
-        # Decrypt using AES-256-GCM
-        aesgcm = AESGCM(key)
-        # Combine encrypted data with auth tag for decryption
-        ciphertext = encrypted + auth_tag
-        decrypted = aesgcm.decrypt(iv, ciphertext, None)
-
+        iv, ciphertext = _split_token(encrypted_data)
+        decrypted = get_cipher(secret).decrypt(iv, ciphertext, None)
         return decrypted.decode('utf8')
     except Exception as e:
         raise ValueError(f"Decryption failed: {str(e)}")
 
 
+def decrypt_any(encrypted_data: str, secrets: Iterable[str]) -> str:
+    """
+    Decrypt with the first active secret that authenticates the token.
+    Secrets are tried in order, so the current secret should come first
+    and the ones being rotated out after it.
+    """
+    try:
+        iv, ciphertext = _split_token(encrypted_data)
+    except Exception as e:
+        raise ValueError(f"Decryption failed: {str(e)}")
+
+    for secret in secrets:
+        if not secret:
+            continue
+        try:
+            decrypted = get_cipher(secret).decrypt(iv, ciphertext, None)
+        except InvalidTag:
+            continue
+        return decrypted.decode('utf8')
+
+    raise ValueError("Decryption failed: no active secret matches the token")
+
+
+def encrypt(plaintext: str, secret: str) -> str:
+    """Encrypt data in the iv:authTag:encrypted format used by the frontend"""
+    iv = os.urandom(12)
+    sealed = get_cipher(secret).encrypt(iv, plaintext.encode('utf8'), None)
+    encrypted, auth_tag = sealed[:-16], sealed[-16:]
+    return f"{iv.hex()}:{auth_tag.hex()}:{encrypted.hex()}"
+
+
+def _decrypt_timed(encrypted_data: str, secrets: List[str]):
+    """Pool entry point: returns the plaintext plus when decoding started/ended"""
+    started = time.monotonic()
+    decrypted = decrypt_any(encrypted_data, secrets)
+    return decrypted, started, time.monotonic()
+
+
+class AuthPoolSaturated(Exception):
+    """Raised when the crypto pool already holds max_pending handshakes"""
+
+
+class AuthDecoder:
+    """
+    Runs token decryption on a bounded thread or process pool so the
+    event loop keeps serving other sessions during a connection storm.
+
+    Handshakes beyond max_pending (queued + running) are rejected right away
+    with AuthPoolSaturated instead of waiting in line.
+    """
+
+    def __init__(self, secrets: Iterable[str], kind: str = "thread",
+                 workers: int = 2, max_pending: int = 32):
+        self.secrets = [s for s in secrets if s]
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.failed = 0
+        self.queue_wait = LatencyRecorder()
+        self.decode_time = LatencyRecorder()
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=warm_key_cache,
+                    initargs=(self.secrets,)
+                )
+            elif self.kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="auth")
+                # first job of the pool: the Scrypt derivations never run on the event loop
+                self._executor.submit(warm_key_cache, self.secrets)
+            else:
+                raise ValueError(f"Unknown auth pool kind: {self.kind}")
+        return self._executor
+
+    async def decrypt(self, encrypted_data: str) -> str:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise AuthPoolSaturated(f"auth pool saturated ({self.pending} pending)")
+
+        self.pending += 1
+        submitted = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            decrypted, started, finished = await loop.run_in_executor(
+                self._get_executor(), _decrypt_timed, encrypted_data, self.secrets
+            )
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+
+        self.queue_wait.record(max(0.0, started - submitted))
+        self.decode_time.record(finished - started)
+        return decrypted
+
+    def metrics(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "queue_wait": self.queue_wait.snapshot(),
+            "decode_time": self.decode_time.snapshot(),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,77 @@
+"""
+JSON serialization shared by game_app and app: WebSocket frames, pre-encoded
+tick rows and HTTP responses all go through dumps/dumps_bytes.
+
+JSON_SERIALIZER picks orjson (default, when installed) or the stdlib json.
+Both write compact JSON and handle the values our Firestore documents hold:
+datetimes (including Firestore's DatetimeWithNanoseconds) as ISO 8601,
+unresolved SERVER_TIMESTAMP sentinels as null, and numpy scalars. Anything
+else (DocumentReference, GeoPoint, bytes, ...) goes through FastAPI's
+jsonable_encoder, as it did before routes returned FastJSONResponse directly.
+
+NaN and infinities: orjson writes them as null, the stdlib as the non-standard
+NaN/Infinity tokens.
+"""
+import json
+from datetime import date, datetime
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+from configs.config import JSON_SERIALIZER
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from google.cloud.firestore_v1.transforms import Sentinel
+except ImportError:
+    Sentinel = None
+
+USE_ORJSON = orjson is not None and JSON_SERIALIZER == "orjson"
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if Sentinel is not None and isinstance(obj, Sentinel):  # firestore.SERVER_TIMESTAMP not yet resolved
+        return None
+    try:
+        return jsonable_encoder(obj)
+    except ValueError as e:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable") from e
+
+
+if USE_ORJSON:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(data) -> bytes:
+        return orjson.dumps(data, default=_default, option=_ORJSON_OPTIONS)
+
+    def dumps(data) -> str:
+        return orjson.dumps(data, default=_default, option=_ORJSON_OPTIONS).decode()
+else:
+    def dumps(data) -> str:
+        return json.dumps(data, default=_default, separators=(",", ":"), ensure_ascii=False)
+
+    def dumps_bytes(data) -> bytes:
+        return dumps(data).encode()
+
+
+def serializer_name() -> str:
+    return "orjson" if USE_ORJSON else "json"
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with dumps_bytes. Used as default_response_class; routes
+    that return it directly also skip FastAPI's jsonable_encoder pass.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps_bytes(content)
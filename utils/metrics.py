@@ -0,0 +1,38 @@
+import os
+import time
+from collections import deque
+from typing import Dict, Iterable
+
+
+class LatencyRecorder:
+    """Keeps the most recent samples (seconds) and reports percentiles in ms"""
+
+    def __init__(self, max_samples: int = 2048):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def percentiles(self, points: Iterable[int] = (50, 90, 99)) -> Dict[str, float]:
+        if not self.samples:
+            return {f"p{p}": 0.0 for p in points}
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return {f"p{p}": round(ordered[min(last, int(last * p / 100))] * 1000, 3) for p in points}
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(max(self.samples) * 1000, 3) if self.samples else 0.0,
+            **self.percentiles(),
+        }
+
+
+def worker_info() -> Dict[str, float]:
+    """Identifies the gunicorn worker a metrics snapshot came from"""
+    return {"pid": os.getpid(), "time": time.time()}